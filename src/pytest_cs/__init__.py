@@ -15,6 +15,8 @@ from .docker import (
     ContainerWaiterGenerator,
     Status,
     container,
+    container_group,
+    container_name_prefix,
     crowdsec,
     crowdsec_version,
     docker_client,
@@ -30,9 +32,27 @@ from .k8s import (
 from .misc import (
     project_repo,
 )
+from .mocklapi import (
+    MockLapi,
+    mock_lapi,
+)
 from .plugin import (
     api_key_factory,
     certs_dir,
+    pytest_addoption,
+    pytest_collection_finish,
+    pytest_configure,
+    pytest_fixture_setup,
+    pytest_runtest_logreport,
+    pytest_runtest_makereport,
+    pytest_sessionfinish,
+    pytest_terminal_summary,
+)
+from .pool import (
+    crowdsec_pool,
+)
+from .reaper import (
+    container_reaper,
 )
 from .rootcheck import (
     must_be_nonroot,
@@ -46,12 +66,16 @@ from .rpm import (
     rpm_package_version,
     skip_unless_rpm,
 )
+from .teardown import (
+    container_teardown,
+)
 from .waiters import (
     WaiterGenerator,
 )
 
 __all__ = [
     "ContainerWaiterGenerator",
+    "MockLapi",
     "Status",
     "WaiterGenerator",
     "api_key_factory",
@@ -60,7 +84,12 @@ __all__ = [
     "certs_dir",
     "compose",
     "container",
+    "container_group",
+    "container_name_prefix",
+    "container_reaper",
+    "container_teardown",
     "crowdsec",
+    "crowdsec_pool",
     "crowdsec_version",
     "deb_package",
     "deb_package_arch",
@@ -72,10 +101,19 @@ __all__ = [
     "flavor",
     "helm",
     "log_waiters",
+    "mock_lapi",
     "must_be_nonroot",
     "must_be_root",
     "port_waiters",
     "project_repo",
+    "pytest_addoption",
+    "pytest_collection_finish",
+    "pytest_configure",
+    "pytest_fixture_setup",
+    "pytest_runtest_logreport",
+    "pytest_runtest_makereport",
+    "pytest_sessionfinish",
+    "pytest_terminal_summary",
     "rpm_package",
     "rpm_package_name",
     "rpm_package_number",
@@ -9,27 +9,47 @@ import psutil
 import pytest
 import yaml
 
-from .waiters import WaiterGenerator
+from .lib.inotify import watch_file
+from .lib.match import OrderedMatcher
+from .lib.tail import FileTail
+from .mocklapi import MockLapi
+from .reports import attach_to_report
+from .resources import ResourceSampler
+from .waiters import Schedule, WaiterGenerator
 
 # How long to wait for a child process to spawn
 CHILD_SPAWN_TIMEOUT = 2
 
 
 class ProcessWaiterGenerator(WaiterGenerator["BouncerProc"]):
-    def __init__(self, proc: "BouncerProc") -> None:
+    def __init__(self, proc: "BouncerProc", timeout: float | None = None, schedule: Schedule | None = None) -> None:
         self.proc: Final = proc
-        super().__init__()
+        super().__init__(timeout, schedule=schedule)
 
     @override
     def context(self) -> "BouncerProc":
         return self.proc
 
+    @override
+    def sleep(self, delay: float) -> None:
+        self.proc.wait_for_output(delay)
+
 
 class BouncerProc:
-    def __init__(self, popen: subprocess.Popen[str], outpath: pathlib.Path) -> None:
+    def __init__(
+        self, popen: subprocess.Popen[str], outpath: pathlib.Path, sample_interval: float | None = None
+    ) -> None:
         self.popen: Final = popen
         self.proc: Final = psutil.Process(popen.pid)
         self.outpath: Final = outpath
+        # resource usage of the process tree, if requested
+        self.resources: Final = ResourceSampler(self.proc, sample_interval) if sample_interval else None
+        if self.resources is not None:
+            self.resources.start()
+        # the output is read incrementally, and with inotify
+        # the waiters wake up as soon as it's written to
+        self.output: Final = FileTail(outpath)
+        self._watcher: Final = watch_file(outpath)
 
     # wait for at least one child process to spawn
     # TODO: add a name to look for?
@@ -51,22 +71,65 @@ class BouncerProc:
         return self.proc.children()
 
     def get_output(self) -> pytest.LineMatcher:
-        return pytest.LineMatcher(self.outpath.read_text().splitlines())
+        _ = self.output.read()
+        return pytest.LineMatcher(self.output.all_lines())
+
+    # sleep until the output file is written to, or the delay expires
+    def wait_for_output(self, delay: float) -> None:
+        if self._watcher is None:
+            time.sleep(delay)
+            return
+        _ = self._watcher.wait(delay)
 
     # TODO: add timeout?
     def wait_for_lines_fnmatch(self, s: list[str]) -> None:
-        for waiter in ProcessWaiterGenerator(self):
-            with waiter as p:
-                p.get_output().fnmatch_lines(s)
+        matcher = OrderedMatcher(s)
+        cursor = 0  # lines already fed to the matcher
+        resets = self.output.resets
+        try:
+            for waiter in ProcessWaiterGenerator(self):
+                with waiter as p:
+                    # an incomplete last line is fed when it's complete
+                    _ = p.output.read()
+                    if p.output.resets != resets:
+                        # the file was truncated, what matched before is gone
+                        resets = p.output.resets
+                        matcher.reset()
+                        cursor = 0
+                    _ = matcher.feed(p.output.lines[cursor:])
+                    cursor = len(p.output.lines)
+                    assert matcher.done, f"line not found: {matcher.pending}"
+        except AssertionError:
+            # scan everything once more, for a detailed report
+            matcher.report(self.output.all_lines())
+
+    def close(self) -> None:
+        if self.resources is not None:
+            self.resources.stop()
+        if self._watcher is not None:
+            self._watcher.close()
 
 
 # The bouncer to use is provided by the fixture bouncer_under_test.
 # This won't work with different bouncers in the same test
 # scenario, but it's unlikely that we'll need that
+#
+# With sample_interval (seconds), the resource usage of the bouncer and its
+# children is recorded in proc.resources and attached to the test report:
+#
+#   with bouncer(config, sample_interval=0.2) as proc:
+#       ...
+#   proc.resources.assert_peak_rss_below(100 * 2**20)
+#
+# With lapi (from the mock_lapi fixture), the bouncer is configured to
+# connect to it instead of a crowdsec container.
 @pytest.fixture(scope="session")
 def bouncer(bouncer_binary: str, tmp_path_factory: pytest.TempPathFactory):
     @contextlib.contextmanager
-    def closure(config, config_local=None):
+    def closure(config, config_local=None, sample_interval: float | None = None, lapi: MockLapi | None = None):
+        if lapi is not None:
+            config = {**config, **lapi.bouncer_config()}
+
         # create joint stout/stderr file
         outdir = tmp_path_factory.mktemp("output")
 
@@ -87,11 +150,15 @@ def bouncer(bouncer_binary: str, tmp_path_factory: pytest.TempPathFactory):
                 text=True,
                 encoding="utf-8",
             )
+        proc = BouncerProc(cb, outpath, sample_interval)
         try:
-            yield BouncerProc(cb, outpath)
+            yield proc
         finally:
+            proc.close()
             cb.kill()
             _ = cb.wait()
+            if proc.resources is not None:
+                attach_to_report("bouncer_resources", proc.resources.to_dict())
 
     return closure
 
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+from collections.abc import Callable, Iterable, Sequence
+from typing import Final
+
+from .helpers import cache_dir, env_int
+from .parallel import file_lock, user_lock_path
+
+# Cache of package builds, shared by the sessions of the current user.
+#
+# The key is a hash of what goes into the build: the git tree of the repository,
+# the content of the files that differ from it (modified or untracked), the
+# packaging directory and the versions of the tools. When it matches, the
+# artifacts of the previous build are copied back instead of building again.
+#
+#   cache = BuildCache("deb")
+#   key = source_key(repo, ["debian"], [["dpkg-buildpackage", "--version"]])
+#   artifacts = cache.get(key, dest, build)  # build() returns the artifacts
+#
+# The least recently used builds are removed when the cache is larger than
+# CROWDSEC_TEST_BUILD_CACHE_SIZE (MiB, default 2048). Set it to 0 to disable.
+
+DEFAULT_SIZE_MB = 2048
+
+
+def _git(repo: pathlib.Path, *args: str) -> bytes:
+    return subprocess.check_output(["git", *args], cwd=repo)
+
+
+# A directory (i.e. a submodule) is hashed with all its files, except .git
+def _file_digest(path: pathlib.Path) -> bytes:
+    if path.is_dir():
+        h = hashlib.sha256()
+        for child in sorted(path.rglob("*")):
+            rel = child.relative_to(path)
+            if rel.parts[0] == ".git" or not child.is_file():
+                continue
+            h.update(b"\0file\0" + os.fsencode(rel) + b"\0" + _file_digest(child))
+        return h.digest()
+    try:
+        with path.open("rb") as f:
+            return hashlib.file_digest(f, "sha256").digest()
+    except FileNotFoundError:
+        return b"deleted"
+
+
+def tool_version(cmd: Sequence[str]) -> str:
+    try:
+        out = subprocess.run(cmd, capture_output=True, encoding="utf-8", check=False).stdout
+    except FileNotFoundError:
+        return "missing"
+    return out.strip().splitlines()[0] if out.strip() else ""
+
+
+def source_key(
+    repo: pathlib.Path,
+    paths: Iterable[str] = (),
+    tools: Iterable[Sequence[str]] = (),
+    extra: Iterable[str] = (),
+    *,
+    dirty: bool = True,
+) -> str:
+    """Hash the sources of a build: git tree, dirty files, the given paths (recursively) and tool versions.
+
+    extra is anything else that changes the build (version, build number...). Without dirty, the
+    changes that are not committed are left out, for builds from the HEAD commit (git archive).
+    """
+    h = hashlib.sha256()
+    for value in extra:
+        h.update(f"\0extra\0{value}".encode())
+    h.update(_git(repo, "rev-parse", "HEAD^{tree}"))
+
+    # tracked files changed since HEAD (staged or not), and untracked files
+    if dirty:
+        changed = _git(repo, "diff", "--name-only", "-z", "HEAD").split(b"\0")
+        untracked = _git(repo, "ls-files", "-z", "--others", "--exclude-standard").split(b"\0")
+        for name in sorted({n for n in changed + untracked if n}):
+            h.update(b"\0file\0" + name + b"\0" + _file_digest(repo / os.fsdecode(name)))
+
+    # the packaging files, even if they are ignored by git
+    for top in paths:
+        for path in sorted((repo / top).rglob("*")):
+            if path.is_file():
+                h.update(b"\0file\0" + os.fsencode(path.relative_to(repo)) + b"\0" + _file_digest(path))
+
+    for cmd in tools:
+        h.update(f"\0tool\0{' '.join(cmd)}\0{tool_version(cmd)}".encode())
+    return h.hexdigest()
+
+
+class BuildCache:
+    def __init__(self, name: str, max_size_mb: int | None = None) -> None:
+        self.root: Final = cache_dir() / "builds" / name
+        self.max_size: Final = (
+            (max_size_mb if max_size_mb is not None else env_int("CROWDSEC_TEST_BUILD_CACHE_SIZE", DEFAULT_SIZE_MB))
+            * 1024
+            * 1024
+        )
+        self.name: Final = name
+        self.lock_path: Final = user_lock_path(f"build-cache-{name}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def restore(self, key: str, dest: pathlib.Path) -> list[pathlib.Path] | None:
+        """Copy the artifacts of a cached build to dest. Return them, or None if there's no such build.
+
+        The artifacts are put at the same place relative to dest as they were to base in store().
+        """
+        if not self.enabled:
+            return None
+        entry = self.root / key
+        with file_lock(self.lock_path):
+            try:
+                names: list[str] = json.loads((entry / "artifacts.json").read_text())
+            except (FileNotFoundError, json.JSONDecodeError):
+                return None
+            restored: list[pathlib.Path] = []
+            for name in names:
+                (dest / name).parent.mkdir(parents=True, exist_ok=True)
+                _ = shutil.copy2(entry / name, dest / name)
+                restored.append(dest / name)
+            # last use, for eviction
+            os.utime(entry)
+        return restored
+
+    def store(self, key: str, artifacts: Iterable[pathlib.Path], base: pathlib.Path | None = None) -> None:
+        if not self.enabled:
+            return
+        artifacts = list(artifacts)
+        names = [str(p.relative_to(base)) if base is not None else p.name for p in artifacts]
+        with file_lock(self.lock_path):
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.root / f".{key}.{os.getpid()}"
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir()
+            for path, name in zip(artifacts, names, strict=True):
+                (tmp / name).parent.mkdir(parents=True, exist_ok=True)
+                _ = shutil.copy2(path, tmp / name)
+            _ = (tmp / "artifacts.json").write_text(json.dumps(names))
+            entry = self.root / key
+            shutil.rmtree(entry, ignore_errors=True)
+            _ = tmp.rename(entry)
+            self._evict()
+
+    def get(
+        self,
+        key: str,
+        dest: pathlib.Path,
+        build: Callable[[], Iterable[pathlib.Path]],
+        base: pathlib.Path | None = None,
+    ) -> list[pathlib.Path]:
+        """Restore the artifacts of key to dest, or call build() and store what it returns.
+
+        One build at a time for a given key, across sessions: the others wait for it and restore its artifacts.
+        """
+        if not self.enabled:
+            return list(build())
+        with file_lock(user_lock_path(f"build-{self.name}-{key}")):
+            restored = self.restore(key, dest)
+            if restored is not None:
+                return restored
+            artifacts = list(build())
+            self.store(key, artifacts, base)
+            return artifacts
+
+    def _evict(self) -> None:
+        entries: list[tuple[float, int, pathlib.Path]] = []
+        for entry in self.root.iterdir():
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            size = sum(p.stat().st_size for p in entry.rglob("*") if p.is_file())
+            entries.append((entry.stat().st_mtime, size, entry))
+        total = sum(size for _, size, _ in entries)
+        # oldest first; the last entry (just stored) is kept even if it's too large
+        for _, size, entry in sorted(entries)[:-1]:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+def newer_files(directory: pathlib.Path, pattern: str, since: float) -> list[pathlib.Path]:
+    """Files matching pattern in directory, modified after since (a timestamp)."""
+    return sorted(p for p in directory.glob(pattern) if p.stat().st_mtime >= since)
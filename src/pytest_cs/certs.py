@@ -0,0 +1,141 @@
+import hashlib
+import importlib.metadata
+import json
+import os
+import pathlib
+import shutil
+import threading
+import time
+from collections.abc import Callable
+from typing import Final
+
+import trustme
+
+from .helpers import cache_dir, env_int
+from .parallel import file_lock, user_lock_path
+from .timings import phase
+
+# TLS material for the certs_dir fixture: a CA, a server certificate for the
+# LAPI and client certificates for an agent and a bouncer.
+#
+# Generating keys is the most expensive thing the plugin does on the CPU, so a
+# bundle is generated once per session for each set of parameters, and every
+# call gets a fresh directory with copies of the files, that the test can
+# modify. The bundles themselves are only readable by the current user.
+#
+# Set CROWDSEC_TEST_CERTS_CACHE_DAYS to keep the bundles on disk, under
+# cache_dir(), and reuse them in the next sessions for that many days.
+
+FILES: Final = ("ca.crt", "lapi.crt", "lapi.key", "agent.crt", "agent.key", "bouncer.crt", "bouncer.key")
+
+KEY_TYPES: Final = {"rsa": trustme.KeyType.RSA, "ecdsa": trustme.KeyType.ECDSA}
+
+# bumped when the layout or permissions of the bundles change
+BUNDLE_FORMAT: Final = 2
+
+# of the copies: the keys are private, the certificates are not
+KEY_MODE: Final = 0o600
+CERT_MODE: Final = 0o644
+
+
+def bundle_key(lapi_hostname: str, agent_ou: str, bouncer_ou: str, key_type: str) -> str:
+    doc = json.dumps(
+        [lapi_hostname, agent_ou, bouncer_ou, key_type, importlib.metadata.version("trustme"), BUNDLE_FORMAT]
+    )
+    return hashlib.sha256(doc.encode()).hexdigest()
+
+
+def generate_bundle(path: pathlib.Path, lapi_hostname: str, agent_ou: str, bouncer_ou: str, key_type: str) -> None:
+    kt = KEY_TYPES[key_type]
+    ca = trustme.CA(key_type=kt)
+    ca.cert_pem.write_to_path(path / "ca.crt")
+
+    lapi_cert = ca.issue_server_cert("localhost", lapi_hostname, key_type=kt)
+    lapi_cert.cert_chain_pems[0].write_to_path(path / "lapi.crt")
+    lapi_cert.private_key_pem.write_to_path(path / "lapi.key")
+
+    agent_cert = ca.issue_cert("agent", organization_unit_name=agent_ou, key_type=kt)
+    agent_cert.cert_chain_pems[0].write_to_path(path / "agent.crt")
+    agent_cert.private_key_pem.write_to_path(path / "agent.key")
+
+    bouncer_cert = ca.issue_cert("bouncer", organization_unit_name=bouncer_ou, key_type=kt)
+    bouncer_cert.cert_chain_pems[0].write_to_path(path / "bouncer.crt")
+    bouncer_cert.private_key_pem.write_to_path(path / "bouncer.key")
+
+    # shared by the tests (and sessions), which get copies
+    for name in FILES:
+        (path / name).chmod(0o400)
+    path.chmod(0o700)
+
+
+def copy_bundle(src: pathlib.Path, dst: pathlib.Path) -> None:
+    for name in FILES:
+        mode = KEY_MODE if name.endswith(".key") else CERT_MODE
+        # created with the final mode, a key is never readable by others
+        fd = os.open(dst / name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+        with os.fdopen(fd, "wb") as f:
+            _ = f.write((src / name).read_bytes())
+
+
+class CertCache:
+    def __init__(self, root: pathlib.Path, max_age_days: int | None = None) -> None:
+        self.root: Final = root  # session directory
+        self.max_age: Final = 86400 * (
+            max_age_days if max_age_days is not None else env_int("CROWDSEC_TEST_CERTS_CACHE_DAYS", 0)
+        )
+        self._bundles: Final[dict[str, pathlib.Path]] = {}
+        self._lock: Final = threading.Lock()
+
+    @property
+    def disk_dir(self) -> pathlib.Path:
+        return cache_dir() / "certs"
+
+    def _expired(self, path: pathlib.Path) -> bool:
+        try:
+            return time.time() - path.stat().st_mtime > self.max_age
+        except FileNotFoundError:
+            return True
+
+    def _prune_disk(self) -> None:
+        for entry in self.disk_dir.glob("*"):
+            if entry.is_dir() and self._expired(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def _from_disk(self, key: str, generate: Callable[[pathlib.Path], None]) -> pathlib.Path:
+        entry = self.disk_dir / key
+        with file_lock(user_lock_path(f"certs-{key}")):
+            if not self._expired(entry) and all((entry / name).exists() for name in FILES):
+                return entry
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._prune_disk()
+            tmp = self.disk_dir / f".{key}.{os.getpid()}"
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir()
+            generate(tmp)
+            shutil.rmtree(entry, ignore_errors=True)
+            _ = tmp.rename(entry)
+            return entry
+
+    def bundle(self, lapi_hostname: str, agent_ou: str, bouncer_ou: str, key_type: str) -> pathlib.Path:
+        """Return the directory of the (shared, read-only) bundle, generating it if needed."""
+        if key_type not in KEY_TYPES:
+            msg = f"unknown key type {key_type!r}, must be one of: {', '.join(KEY_TYPES)}"
+            raise ValueError(msg)
+        key = bundle_key(lapi_hostname, agent_ou, bouncer_ou, key_type)
+
+        def generate(path: pathlib.Path) -> None:
+            with phase("generate certificates"):
+                generate_bundle(path, lapi_hostname, agent_ou, bouncer_ou, key_type)
+
+        with self._lock:
+            path = self._bundles.get(key)
+            if path is not None:
+                return path
+            if self.max_age > 0:
+                path = self._from_disk(key, generate)
+            else:
+                path = self.root / key[:16]
+                path.mkdir(parents=True)
+                generate(path)
+            self._bundles[key] = path
+            return path
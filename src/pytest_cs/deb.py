@@ -1,12 +1,14 @@
 import pathlib
 import subprocess
+import time
 from collections.abc import Iterator
 
 import pytest
 
+from .buildcache import BuildCache, newer_files, source_key
 from .misc import lookup_project_repo
-
-deb_build_done = False
+from .parallel import run_once
+from .timings import phase
 
 
 @pytest.fixture
@@ -41,9 +43,39 @@ def deb_package_arch() -> str:
     return subprocess.check_output(["dpkg-architecture", "-qDEB_BUILD_ARCH"], encoding="utf-8").strip()
 
 
-def dpkg_buildpackage(repodir: pathlib.Path) -> None:
+# what goes into the build, besides the sources
+DEB_BUILD_TOOLS = (
+    ("dpkg-buildpackage", "--version"),
+    ("dpkg-query", "--showformat=${Version}", "--show", "debhelper"),
+    ("go", "version"),
+    ("gcc", "--version"),
+)
+
+
+def dpkg_buildpackage(repodir: pathlib.Path, *, clean: bool = True) -> None:
+    if clean:
+        _ = subprocess.check_call(["make", "clean-debian"], cwd=repodir)
+    with phase("dpkg-buildpackage"):
+        _ = subprocess.check_call(["dpkg-buildpackage", "-us", "-uc", "-b"], cwd=repodir)
+
+
+# Build the packages, or restore them from the build cache (see buildcache.py).
+# They are written next to the repository, like dpkg-buildpackage does.
+def cached_dpkg_buildpackage(repodir: pathlib.Path) -> None:
+    cache = BuildCache("deb")
+    if not cache.enabled:
+        dpkg_buildpackage(repodir)
+        return
+    # after cleaning, so that the leftovers of a previous build don't change the key
     _ = subprocess.check_call(["make", "clean-debian"], cwd=repodir)
-    _ = subprocess.check_call(["dpkg-buildpackage", "-us", "-uc", "-b"], cwd=repodir)
+    key = source_key(repodir, ["debian"], DEB_BUILD_TOOLS)
+
+    def build() -> list[pathlib.Path]:
+        start = time.time() - 1
+        dpkg_buildpackage(repodir, clean=False)
+        return newer_files(repodir.parent, "*.deb", start)
+
+    _ = cache.get(key, repodir.parent, build)
 
 
 @pytest.fixture(scope="session")
@@ -56,11 +88,16 @@ def deb_package_path(
     return project_repo.parent / f"{deb_package_name}_{deb_package_version}_{deb_package_arch}.deb"
 
 
+# The packages are built once per session, by a single xdist worker
 @pytest.fixture(scope="session")
-def deb_package(deb_package_path: pathlib.Path, project_repo: pathlib.Path) -> pathlib.Path:
-    global deb_build_done
-    if not deb_build_done:
+def deb_package(
+    deb_package_path: pathlib.Path,
+    project_repo: pathlib.Path,
+    tmp_path_factory: pytest.TempPathFactory,
+) -> pathlib.Path:
+    def build() -> None:
         deb_package_path.unlink(missing_ok=True)
-        dpkg_buildpackage(repodir=project_repo)
-        deb_build_done = True
+        cached_dpkg_buildpackage(repodir=project_repo)
+
+    run_once(tmp_path_factory, "deb-build", build)
     return deb_package_path
@@ -1,18 +1,36 @@
 import contextlib
+import datetime as dt
 import http
 import os
+import threading
 import time
-from collections.abc import Callable, Iterator
-from typing import Final, TypeVar, override
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Final, Literal, TypeVar, override
 
 import docker
 import docker.errors
 import docker.models.containers
 import pytest
 import requests
-
-from .helpers import default_timeout
-from .waiters import WaiterGenerator
+import requests.adapters
+
+from .events import FALLBACK_INTERVAL, ContainerRefresher, close_container_events, container_events
+from .execsession import ExecResult, ExecSession, exec_batch
+from .helpers import container_client, container_id, default_timeout
+from .imagecache import ImageCache
+from .lib.cscli import Cscli
+from .lib.logparse import LogIndex, LogRecord
+from .lib.match import OrderedMatcher
+from .logs import close_log_follower, log_follower
+from .parallel import file_lock, is_xdist_worker, user_lock_path, worker_id
+from .pool import ContainerPool
+from .reaper import session_labels, track_container
+from .reports import attach_to_report
+from .stats import ContainerStatsRecorder
+from .teardown import TeardownQueue
+from .timings import phase
+from .waiters import Schedule, WaiterGenerator, exponential
 
 
 @pytest.fixture(scope="session")
@@ -20,9 +38,39 @@ def crowdsec_version() -> str:
     return os.environ["CROWDSEC_TEST_VERSION"]
 
 
+# Under xdist, each worker gets its own network, created if needed.
+# It's not removed at the end, the containers we keep are attached to it.
+@pytest.fixture(scope="session")
+def docker_network(docker_client: docker.DockerClient) -> str:
+    name = os.environ["CROWDSEC_TEST_NETWORK"]
+    if not is_xdist_worker():
+        return name
+    name = f"{name}-{worker_id()}"
+    with file_lock(user_lock_path(f"network-{name}")):
+        try:
+            _ = docker_client.networks.get(name)
+        except docker.errors.NotFound:
+            _ = docker_client.networks.create(name)
+    return name
+
+
+# Prepended to the container names, so that xdist workers don't collide.
 @pytest.fixture(scope="session")
-def docker_network() -> str:
-    return os.environ["CROWDSEC_TEST_NETWORK"]
+def container_name_prefix() -> str:
+    if not is_xdist_worker():
+        return ""
+    return f"{worker_id()}-"
+
+
+# The original name is kept as a network alias, so that containers
+# can still reach each other by the name used in the test.
+def apply_name_prefix(docker_client: docker.DockerClient, kw: dict[str, Any], prefix: str) -> None:  # pyright:ignore[reportExplicitAny]
+    if not prefix or "name" not in kw:
+        return
+    name = kw["name"]
+    kw["name"] = prefix + name
+    if kw.get("network") and "networking_config" not in kw:
+        kw["networking_config"] = {kw["network"]: docker_client.api.create_endpoint_config(aliases=[name])}
 
 
 def crowdsec_flavors() -> list[str]:
@@ -52,9 +100,15 @@ class Container:
             timeout = default_timeout()
         if isinstance(s, str):
             s = [s]
-        for waiter in log_waiters(self.cont, timeout):
-            with waiter as matcher:
-                matcher.fnmatch_lines(s)
+        matcher = OrderedMatcher(s)
+        try:
+            for waiter in _new_lines_waiters(self.cont, timeout):
+                with waiter as new:
+                    assert matcher.feed(new), f"log line not found: {matcher.pending}"
+        except AssertionError:
+            # scan everything once more, for a detailed report
+            lines, _ = log_follower(self.cont).lines_since(0)
+            matcher.report(lines)
 
     def wait_for_http(
         self, port: int, path: str, want_status: http.HTTPStatus | None = None, timeout: float | None = None
@@ -74,36 +128,235 @@ class Container:
         return None
 
     # Return the last 'tail' lines of the container's logs (either a number or the string 'all')
-    # The default is a measure to avoid performance or memory issues.
-    def log_lines(self, tail: int = 10000) -> list[str]:
-        return self.cont.logs(tail=tail).decode("utf-8").splitlines()
+    # The lines are kept in memory by the log follower, there is no limit
+    # to what it collects.
+    def log_lines(self, tail: int | Literal["all"] = 10000) -> list[str]:
+        follower = log_follower(self.cont)
+        follower.sync()
+        lines, _ = follower.lines_since(0)
+        if tail == "all":
+            return lines
+        return lines[-tail:] if tail > 0 else []
+
+    # Structured queries on the logs, answered from an index that is
+    # updated as the log grows. For example:
+    #
+    #   cs.first_log_record(level="error", since=t)
+    #   cs.log_records(type="file")
+    #   cs.wait_for_log_record(lambda r: r.msg.startswith("Starting processing"))
+    def log_records(
+        self,
+        *,
+        level: str | None = None,
+        since: dt.datetime | None = None,
+        predicate: Callable[[LogRecord], bool] | None = None,
+        **fields: str,
+    ) -> list[LogRecord]:
+        follower = log_follower(self.cont)
+        follower.sync()
+        return list(follower.index().find(level=level, since=since, predicate=predicate, start=0, **fields))
+
+    def first_log_record(
+        self,
+        *,
+        level: str | None = None,
+        since: dt.datetime | None = None,
+        predicate: Callable[[LogRecord], bool] | None = None,
+        **fields: str,
+    ) -> LogRecord | None:
+        follower = log_follower(self.cont)
+        follower.sync()
+        return follower.index().first(level=level, since=since, predicate=predicate, start=0, **fields)
+
+    def wait_for_log_record(
+        self,
+        predicate: Callable[[LogRecord], bool] | None = None,
+        *,
+        level: str | None = None,
+        since: dt.datetime | None = None,
+        timeout: float | None = None,
+        **fields: str,
+    ) -> LogRecord:
+        if timeout is None:
+            timeout = default_timeout()
+        start = 0  # records already looked at
+        for waiter in _index_waiters(self.cont, timeout):
+            with waiter as index:
+                end = len(index)
+                record = index.first(level=level, since=since, predicate=predicate, start=start, **fields)
+                start = end
+                assert record is not None, f"log record not found: level={level} since={since} fields={fields}"
+                return record
+        msg = "log record not found"
+        raise AssertionError(msg)
+
+    # Run many commands with a single exec instance, see execsession.py
+    def exec_batch(self, commands: Sequence[str], **kw) -> list[ExecResult]:
+        return exec_batch(self.cont, commands, **kw)
+
+    def exec_session(self, **kw) -> ExecSession:
+        return ExecSession(self.cont, **kw)
 
     @property
     def probe(self) -> "Probe":
-        return Probe(self.cont.ports)
+        return Probe(self.cont.ports, probe_session(self.cont))
 
 
 class CrowdsecContainer(Container):
-    pass
+    def __init__(self, cont: docker.models.containers.Container, stats: ContainerStatsRecorder | None = None) -> None:
+        super().__init__(cont)
+        # with crowdsec(record_stats=True)
+        self.stats: Final = stats
+        # cached queries, see lib/cscli.py
+        self.cscli: Final = Cscli.in_container(cont)
+
+
+_pulls: dict[str, Future[None]] = {}
+_pulls_lock = threading.Lock()
+
+
+# Pull an image. If another thread is already pulling it,
+# wait for that to finish instead.
+def pull_image(docker_client: docker.DockerClient, image: str) -> None:
+    with _pulls_lock:
+        future = _pulls.get(image)
+        in_progress = future is not None
+        if future is None:
+            future = _pulls[image] = Future()
+    if in_progress:
+        with phase("pull"):
+            future.result()
+        return
+    try:
+        # other sessions or xdist workers may be pulling it too
+        with file_lock(user_lock_path(f"pull-{image}")):
+            try:
+                _ = docker_client.images.get(image)
+            except docker.errors.ImageNotFound:
+                with phase("pull"):
+                    _ = docker_client.images.pull(image)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(None)
+    finally:
+        with _pulls_lock:
+            del _pulls[image]
 
 
 # Create a container. If the image was not found, pull it
-# and try again
+# and try again.
+# The container is labelled with the session and the test, for the reaper.
 def pull_and_create_container(
     docker_client: docker.DockerClient,
     *args,
     **kwargs,
 ) -> docker.models.containers.Container:
+    labels = kwargs.get("labels") or {}
+    if isinstance(labels, list):
+        labels = dict.fromkeys(labels, "")
+    kwargs["labels"] = {**labels, **session_labels()}
     try:
-        return docker_client.containers.create(*args, **kwargs)
+        with phase("create"):
+            cont = docker_client.containers.create(*args, **kwargs)
     except docker.errors.ImageNotFound:
+        pull_image(docker_client, kwargs["image"])
+        with phase("create"):
+            cont = docker_client.containers.create(*args, **kwargs)
+    track_container(cont)
+    return cont
+
+
+# Pull the images that are not already there, a few at a time.
+# Errors are reported but not raised, the test that needs
+# the image will try again.
+def prepull_images(
+    docker_client: docker.DockerClient,
+    images: Iterable[str],
+    report: Callable[[str], None],
+    max_workers: int = 4,
+) -> None:
+    missing: list[str] = []
+    for image in sorted(set(images)):
         try:
-            repo, tag = kwargs["image"].split(":")
-        except ValueError:
-            repo = kwargs["image"]
-            tag = "latest"
-        _ = docker_client.images.pull(repo, tag)
-        return docker_client.containers.create(*args, **kwargs)
+            _ = docker_client.images.get(image)
+        except docker.errors.ImageNotFound:
+            missing.append(image)
+    if not missing:
+        return
+    report(f"pulling {len(missing)} image(s): {', '.join(missing)}")
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pull") as executor:
+        futures = {executor.submit(pull_image, docker_client, image): image for image in missing}
+        for done, future in enumerate(as_completed(futures), 1):
+            image = futures[future]
+            err = future.exception()
+            if err is None:
+                report(f"[{done}/{len(missing)}] pulled {image}")
+            else:
+                report(f"[{done}/{len(missing)}] failed to pull {image}: {err}")
+
+
+# The images that the collected tests will need: crowdsec if they use the
+# crowdsec fixture (the default "full" flavor, and the flavor they are
+# parametrized with), and the ones from @pytest.mark.docker_image
+def required_images(items: Iterable[pytest.Item]) -> set[str]:
+    images: set[str] = set()
+    version = os.environ.get("CROWDSEC_TEST_VERSION")
+    for item in items:
+        if version and "crowdsec" in getattr(item, "fixturenames", ()):
+            images.add(get_image(version, "full"))
+            callspec = getattr(item, "callspec", None)
+            if callspec is not None and "flavor" in callspec.params:
+                images.add(get_image(version, callspec.params["flavor"]))
+        for marker in item.iter_markers("docker_image"):
+            images.update(marker.args)
+    return images
+
+
+# Return an image prepared by running the setup commands in a container
+# created with the given arguments. It is built on first use, and cached.
+def derived_image(docker_client: docker.DockerClient, kw: dict[str, Any], setup: list[str]) -> str:  # pyright:ignore[reportExplicitAny]
+    base = kw["image"]
+    try:
+        base_id = docker_client.images.get(base).id
+    except docker.errors.ImageNotFound:
+        pull_image(docker_client, base)
+        base_id = docker_client.images.get(base).id
+    if base_id is None:
+        msg = f"image {base} has no id"
+        raise RuntimeError(msg)
+
+    # what must not be in the image, or is not unique
+    builder_kw = {k: v for k, v in kw.items() if k not in ("name", "networking_config", "ports", "hostname")}
+
+    def build(tag: str) -> None:
+        builder = pull_and_create_container(docker_client, **builder_kw)
+        try:
+            try:
+                builder.start()
+                wait_for_status(builder, Status.RUNNING)
+                # the entrypoint is still preparing the container (hub, config...) until one of
+                # the services is up: don't let the setup commands race with it
+                _ = CrowdsecContainer(builder).wait_for_log_record(
+                    lambda r: r.msg.startswith(("Starting processing data", "CrowdSec Local API listening"))
+                )
+                for cmd in setup:
+                    res = builder.exec_run(cmd, stream=False)
+                    if res.exit_code != 0:
+                        output = res.output if isinstance(res.output, bytes) else b"".join(res.output)
+                        msg = f"setup command failed ({res.exit_code}): {cmd}\n{output.decode(errors='replace')}"
+                        raise RuntimeError(msg)
+            finally:
+                stop_container(builder, 1)
+            repository, _, image_tag = tag.partition(":")
+            _ = builder.commit(repository, image_tag)
+        finally:
+            builder.remove(force=True)
+
+    key = ImageCache.key(base_id, setup, kw)
+    with phase("derived image"):
+        return ImageCache(docker_client).get(key, build)
 
 
 def get_image(version: str, flavor: str) -> str:
@@ -113,15 +366,43 @@ def get_image(version: str, flavor: str) -> str:
 
 
 @pytest.fixture(scope="session")
-def docker_client() -> docker.DockerClient:
-    return docker.from_env()
+def docker_client() -> Iterator[docker.DockerClient]:
+    client = docker.from_env()
+    try:
+        yield client
+    finally:
+        close_container_events(client)
+
+
+# With a teardown queue, this is done in the background
+def stop_container(
+    cont: docker.models.containers.Container,
+    stop_timeout: int,
+    teardown: TeardownQueue | None = None,
+) -> None:
+    if teardown is not None:
+        teardown.submit(lambda: stop_container(cont, stop_timeout))
+        return
+    try:
+        with phase("teardown"):
+            cont.stop(timeout=stop_timeout)
+            _ = cont.wait()
+        cont.reload()
+    finally:
+        close_log_follower(cont)
+        close_probe_session(cont)
+    # we don't remove the container, so that we can inspect it if the test fails.
+    # If it passed, the reaper will remove it at the end of the session.
 
 
 @pytest.fixture(scope="session")
-def crowdsec(
+def crowdsec(  # noqa: PLR0913, PLR0917
     docker_client: docker.DockerClient,
     crowdsec_version: str,
     docker_network: str,
+    crowdsec_pool: ContainerPool | None,
+    container_name_prefix: str,
+    container_teardown: TeardownQueue | None,
 ) -> Callable[..., contextlib.AbstractContextManager[CrowdsecContainer]]:
     # return a context manager that will create a container, yield it, and
     # stop it when the context manager exits
@@ -131,6 +412,11 @@ def crowdsec(
 
         wait_status = kw.pop("wait_status", Status.RUNNING)
         stop_timeout: int = kw.pop("stop_timeout", 1)
+        use_pool: bool = kw.pop("pool", True)
+        # commands to prepare the container, cached in a derived image
+        setup: list[str] | None = kw.pop("setup", None)
+        # record cpu, memory and i/o usage, attached to the test report
+        record_stats: bool = kw.pop("record_stats", False)
 
         if "image" in kw and "flavor" in kw:
             msg = "cannot specify both image and flavor"
@@ -153,20 +439,42 @@ def crowdsec(
         # TODO:
         kw.setdefault("ports", {"8080": None, "6060": None})
 
-        cont = pull_and_create_container(docker_client, *args, **kw)
-        cont.start()
+        apply_name_prefix(docker_client, kw, container_name_prefix)
+
+        if setup:
+            kw["image"] = derived_image(docker_client, kw, setup)
+
+        def create() -> docker.models.containers.Container:
+            cont = pull_and_create_container(docker_client, *args, **kw)
+            with phase("start"):
+                cont.start()
+            return cont
+
+        # subscribe before starting, so we don't miss the first events
+        _ = container_events(docker_client)
+        # container names must be unique, those can't be prepared in advance
+        if crowdsec_pool is not None and use_pool and "name" not in kw:
+            cont = crowdsec_pool.acquire(ContainerPool.key(args, kw), create)
+            # it was created for another test
+            track_container(cont)
+        else:
+            cont = create()
 
         if wait_status:
             wait_for_status(cont, wait_status)
 
+        stats = None
+        if record_stats:
+            stats = ContainerStatsRecorder(cont)
+            stats.start()
+
         try:
-            yield CrowdsecContainer(cont)
+            yield CrowdsecContainer(cont, stats)
         finally:
-            cont.stop(timeout=stop_timeout)
-            _ = cont.wait()
-            cont.reload()
-            # we don't remove the container, so that we can inspect it if the test fails
-            # cont.remove(force=True)
+            if stats is not None:
+                stats.stop()
+                attach_to_report(f"container_stats[{cont.name}]", stats.to_dict())
+            stop_container(cont, stop_timeout, container_teardown)
 
     return closure
 
@@ -175,6 +483,8 @@ def crowdsec(
 def container(
     docker_client: docker.DockerClient,
     docker_network: str,
+    container_name_prefix: str,
+    container_teardown: TeardownQueue | None,
 ) -> Callable[..., contextlib.AbstractContextManager[Container]]:
     # return a context manager that will create a container, yield it, and
     # stop it when the context manager exits
@@ -198,8 +508,13 @@ def container(
         # forced
         kw["environment"]["CI_TESTING"] = "true"
 
+        apply_name_prefix(docker_client, kw, container_name_prefix)
+
+        # subscribe before starting, so we don't miss the first events
+        _ = container_events(docker_client)
         cont = pull_and_create_container(docker_client, *args, **kw)
-        cont.start()
+        with phase("start"):
+            cont.start()
 
         if wait_status:
             wait_for_status(cont, wait_status)
@@ -207,11 +522,7 @@ def container(
         try:
             yield Container(cont)
         finally:
-            cont.stop(timeout=stop_timeout)
-            _ = cont.wait()
-            cont.reload()
-            # we don't remove the container, so that we can inspect it if the test fails
-            # cont.remove(force=True)
+            stop_container(cont, stop_timeout, container_teardown)
 
     return closure
 
@@ -220,27 +531,76 @@ T = TypeVar("T")
 
 
 class ContainerWaiterGenerator(WaiterGenerator[T]):
-    def __init__(self, cont: docker.models.containers.Container, timeout: float | None = None) -> None:
+    def __init__(
+        self,
+        cont: docker.models.containers.Container,
+        timeout: float | None = None,
+        schedule: Schedule | None = None,
+    ) -> None:
         if timeout is None:
             timeout = default_timeout()
-        super().__init__(timeout)
+        super().__init__(timeout, schedule=schedule)
         self.cont: Final = cont
+        self.refresher: Final = ContainerRefresher(cont)
 
     @override
     def refresh(self) -> None:
-        self.cont.reload()
+        self.refresher.refresh()
         super().refresh()
 
+    @override
+    def sleep(self, delay: float) -> None:
+        self.refresher.wait(delay)
+
+
+# how long to wait for a connection, and then for the response
+PROBE_CONNECT_TIMEOUT = 2
+PROBE_READ_TIMEOUT = 10
+
+_probe_sessions: dict[str, requests.Session] = {}
+_probe_sessions_lock = threading.Lock()
+
+
+# A requests.Session per container, so that probes reuse their
+# connections instead of opening a new one on each iteration.
+# It is closed when the container is stopped or removed.
+def probe_session(cont: docker.models.containers.Container) -> requests.Session:
+    cont_id = container_id(cont)
+    with _probe_sessions_lock:
+        session = _probe_sessions.get(cont_id)
+        if session is None:
+            session = _probe_sessions[cont_id] = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=8)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+    return session
+
+
+def close_probe_session(cont: docker.models.containers.Container) -> None:
+    with _probe_sessions_lock:
+        session = _probe_sessions.pop(container_id(cont), None)
+    if session is not None:
+        session.close()
+
 
 class Probe:
-    def __init__(self, ports: dict[str, list[dict[str, str]]]) -> None:
+    def __init__(
+        self,
+        ports: Mapping[str, list[dict[str, str]] | None],
+        session: requests.Session | None = None,
+        connect_timeout: float = PROBE_CONNECT_TIMEOUT,
+        read_timeout: float = PROBE_READ_TIMEOUT,
+    ) -> None:
         self.ports: Final = ports
+        self.session: Final = session if session is not None else requests.Session()
+        self.timeout: Final = (connect_timeout, read_timeout)
 
-    def get_bound_port(self, port: int):
-        full_port = f"{port}/tcp"
-        if full_port not in self.ports:
+    def get_bound_port(self, port: int) -> str | None:
+        # None if the port is exposed but not published (yet)
+        bindings = self.ports.get(f"{port}/tcp")
+        if not bindings:
             return None
-        return self.ports[full_port][0]["HostPort"]
+        return bindings[0]["HostPort"]
 
     def http_status_code(self, port: int, path: str) -> http.HTTPStatus | None:
         bound_port = self.get_bound_port(port)
@@ -250,38 +610,99 @@ class Probe:
         url = f"http://localhost:{bound_port}{path}"
 
         try:
-            r = requests.get(url, timeout=30)
-        except requests.exceptions.ConnectionError:
+            r = self.session.get(url, timeout=self.timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             return None
         return http.HTTPStatus(r.status_code)
 
+    # Probe several endpoints at once, for example:
+    #   probe.http_status_codes([(8080, "/health"), (6060, "/metrics")])
+    def http_status_codes(self, targets: Iterable[tuple[int, str]]) -> dict[tuple[int, str], http.HTTPStatus | None]:
+        targets = list(targets)
+        if not targets:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="probe") as executor:
+            statuses = executor.map(self.http_status_code, [port for port, _ in targets], [path for _, path in targets])
+            return dict(zip(targets, statuses, strict=True))
+
 
 class port_waiters(ContainerWaiterGenerator[Probe]):
     @override
     def context(self) -> Probe:
-        return Probe(self.cont.ports)
+        return Probe(self.cont.ports, probe_session(self.cont))
 
 
+# Wait for a container to reach a given status. The container is
+# inspected again only when the daemon reports an event for it, with
+# a fallback to polling if the event stream is not available.
 def wait_for_status(cont: docker.models.containers.Container, status: str, timeout: float | None = None) -> None:
     if timeout is None:
         timeout = default_timeout()
-    start = time.monotonic()
-    now = start
-    while (now - start) < timeout:
-        cont.reload()
-        if cont.status == status:
-            return
-        time.sleep(0.1)
-        now = time.monotonic()
+    cont_id = container_id(cont)
+    events = container_events(container_client(cont))
+    deadline = time.monotonic() + timeout
+    with phase("wait_for_status"):
+        while True:
+            # take the generation before reloading, an event could come in between
+            generation = events.generation(cont_id)
+            cont.reload()
+            if cont.status == status:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _ = events.wait(cont_id, generation, remaining)
     msg = f"Container {cont.name} ({cont.status}) did not reach state {status} in {timeout} seconds"
     raise TimeoutError(msg)
 
 
-class log_waiters(ContainerWaiterGenerator[pytest.LineMatcher]):
+# The logs are collected in the background by a LogFollower, the
+# waiters wake up as soon as there are new lines.
+class _follower_waiters(ContainerWaiterGenerator[T]):
+    def __init__(
+        self,
+        cont: docker.models.containers.Container,
+        timeout: float | None = None,
+        schedule: Schedule | None = None,
+    ) -> None:
+        super().__init__(cont, timeout, schedule)
+        self.follower: Final = log_follower(cont)
+        self.cursor: int = 0  # lines seen so far
+
+    @override
+    def refresh(self) -> None:
+        super().refresh()
+        self.follower.poll(self.cont.status)
+
+    @override
+    def sleep(self, delay: float) -> None:
+        _ = self.follower.wait_for_lines(self.cursor, delay)
+
+
+# The matcher is only rebuilt when there are new lines.
+class log_waiters(_follower_waiters[pytest.LineMatcher]):
     @override
     def context(self) -> pytest.LineMatcher:
-        lines = self.cont.logs(tail=10000).decode("utf-8").splitlines()
-        return pytest.LineMatcher(lines)
+        matcher = self.follower.matcher()
+        self.cursor = len(matcher.lines)
+        return matcher
+
+
+# Each iteration gets only the lines added since the previous one.
+class _new_lines_waiters(_follower_waiters[list[str]]):
+    @override
+    def context(self) -> list[str]:
+        new, self.cursor = self.follower.lines_since(self.cursor)
+        return new
+
+
+# Each iteration gets the index of the log records, with the new lines parsed.
+class _index_waiters(_follower_waiters[LogIndex]):
+    @override
+    def context(self) -> LogIndex:
+        index = self.follower.index()
+        self.cursor = len(index)
+        return index
 
 
 # TODO: enum
@@ -293,3 +714,258 @@ class Status:
     EXITED: Final = "exited"
     DEAD: Final = "dead"
     REMOVING: Final = "removing"
+
+
+# Conditions to wait for when starting a group of containers.
+# check() returns True once the condition is met, and must not block:
+# the conditions that need to wait for something (log lines, http
+# responses) set the wakeup event when it's time to check them again.
+class GroupCondition:
+    def __init__(self, cont: docker.models.containers.Container) -> None:
+        self.cont: Final = cont
+
+    def start(self, wakeup: threading.Event, executor: ThreadPoolExecutor) -> None:  # pyright:ignore[reportUnusedParameter]
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def check(self) -> bool:
+        raise NotImplementedError
+
+    # Return why the condition can't be met anymore, if that's the case.
+    def failure(self) -> str | None:
+        status = self.cont.status
+        if status in (Status.EXITED, Status.DEAD, Status.REMOVING, Status.RESTARTING):
+            return f"container is {status}"
+        health = (self.cont.attrs.get("State") or {}).get("Health") or {}
+        if health.get("Status") == "unhealthy":
+            return "container is unhealthy"
+        return None
+
+
+class StatusCondition(GroupCondition):
+    def __init__(self, cont: docker.models.containers.Container, status: str) -> None:
+        super().__init__(cont)
+        self.status: Final = status
+
+    @override
+    def check(self) -> bool:
+        return self.cont.status == self.status
+
+    @override
+    def failure(self) -> str | None:
+        if self.cont.status == self.status:
+            return None
+        return super().failure()
+
+    @override
+    def __str__(self) -> str:
+        return f"status {self.status}"
+
+
+class LogCondition(GroupCondition):
+    def __init__(self, cont: docker.models.containers.Container, patterns: list[str]) -> None:
+        super().__init__(cont)
+        self.matcher: Final = OrderedMatcher(patterns)
+        self.follower: Final = log_follower(cont)
+        self.cursor: int = 0
+        self._wakeup: threading.Event | None = None
+
+    @override
+    def start(self, wakeup: threading.Event, executor: ThreadPoolExecutor) -> None:
+        self._wakeup = wakeup
+        self.follower.add_listener(wakeup)
+
+    @override
+    def stop(self) -> None:
+        if self._wakeup is not None:
+            self.follower.remove_listener(self._wakeup)
+
+    @override
+    def check(self) -> bool:
+        self.follower.poll(self.cont.status)
+        new, self.cursor = self.follower.lines_since(self.cursor)
+        return self.matcher.feed(new)
+
+    @override
+    def __str__(self) -> str:
+        return f"log line {self.matcher.pending or self.matcher.patterns[-1]!r}"
+
+
+# The probes run in the background, concurrently for all the containers.
+# A new one is started once the previous one has completed without
+# the expected result.
+class HttpCondition(GroupCondition):
+    def __init__(
+        self,
+        cont: docker.models.containers.Container,
+        port: int,
+        path: str,
+        want_status: http.HTTPStatus | None = None,
+    ) -> None:
+        super().__init__(cont)
+        self.port: Final = port
+        self.path: Final = path
+        self.want_status: Final = want_status
+        self.last_status: http.HTTPStatus | None = None
+        self._future: Future[http.HTTPStatus | None] | None = None
+        self._wakeup: threading.Event | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    @override
+    def start(self, wakeup: threading.Event, executor: ThreadPoolExecutor) -> None:
+        self._wakeup = wakeup
+        self._executor = executor
+
+    def _probe(self) -> http.HTTPStatus | None:
+        return Probe(self.cont.ports, probe_session(self.cont)).http_status_code(self.port, self.path)
+
+    @override
+    def check(self) -> bool:
+        if self._executor is None or self._wakeup is None:
+            msg = "HttpCondition.check() called before start()"
+            raise RuntimeError(msg)
+        if self._future is not None and self._future.done():
+            self.last_status = self._future.result()
+            self._future = None
+            if self.want_status is None and self.last_status is not None:
+                return True
+            if self.want_status is not None and self.last_status == self.want_status:
+                return True
+        if self._future is None:
+            self._future = self._executor.submit(self._probe)
+            wakeup = self._wakeup
+            self._future.add_done_callback(lambda _: wakeup.set())
+        return False
+
+    @override
+    def __str__(self) -> str:
+        want = self.want_status or "any status"
+        return f"http {self.port}{self.path} ({want}, last: {self.last_status})"
+
+
+class _group_waiters(WaiterGenerator[None]):
+    def __init__(
+        self,
+        conditions: Sequence[GroupCondition],
+        timeout: float,
+        schedule: Schedule | None,
+        wakeup: threading.Event,
+    ) -> None:
+        super().__init__(timeout, schedule=schedule or exponential(cap=FALLBACK_INTERVAL), wakeup=wakeup)
+        self.conts: Final = {container_id(c.cont): c.cont for c in conditions}
+        self.refreshers: Final = {cont_id: ContainerRefresher(cont) for cont_id, cont in self.conts.items()}
+
+    @override
+    def refresh(self) -> None:
+        for cont_id, refresher in self.refreshers.items():
+            try:
+                refresher.refresh()
+            except docker.errors.NotFound:
+                msg = f"Container {self.conts[cont_id].name} was removed"
+                raise RuntimeError(msg) from None
+        super().refresh()
+
+    @override
+    def context(self) -> None:
+        return None
+
+
+# Wait for all the conditions in a single loop, across all the containers.
+# The loop wakes up on container events, new log lines and completed probes.
+# Fail as soon as a container can't meet one of its conditions anymore.
+def wait_for_group(
+    conditions: Sequence[GroupCondition], timeout: float | None = None, schedule: Schedule | None = None
+) -> None:
+    if timeout is None:
+        timeout = default_timeout()
+    pending = list(conditions)
+    wakeup = threading.Event()
+    events = {id(e): e for e in (container_events(container_client(c.cont)) for c in conditions)}.values()
+    probes = sum(isinstance(c, HttpCondition) for c in conditions)
+    executor = ThreadPoolExecutor(max_workers=probes or 1, thread_name_prefix="group-probe")
+    for e in events:
+        e.add_listener(wakeup)
+    for c in conditions:
+        c.start(wakeup, executor)
+    try:
+        for waiter in _group_waiters(conditions, timeout, schedule, wakeup):
+            with waiter:
+                for c in pending:
+                    reason = c.failure()
+                    if reason is not None:
+                        msg = f"Container {c.cont.name}: {reason}, while waiting for {c}"
+                        raise RuntimeError(msg)
+                pending = [c for c in pending if not c.check()]
+                assert not pending
+    except AssertionError:
+        waiting = ", ".join(f"{c.cont.name}: {c}" for c in pending)
+        msg = f"Timeout after {timeout} seconds, still waiting for {waiting}"
+        raise TimeoutError(msg) from None
+    finally:
+        for c in conditions:
+            c.stop()
+        for e in events:
+            e.remove_listener(wakeup)
+        # don't wait for the probes still running after a failure
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Start several containers at once, for example:
+#
+#   with container_group(
+#       {"name": "lapi", "wait_http": (8080, "/health")},
+#       {"environment": {...}, "wait_log": ["*Starting processing data*"]},
+#       {"kind": "container", "image": "nginx"},
+#   ) as (lapi, agent, web):
+#
+# Each spec has the same arguments as the crowdsec (default) or container
+# fixture, plus the conditions to wait for: wait_status (default: running),
+# wait_log (list of patterns, in order) and wait_http (port, path[, status]).
+# The containers are created and started concurrently, then all the
+# conditions are checked together.
+@pytest.fixture(scope="session")
+def container_group(
+    crowdsec: Callable[..., contextlib.AbstractContextManager[CrowdsecContainer]],
+    container: Callable[..., contextlib.AbstractContextManager[Container]],
+) -> Callable[..., contextlib.AbstractContextManager[list[Container]]]:
+    @contextlib.contextmanager
+    def closure(*specs: dict[str, Any], timeout: float | None = None) -> Iterator[list[Container]]:  # pyright:ignore[reportExplicitAny]
+        managers: list[contextlib.AbstractContextManager[Container]] = []
+        waits: list[tuple[str | None, list[str] | None, tuple[Any, ...] | None]] = []  # pyright:ignore[reportExplicitAny]
+        for spec in specs:
+            kw = dict(spec)
+            factory = container if kw.pop("kind", "crowdsec") == "container" else crowdsec
+            waits.append((kw.pop("wait_status", Status.RUNNING), kw.pop("wait_log", None), kw.pop("wait_http", None)))
+            managers.append(factory(wait_status=None, **kw))
+
+        with contextlib.ExitStack() as stack:
+            with ThreadPoolExecutor(max_workers=len(managers) or 1, thread_name_prefix="group") as executor:
+                futures = [executor.submit(m.__enter__) for m in managers]
+            conts: list[Container] = []
+            errors: list[BaseException] = []
+            # the ones that started must be stopped, even if others failed
+            for manager, future in zip(managers, futures, strict=True):
+                err = future.exception()
+                if err is not None:
+                    errors.append(err)
+                    continue
+                _ = stack.push(manager.__exit__)
+                conts.append(future.result())
+            if errors:
+                raise errors[0]
+
+            conditions: list[GroupCondition] = []
+            for c, (wait_status, wait_log, wait_http) in zip(conts, waits, strict=True):
+                if wait_status:
+                    conditions.append(StatusCondition(c.cont, wait_status))
+                if wait_log:
+                    conditions.append(LogCondition(c.cont, wait_log))
+                if wait_http:
+                    conditions.append(HttpCondition(c.cont, *wait_http))
+            wait_for_group(conditions, timeout)
+
+            yield conts
+
+    return closure
@@ -0,0 +1,183 @@
+import contextlib
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Final
+
+import docker
+import docker.errors
+import docker.models.containers
+import requests
+
+from .helpers import container_client, container_id
+
+if TYPE_CHECKING:
+    from docker.types.daemon import CancellableStream
+
+# container events that can change the status of a container
+STATUS_ACTIONS: Final = frozenset(
+    {
+        "create",
+        "start",
+        "restart",
+        "pause",
+        "unpause",
+        "kill",
+        "die",
+        "oom",
+        "stop",
+        "destroy",
+        "health_status",
+    }
+)
+
+# Without an event stream, we poll.
+POLL_INTERVAL = 0.1
+
+# With an event stream, we still reload once in a while in case an event was
+# lost, for example when the clocks of the host and the daemon don't agree.
+FALLBACK_INTERVAL = 1.0
+
+
+# Subscribe once to the container events of a docker daemon, so that waiters
+# can sleep until something happens to the container they are looking at,
+# instead of inspecting it every 100ms.
+#
+# Each container has a generation number, increased on every event that
+# can change its status. A waiter remembers the generation before reloading
+# the container, then waits for it to change.
+class ContainerEvents:
+    def __init__(self, client: docker.DockerClient) -> None:
+        self.client: Final = client
+        # notified on every event and when the stream connects or breaks
+        self.changed: Final = threading.Condition()
+        self.connected: bool = False
+        self._generations: dict[str, int] = {}
+        self._thread: threading.Thread | None = None
+        self._stream: CancellableStream[dict[str, Any]] | None = None  # pyright:ignore[reportExplicitAny]
+        self._closed: bool = False
+        # set along with the notification, for waiters that watch several sources
+        self._listeners: Final[set[threading.Event]] = set()
+
+    def add_listener(self, event: threading.Event) -> None:
+        with self.changed:
+            self._listeners.add(event)
+
+    def remove_listener(self, event: threading.Event) -> None:
+        with self.changed:
+            self._listeners.discard(event)
+
+    # with self.changed held
+    def _notify(self) -> None:
+        self.changed.notify_all()
+        for event in self._listeners:
+            event.set()
+
+    def start(self) -> None:
+        with self.changed:
+            if self._closed or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="docker-events", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        # replay what happened while we were connecting
+        since = int(time.time()) - 1
+        try:
+            self._stream = self.client.events(decode=True, filters={"type": "container"}, since=since)
+            with self.changed:
+                if self._closed:
+                    self._stream.close()
+                self.connected = True
+                self._notify()
+            for event in self._stream:
+                # "health_status: healthy"
+                action = event.get("Action", "").split(":")[0]
+                if action not in STATUS_ACTIONS:
+                    continue
+                cont_id = event.get("Actor", {}).get("ID") or event.get("id")
+                if not cont_id:
+                    continue
+                with self.changed:
+                    self._generations[cont_id] = self._generations.get(cont_id, 0) + 1
+                    self._notify()
+        except (docker.errors.DockerException, requests.exceptions.RequestException):
+            # the waiters will poll
+            pass
+        finally:
+            with self.changed:
+                self.connected = False
+                self._notify()
+
+    def generation(self, cont_id: str) -> int:
+        with self.changed:
+            return self._generations.get(cont_id, 0)
+
+    def wait(self, cont_id: str, generation: int, timeout: float) -> bool:
+        """Sleep until there is an event for the container after the given generation.
+
+        Return False on timeout. Without a working event stream, this is a short sleep.
+        """
+        with self.changed:
+            connected = self.connected
+            timeout = min(timeout, FALLBACK_INTERVAL if connected else POLL_INTERVAL)
+            return self.changed.wait_for(
+                lambda: self._generations.get(cont_id, 0) != generation or self.connected != connected,
+                timeout,
+            )
+
+    def close(self) -> None:
+        with self.changed:
+            self._closed = True
+            stream = self._stream
+        if stream is not None:
+            with contextlib.suppress(docker.errors.DockerException, OSError):
+                stream.close()
+        if self._thread is not None:
+            self._thread.join(1)
+
+
+_event_streams: dict[int, ContainerEvents] = {}
+_event_streams_lock = threading.Lock()
+
+
+# Return the event subscription for a docker client, (re)connecting if needed.
+def container_events(client: docker.DockerClient) -> ContainerEvents:
+    with _event_streams_lock:
+        events = _event_streams.get(id(client))
+        if events is None:
+            events = _event_streams[id(client)] = ContainerEvents(client)
+    events.start()
+    return events
+
+
+def close_container_events(client: docker.DockerClient) -> None:
+    with _event_streams_lock:
+        events = _event_streams.pop(id(client), None)
+    if events is not None:
+        events.close()
+
+
+# Reload a container only if something happened to it,
+# or if we can't rely on the event stream.
+class ContainerRefresher:
+    def __init__(self, cont: docker.models.containers.Container) -> None:
+        self.cont: Final = cont
+        self.cont_id: Final = container_id(cont)
+        self.events: Final = container_events(container_client(cont))
+        self.generation: int | None = None  # at the last reload
+        self._reloaded_at: float = 0
+
+    def refresh(self) -> None:
+        generation = self.events.generation(self.cont_id)
+        now = time.monotonic()
+        if not self.events.connected or generation != self.generation or now - self._reloaded_at >= FALLBACK_INTERVAL:
+            self.cont.reload()
+            self.generation = generation
+            self._reloaded_at = now
+
+    # sleep, but wake up as soon as something happens to the container
+    def wait(self, delay: float) -> None:
+        if self.generation is None:
+            time.sleep(delay)
+            return
+        _ = self.events.wait(self.cont_id, self.generation, delay)
@@ -0,0 +1,186 @@
+import contextlib
+import secrets
+from collections.abc import Iterator, Sequence
+from typing import Any, Final, NamedTuple, Self
+
+import docker.models.containers
+import docker.utils.socket
+
+from .helpers import container_client, container_id, demuxed
+
+# Run many commands in a container without paying for an exec instance
+# (create, attach, inspect) per command.
+#
+# exec_batch() sends all the commands in a single shell script, and splits
+# the output with random markers:
+#
+#   results = exec_batch(cont, ["cscli bouncers add b1", "cscli machines list -o json"])
+#   assert all(r.exit_code == 0 for r in results)
+#
+# ExecSession keeps a shell open for tests that run hundreds of commands,
+# one at a time:
+#
+#   with ExecSession(cont) as sh:
+#       res = sh.run("cscli decisions list -o json")
+
+STDOUT = 1
+STDERR = 2
+
+DEFAULT_SESSION_TIMEOUT = 60
+
+
+class ExecResult(NamedTuple):
+    command: str
+    exit_code: int
+    stdout: str
+    stderr: str
+
+
+def _marker() -> str:
+    return f"pytest-cs-{secrets.token_hex(8)}"
+
+
+# Each command runs in a subshell, so 'exit' or 'cd' don't affect the next ones,
+# and without stdin, so it doesn't read the following commands.
+def batch_script(commands: Sequence[str], marker: str, *, stop_on_error: bool = False) -> str:
+    lines: list[str] = []
+    for i, cmd in enumerate(commands):
+        lines += [
+            f"printf '%s:begin:{i}\\n' {marker}; printf '%s:begin:{i}\\n' {marker} >&2",
+            f"( {cmd}\n) </dev/null; rc=$?",
+            f"printf '\\n%s:end:{i}:%d\\n' {marker} $rc; printf '\\n%s:end:{i}\\n' {marker} >&2",
+        ]
+        if stop_on_error:
+            lines.append('[ "$rc" -eq 0 ] || exit "$rc"')
+    return "\n".join(lines) + "\n"
+
+
+def _section(output: str, begin: str, end: str) -> tuple[str, str] | None:
+    """Return the text between the markers, and what follows the end marker on its line."""
+    start = output.find(begin)
+    if start < 0:
+        return None
+    start += len(begin)
+    stop = output.find(end, start)
+    if stop < 0:
+        return None
+    rest = output[stop + len(end) :].split("\n", 1)[0]
+    return output[start:stop], rest
+
+
+def parse_batch_output(commands: Sequence[str], marker: str, stdout: str, stderr: str) -> list[ExecResult]:
+    """Split the output of batch_script() per command. Stop at the first one that didn't complete."""
+    results: list[ExecResult] = []
+    for i, cmd in enumerate(commands):
+        out = _section(stdout, f"{marker}:begin:{i}\n", f"\n{marker}:end:{i}:")
+        err = _section(stderr, f"{marker}:begin:{i}\n", f"\n{marker}:end:{i}\n")
+        if out is None:
+            break
+        text, rc = out
+        results.append(ExecResult(cmd, int(rc), text, err[0] if err is not None else ""))
+    return results
+
+
+def exec_batch(
+    cont: docker.models.containers.Container,
+    commands: Sequence[str],
+    *,
+    stop_on_error: bool = False,
+    **kwargs: Any,  # pyright:ignore[reportExplicitAny]
+) -> list[ExecResult]:
+    """Run the commands in a single exec instance, return their results.
+
+    With stop_on_error, the commands after the first failure are not run (nor returned).
+    Extra arguments are passed to exec_run (user, environment, workdir...).
+    """
+    if not commands:
+        return []
+    marker = _marker()
+    script = batch_script(commands, marker, stop_on_error=stop_on_error)
+    res = cont.exec_run(["sh", "-c", script], demux=True, **kwargs)
+    stdout, stderr = demuxed(res.output)
+    results = parse_batch_output(commands, marker, stdout.decode(errors="replace"), stderr.decode(errors="replace"))
+    if len(results) < len(commands) and not (stop_on_error and results and results[-1].exit_code != 0):
+        msg = f"exec batch interrupted (exit code {res.exit_code}) after {len(results)} of {len(commands)} commands"
+        raise RuntimeError(msg)
+    return results
+
+
+class ExecSession:
+    def __init__(
+        self,
+        cont: docker.models.containers.Container,
+        timeout: float = DEFAULT_SESSION_TIMEOUT,
+        **kwargs: Any,  # pyright:ignore[reportExplicitAny]
+    ) -> None:
+        self.cont: Final = cont
+        self.timeout: Final = timeout
+        self.kwargs: Final = kwargs  # for exec_create (user, environment, workdir...)
+        self.marker: Final = _marker()
+        self._sock: Any = None  # pyright:ignore[reportExplicitAny]
+        self._raw: Any = None  # pyright:ignore[reportExplicitAny]
+
+    def open(self) -> None:
+        api = container_client(self.cont).api
+        exec_id = api.exec_create(container_id(self.cont), ["sh"], stdin=True, stdout=True, stderr=True, **self.kwargs)[
+            "Id"
+        ]
+        self._sock = api.exec_start(exec_id, socket=True)
+        # SocketIO over a unix socket, or the socket itself
+        self._raw = getattr(self._sock, "_sock", self._sock)
+        self._raw.settimeout(self.timeout)
+
+    def __enter__(self) -> Self:
+        self.open()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def _read_frame(self) -> tuple[int, bytes]:
+        stream, size = docker.utils.socket.next_frame_header(self._sock)
+        if stream < 0:
+            msg = "exec session closed by the container"
+            raise EOFError(msg)
+        return stream, docker.utils.socket.read_exactly(self._sock, size)
+
+    def run(self, command: str) -> ExecResult:
+        if self._raw is None:
+            msg = "exec session is not open"
+            raise RuntimeError(msg)
+        m = self.marker
+        script = f"( {command}\n) </dev/null; rc=$?; printf '\\n%s:end:%d\\n' {m} $rc; printf '\\n%s:end\\n' {m} >&2\n"
+        self._raw.sendall(script.encode())
+
+        out = bytearray()
+        err = bytearray()
+        out_end = f"\n{m}:end:".encode()
+        err_end = f"\n{m}:end\n".encode()
+        while True:
+            done_out = (pos := out.find(out_end)) >= 0 and out.find(b"\n", pos + len(out_end)) >= 0
+            if done_out and err.endswith(err_end):
+                break
+            stream, data = self._read_frame()
+            (out if stream == STDOUT else err).extend(data)
+
+        pos = out.find(out_end)
+        rc = out[pos + len(out_end) :].split(b"\n", 1)[0]
+        return ExecResult(
+            command,
+            int(rc),
+            out[:pos].decode(errors="replace"),
+            err[: -len(err_end)].decode(errors="replace"),
+        )
+
+    def run_all(self, commands: Sequence[str]) -> Iterator[ExecResult]:
+        for cmd in commands:
+            yield self.run(cmd)
+
+    def close(self) -> None:
+        if self._raw is None:
+            return
+        with contextlib.suppress(OSError):
+            self._raw.sendall(b"exit\n")
+        with contextlib.suppress(OSError):
+            self._sock.close()
+        self._raw = None
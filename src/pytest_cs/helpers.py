@@ -1,4 +1,12 @@
 import os
+import pathlib
+from collections.abc import Callable
+
+import docker
+import docker.models.containers
+
+# ApiKeyFactoryType = Callable[[], str] | Callable[[str], str]
+ApiKeyFactoryType = Callable[..., str]
 
 
 def default_timeout() -> float:
@@ -8,3 +16,67 @@ def default_timeout() -> float:
     except ValueError:
         msg = f"Invalid CROWDSEC_TEST_TIMEOUT ({t}): must be a number (integer or float)"
         raise ValueError(msg) from None
+
+
+def env_int(name: str, default: int) -> int:
+    n = os.getenv(name, str(default))
+    try:
+        return int(n)
+    except ValueError:
+        msg = f"Invalid {name} ({n}): must be an integer"
+        raise ValueError(msg) from None
+
+
+def pool_size() -> int:
+    return env_int("CROWDSEC_TEST_POOL_SIZE", 0)
+
+
+def env_bool(name: str, default: bool) -> bool:  # noqa: FBT001
+    v = os.getenv(name)
+    if v is None or v == "":
+        return default
+    if v.lower() in ("1", "true", "yes"):
+        return True
+    if v.lower() in ("0", "false", "no"):
+        return False
+    msg = f"Invalid {name} ({v}): must be true or false"
+    raise ValueError(msg)
+
+
+def current_nodeid() -> str:
+    # "tests/test_foo.py::test_bar (call)"
+    return os.environ.get("PYTEST_CURRENT_TEST", "").rsplit(" ", 1)[0]
+
+
+# Where to keep things across sessions (derived images index, certificates, packages)
+def cache_dir() -> pathlib.Path:
+    if d := os.getenv("CROWDSEC_TEST_CACHE_DIR"):
+        return pathlib.Path(d)
+    xdg = os.getenv("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(xdg) / "pytest-cs"
+
+
+# stdout and stderr of exec_run(..., demux=True), None if nothing was written
+def demuxed(output: object) -> tuple[bytes, bytes]:
+    match output:
+        case (bytes() | None as stdout, bytes() | None as stderr):
+            return stdout or b"", stderr or b""
+        case _:
+            msg = f"unexpected exec output: {type(output).__name__}"
+            raise TypeError(msg)
+
+
+# docker-py types the id and client of a container as optional, they are
+# only None for a model that was not returned by the API.
+def container_id(cont: docker.models.containers.Container) -> str:
+    if cont.id is None:
+        msg = "container has no id"
+        raise ValueError(msg)
+    return cont.id
+
+
+def container_client(cont: docker.models.containers.Container) -> docker.DockerClient:
+    if cont.client is None:
+        msg = "container has no docker client"
+        raise ValueError(msg)
+    return cont.client
@@ -0,0 +1,80 @@
+import contextlib
+import hashlib
+import json
+import time
+from collections.abc import Callable, Mapping
+from typing import Any, Final
+
+import docker
+import docker.errors
+
+from .helpers import cache_dir, env_int
+from .parallel import file_lock, user_lock_path
+
+CACHE_REPOSITORY: Final = "pytest-cs-cache"
+
+# the recipe runs in a container created with these, they can change what ends up in the image
+KEY_OPTIONS: Final = ("environment", "volumes", "command", "entrypoint")
+
+
+# Cache of images derived from a base image by running a setup recipe
+# (a list of commands) in a container and committing the result.
+#
+# The key is a hash of the base image id, the recipe and what the container
+# is created with (environment, volumes, command, entrypoint), so a new base
+# image or a different recipe gets a new entry. Entries are tracked in an
+# index file with their last use, and the least recently used images are
+# removed when there are more than CROWDSEC_TEST_IMAGE_CACHE_SIZE.
+class ImageCache:
+    def __init__(self, docker_client: docker.DockerClient, max_entries: int | None = None) -> None:
+        self.docker_client: Final = docker_client
+        self.max_entries: Final = (
+            max_entries if max_entries is not None else env_int("CROWDSEC_TEST_IMAGE_CACHE_SIZE", 10)
+        )
+        self.index_path: Final = cache_dir() / "images.json"
+
+    @staticmethod
+    def key(base_image_id: str, recipe: list[str], create_kw: Mapping[str, object]) -> str:
+        options = {k: create_kw.get(k) for k in KEY_OPTIONS}
+        doc = json.dumps([base_image_id, recipe, options], sort_keys=True, default=str)
+        return hashlib.sha256(doc.encode()).hexdigest()
+
+    def _load_index(self) -> dict[str, dict[str, Any]]:  # pyright:ignore[reportExplicitAny]
+        try:
+            return json.loads(self.index_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self, index: dict[str, dict[str, Any]]) -> None:  # pyright:ignore[reportExplicitAny]
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".tmp")
+        _ = tmp.write_text(json.dumps(index, indent=2))
+        _ = tmp.replace(self.index_path)
+
+    def _exists(self, tag: str) -> bool:
+        try:
+            _ = self.docker_client.images.get(tag)
+        except docker.errors.ImageNotFound:
+            return False
+        return True
+
+    # Return the tag of the derived image, calling build(tag) if it's not cached yet.
+    def get(self, key: str, build: Callable[[str], None]) -> str:
+        tag = f"{CACHE_REPOSITORY}:{key[:16]}"
+        # one build at a time for a given key, across sessions
+        with file_lock(user_lock_path(f"image-{key}")):
+            if not self._exists(tag):
+                build(tag)
+        self._touch(key, tag)
+        return tag
+
+    def _touch(self, key: str, tag: str) -> None:
+        with file_lock(user_lock_path("image-index")):
+            index = self._load_index()
+            index[key] = {"tag": tag, "last_used": time.time()}
+            by_age = sorted(index, key=lambda k: index[k]["last_used"], reverse=True)
+            for old in by_age[max(self.max_entries, 1) :]:
+                with contextlib.suppress(docker.errors.APIError):
+                    self.docker_client.images.remove(index[old]["tag"], force=True)
+                del index[old]
+            self._save_index(index)
@@ -6,6 +6,8 @@ from collections.abc import Iterator
 
 import pytest
 
+from .timings import phase
+
 keep_kind_cluster = True
 
 
@@ -43,7 +45,10 @@ def kind(tmp_path_factory: pytest.TempPathFactory) -> Iterator[None]:
     clusters = subprocess.run(["kind", "get", "clusters"], stdout=subprocess.PIPE, encoding="utf-8", check=True)
     out = clusters.stdout.splitlines()
     if "No kind clusters found" in out or name not in out:
-        _ = subprocess.run(["kind", "create", "cluster", "--name", name, "--config", kind_yml.as_posix()], check=True)
+        with phase("kind create cluster"):
+            _ = subprocess.run(
+                ["kind", "create", "cluster", "--name", name, "--config", kind_yml.as_posix()], check=True
+            )
 
     try:
         yield
@@ -62,10 +67,12 @@ def helm(kind):  # pyright:ignore[reportUnusedParameter]  # noqa: ARG001
         cmd = ["helm", "install", "--create-namespace", release, chart, "--namespace", namespace]
         if values:
             cmd += ["-f", values.as_posix()]
-        _ = subprocess.run(cmd, check=True)
+        with phase("helm install"):
+            _ = subprocess.run(cmd, check=True)
         try:
             yield release
         finally:
-            _ = subprocess.run(["helm", "uninstall", release, "--namespace", namespace], check=True)
+            with phase("helm uninstall"):
+                _ = subprocess.run(["helm", "uninstall", release, "--namespace", namespace], check=True)
 
     return closure
@@ -1,11 +1,292 @@
 import json
 import subprocess
+import threading
+import time
+from collections.abc import Callable, Hashable, Iterable, Iterator, Sequence
+from typing import Any, Final, Generic, NamedTuple, Protocol, TypeVar
+
+import docker.models.containers
+
+from pytest_cs.helpers import demuxed
+
+# Query cscli from the tests, on the host or in a container.
+#
+#   cscli = Cscli.in_container(cont)        # or Cscli() for the host
+#   cscli.run("bouncers", "add", "b1", "-k", "secret")
+#   b1 = cscli.bouncers().first(name="b1")
+#   banned = cscli.decisions().where(scope="Ip", type="ban")
+#   either = cscli.decisions().where_any(value="1.2.3.4", origin="lists")
+#
+# The results of the list commands are parsed into records and kept for `ttl`
+# seconds, so that a wait loop polling every 100ms does not run cscli (and
+# parse its output) every time. Commands run with run() invalidate the cache;
+# changes made outside of this object are seen after the ttl or with
+# refresh=True.
+
+DEFAULT_TTL = 1.0
+
+# cscli subcommands that don't change anything
+_read_only: Final = frozenset({"list", "inspect", "metrics", "version", "explain", "status"})
+
+Runner = Callable[[Sequence[str]], str]
+
+
+def host_runner(args: Sequence[str]) -> str:
+    return subprocess.check_output(["cscli", *args], encoding="utf8")
+
+
+def container_runner(cont: docker.models.containers.Container) -> Runner:
+    def run(args: Sequence[str]) -> str:
+        cmd = ["cscli", *args]
+        res = cont.exec_run(cmd, demux=True)
+        stdout, stderr = demuxed(res.output)
+        out = stdout.decode()
+        if res.exit_code != 0:
+            # None if it could not be inspected
+            rc = res.exit_code if res.exit_code is not None else -1
+            raise subprocess.CalledProcessError(rc, cmd, out, stderr.decode())
+        return out
+
+    return run
+
+
+class Bouncer(NamedTuple):
+    name: str
+    ip_address: str
+    type: str
+    version: str
+    auth_type: str
+    revoked: bool
+    last_pull: str | None
+    raw: dict[str, Any]  # pyright:ignore[reportExplicitAny]
+
+    @classmethod
+    def from_json(cls, d: dict[str, Any]) -> "Bouncer":  # pyright:ignore[reportExplicitAny]
+        return cls(
+            d.get("name", ""),
+            d.get("ip_address", ""),
+            d.get("type", ""),
+            d.get("version", ""),
+            d.get("auth_type", ""),
+            bool(d.get("revoked")),
+            d.get("last_pull"),
+            d,
+        )
+
+
+class Machine(NamedTuple):
+    name: str
+    ip_address: str
+    version: str
+    auth_type: str
+    is_validated: bool
+    last_heartbeat: str | None
+    raw: dict[str, Any]  # pyright:ignore[reportExplicitAny]
+
+    @classmethod
+    def from_json(cls, d: dict[str, Any]) -> "Machine":  # pyright:ignore[reportExplicitAny]
+        return cls(
+            d.get("machineId", ""),
+            d.get("ipAddress", ""),
+            d.get("version", ""),
+            d.get("auth_type", ""),
+            bool(d.get("isValidated")),
+            d.get("last_heartbeat"),
+            d,
+        )
+
+
+class Decision(NamedTuple):
+    id: int
+    alert_id: int
+    origin: str
+    scenario: str
+    scope: str
+    value: str
+    type: str
+    duration: str
+    raw: dict[str, Any]  # pyright:ignore[reportExplicitAny]
+
+    @classmethod
+    def from_json(cls, d: dict[str, Any], alert_id: int = 0) -> "Decision":  # pyright:ignore[reportExplicitAny]
+        return cls(
+            d.get("id", 0),
+            alert_id,
+            d.get("origin", ""),
+            d.get("scenario", ""),
+            d.get("scope", ""),
+            d.get("value", ""),
+            d.get("type", ""),
+            d.get("duration", ""),
+            d,
+        )
+
+
+class Alert(NamedTuple):
+    id: int
+    scenario: str
+    scope: str
+    value: str
+    decisions: list[Decision]
+    raw: dict[str, Any]  # pyright:ignore[reportExplicitAny]
+
+    @classmethod
+    def from_json(cls, d: dict[str, Any]) -> "Alert":  # pyright:ignore[reportExplicitAny]
+        alert_id = d.get("id", 0)
+        source = d.get("source") or {}
+        return cls(
+            alert_id,
+            d.get("scenario", ""),
+            source.get("scope", ""),
+            source.get("value", ""),
+            [Decision.from_json(dec, alert_id) for dec in d.get("decisions") or []],
+            d,
+        )
+
+
+class _Record(Protocol):
+    @property
+    def raw(self) -> dict[str, Any]: ...  # pyright:ignore[reportExplicitAny]
+
+    def _asdict(self) -> dict[str, Any]: ...  # pyright:ignore[reportExplicitAny]
+
+
+T = TypeVar("T", bound=_Record)
+
+
+# a field of the record, or of the json it was parsed from
+def _field(record: _Record, field: str) -> object:
+    fields = record._asdict()
+    return fields[field] if field in fields else record.raw.get(field)
+
+
+# json arrays and objects can't be dict keys, they are looked up as tuples and frozensets
+def _hashable(value: object) -> Hashable:
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return frozenset((k, _hashable(v)) for k, v in value.items())
+    return value
+
+
+class Records(Generic[T]):
+    """A list of records, with an index per field built on the first lookup."""
+
+    def __init__(self, records: Iterable[T]) -> None:
+        self.records: Final = list(records)
+        self._indexes: Final[dict[str, dict[Hashable, list[int]]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self.records)
+
+    def __getitem__(self, i: int) -> T:
+        return self.records[i]
+
+    def _index(self, field: str) -> dict[Hashable, list[int]]:
+        index = self._indexes.get(field)
+        if index is None:
+            index = {}
+            for i, r in enumerate(self.records):
+                index.setdefault(_hashable(_field(r, field)), []).append(i)
+            self._indexes[field] = index
+        return index
+
+    def _positions(self, field: str, value: object) -> list[int]:
+        return self._index(field).get(_hashable(value), [])
+
+    def where(self, **fields: object) -> list[T]:
+        """The records matching all the fields."""
+        if not fields:
+            return list(self.records)
+        candidates = sorted((self._positions(k, v) for k, v in fields.items()), key=len)
+        matching = set(candidates[0]).intersection(*candidates[1:])
+        return [self.records[i] for i in sorted(matching)]
+
+    def where_any(self, **fields: object) -> list[T]:
+        """The records matching at least one of the fields."""
+        matching: set[int] = set()
+        for k, v in fields.items():
+            matching.update(self._positions(k, v))
+        return [self.records[i] for i in sorted(matching)]
+
+    def first(self, **fields: object) -> T | None:
+        found = self.where(**fields)
+        return found[0] if found else None
+
+
+class Cscli:
+    def __init__(self, runner: Runner = host_runner, ttl: float = DEFAULT_TTL) -> None:
+        self.runner: Final = runner
+        self.ttl: Final = ttl
+        self._cache: Final[dict[tuple[str, ...], tuple[float, Records[Any]]]] = {}  # pyright:ignore[reportExplicitAny]
+        self._lock: Final = threading.Lock()
+
+    @classmethod
+    def in_container(cls, cont: docker.models.containers.Container, ttl: float = DEFAULT_TTL) -> "Cscli":
+        return cls(container_runner(cont), ttl)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def run(self, *args: str) -> str:
+        """Run a cscli command. Unless it's read-only, forget the cached results."""
+        try:
+            return self.runner(args)
+        finally:
+            # the verb: "decisions list", "version"
+            if _read_only.isdisjoint(args[:2]):
+                self.invalidate()
+
+    def json(self, *args: str) -> Any:  # pyright:ignore[reportExplicitAny]
+        return json.loads(self.run(*args, "-o", "json"))
+
+    def _query(
+        self,
+        args: tuple[str, ...],
+        parse: Callable[[Any], Iterable[T]],  # pyright:ignore[reportExplicitAny]
+        *,
+        refresh: bool,
+    ) -> Records[T]:
+        now = time.monotonic()
+        if not refresh:
+            with self._lock:
+                cached = self._cache.get(args)
+            if cached is not None and now - cached[0] < self.ttl:
+                return cached[1]
+        records = Records(parse(self.json(*args) or []))
+        with self._lock:
+            self._cache[args] = (now, records)
+        return records
+
+    def bouncers(self, *, refresh: bool = False) -> Records[Bouncer]:
+        return self._query(("bouncers", "list"), lambda out: map(Bouncer.from_json, out), refresh=refresh)
+
+    def machines(self, *, refresh: bool = False) -> Records[Machine]:
+        return self._query(("machines", "list"), lambda out: map(Machine.from_json, out), refresh=refresh)
+
+    def alerts(self, *args: str, refresh: bool = False) -> Records[Alert]:
+        """cscli alerts list, args are passed as filters (--scenario, --since...)."""
+        return self._query(("alerts", "list", *args), lambda out: map(Alert.from_json, out), refresh=refresh)
+
+    def decisions(self, *args: str, refresh: bool = False) -> Records[Decision]:
+        """cscli decisions list, args are passed as filters (--ip, --origin...)."""
+        return self._query(
+            ("decisions", "list", *args),
+            lambda out: (dec for alert in map(Alert.from_json, out) for dec in alert.decisions),
+            refresh=refresh,
+        )
 
 
 def get_bouncers(**kw: dict[str, str]):
-    """Lookup bouncers by key=value."""
-    out = subprocess.check_output(["cscli", "bouncers", "list", "-o", "json"], encoding="utf8")
-    for bouncer in json.loads(out):
+    """Lookup bouncers by key=value.
+
+    A bouncer is returned once for each key that matches. A key that is not in the json raises KeyError.
+    """
+    for bouncer in Cscli(ttl=0).bouncers():
         for key, value in kw.items():
-            if bouncer[key] == value:
-                yield bouncer
+            if bouncer.raw[key] == value:
+                yield bouncer.raw
@@ -0,0 +1,284 @@
+import array
+import bisect
+import ipaddress
+import json
+import random
+import socket
+import struct
+from collections.abc import Iterable, Iterator, Mapping
+from typing import Any, Final
+
+# Generate large sets of decisions, for bouncer scale tests.
+#
+# The decisions are kept in parallel arrays (about 28 bytes each) instead of
+# a list of dicts, and can be encoded as a LAPI stream response chunk by
+# chunk, so that a million decisions never exist as python objects at once.
+#
+#   decisions = generate_decisions(100_000, seed=42)
+#   with open("stream.json", "wb") as f:
+#       for chunk in encode_stream([(1, decisions)]):
+#           f.write(chunk)
+
+# kinds of values
+IPV4: Final = 0
+IPV6: Final = 1
+RANGE4: Final = 2
+RANGE6: Final = 3
+COUNTRY: Final = 4
+AS: Final = 5
+
+KINDS: Final = {"ipv4": IPV4, "ipv6": IPV6, "range4": RANGE4, "range6": RANGE6, "country": COUNTRY, "as": AS}
+KIND_SCOPES: Final = ("Ip", "Ip", "Range", "Range", "Country", "AS")
+
+DEFAULT_MIX: Final = {"ipv4": 0.7, "ipv6": 0.1, "range4": 0.1, "range6": 0.05, "country": 0.03, "as": 0.02}
+DEFAULT_DURATIONS: Final = (3600, 4 * 3600, 24 * 3600, 7 * 24 * 3600)
+DEFAULT_ORIGINS: Final = ("crowdsec", "cscli", "CAPI", "lists")
+
+COUNTRIES: Final = (
+    "AR", "AU", "BR", "CA", "CN", "DE", "ES", "FR", "GB", "ID",
+    "IN", "IR", "IT", "JP", "KR", "MX", "NL", "PL", "RU", "SE",
+    "SG", "TR", "UA", "US", "VN", "ZA",
+)  # fmt: skip
+
+# 2001:db8::/32, reserved for documentation
+IPV6_PREFIX: Final = 0x20010DB8 << 32
+
+# IPv4 networks that are not reachable on the internet (private, shared,
+# loopback, link-local, documentation, benchmarking), the generated
+# addresses are drawn around them
+RESERVED4: Final = tuple(
+    ipaddress.IPv4Network(net)
+    for net in (
+        "10.0.0.0/8",
+        "100.64.0.0/10",
+        "127.0.0.0/8",
+        "169.254.0.0/16",
+        "172.16.0.0/12",
+        "192.0.0.0/24",
+        "192.0.2.0/24",
+        "192.168.0.0/16",
+        "198.18.0.0/15",
+        "198.51.100.0/24",
+        "203.0.113.0/24",
+    )
+)
+
+# how many decisions per chunk of json
+CHUNK_SIZE = 1000
+
+
+def go_duration(seconds: float) -> str:
+    """Format a duration like Go's time.Duration.String() (i.e. 3h59m58.5s)."""
+    seconds = max(seconds, 0)
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{int(h)}h{int(m)}m{s:.3f}s"
+
+
+class DecisionSet:
+    def __init__(self, origins: Iterable[str] = DEFAULT_ORIGINS, types: Iterable[str] = ("ban",)) -> None:
+        self.origins: Final = tuple(origins)
+        self.types: Final = tuple(types)
+        self.kind: Final = array.array("B")
+        # the value: an IPv4 address or network, the high and low 64 bits of
+        # an IPv6 address or network, an index in COUNTRIES or an AS number
+        self.hi: Final = array.array("Q")
+        self.lo: Final = array.array("Q")
+        self.prefix: Final = array.array("B")  # for ranges
+        self.duration: Final = array.array("L")  # seconds
+        self.origin: Final = array.array("B")  # index in origins
+        self.type: Final = array.array("B")  # index in types
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    @property
+    def nbytes(self) -> int:
+        columns = (self.kind, self.hi, self.lo, self.prefix, self.duration, self.origin, self.type)
+        return sum(c.itemsize * len(c) for c in columns)
+
+    def scope(self, i: int) -> str:
+        return KIND_SCOPES[self.kind[i]]
+
+    def value(self, i: int) -> str:
+        kind = self.kind[i]
+        if kind in {IPV4, RANGE4}:
+            ip = socket.inet_ntoa(struct.pack("!I", self.lo[i]))
+            return ip if kind == IPV4 else f"{ip}/{self.prefix[i]}"
+        if kind in {IPV6, RANGE6}:
+            ip = socket.inet_ntop(socket.AF_INET6, struct.pack("!QQ", self.hi[i], self.lo[i]))
+            return ip if kind == IPV6 else f"{ip}/{self.prefix[i]}"
+        if kind == COUNTRY:
+            return COUNTRIES[self.lo[i]]
+        return str(self.lo[i])
+
+    def decision(self, i: int, id_: int) -> dict[str, Any]:  # pyright:ignore[reportExplicitAny]
+        """Return a decision as the LAPI would."""
+        origin = self.origins[self.origin[i]]
+        return {
+            "id": id_,
+            "duration": go_duration(self.duration[i]),
+            "origin": origin,
+            "scenario": f"{origin}/synthetic",
+            "scope": self.scope(i),
+            "type": self.types[self.type[i]],
+            "value": self.value(i),
+        }
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:  # pyright:ignore[reportExplicitAny]
+        for i in range(len(self)):
+            yield self.decision(i, i + 1)
+
+    # Encode the decisions [start:end] as json objects, separated by commas,
+    # the ids starting from first_id + start.
+    # Only the scopes and origins in the filters are included, if given.
+    def encode(
+        self,
+        first_id: int,
+        start: int = 0,
+        end: int | None = None,
+        scopes: set[str] | None = None,
+        origins_filter: set[str] | None = None,
+    ) -> str:
+        if end is None:
+            end = len(self)
+        # the json strings are computed once
+        origins = [json.dumps(o) for o in self.origins]
+        scenarios = [json.dumps(f"{o}/synthetic") for o in self.origins]
+        types = [json.dumps(t) for t in self.types]
+        durations: dict[int, str] = {}
+        parts: list[str] = []
+        for i in range(start, end):
+            scope = KIND_SCOPES[self.kind[i]]
+            if scopes is not None and scope.lower() not in scopes:
+                continue
+            o = self.origin[i]
+            if origins_filter is not None and self.origins[o] not in origins_filter:
+                continue
+            seconds = self.duration[i]
+            duration = durations.get(seconds)
+            if duration is None:
+                duration = durations[seconds] = go_duration(seconds)
+            head = f'{{"id":{first_id + i},"duration":"{duration}","origin":{origins[o]},"scenario":{scenarios[o]},'
+            parts.append(f'{head}"scope":"{scope}","type":{types[self.type[i]]},"value":"{self.value(i)}"}}')
+        return ",".join(parts)
+
+
+def _unique(rng: random.Random, low: int, high: int, k: int) -> list[int]:
+    return rng.sample(range(low, high), k)
+
+
+# Unique public IPv4 addresses, or /24 networks with shift=8 (the address >> 8),
+# in 1.0.0.0 - 223.255.255.255 (no multicast or reserved) outside of RESERVED4.
+# The indexes are drawn from the public space only, then mapped to the
+# address: no rejection, and the sample stays unique.
+def _unique_public4(rng: random.Random, k: int, shift: int = 0) -> list[int]:
+    starts: list[int] = []  # first index of each public block
+    bases: list[int] = []  # and its first address
+    index, addr = 0, 1 << (24 - shift)
+    for net in [*RESERVED4, ipaddress.IPv4Network("224.0.0.0/3")]:
+        start = int(net.network_address) >> shift
+        starts.append(index)
+        bases.append(addr)
+        index += start - addr
+        addr = start + (net.num_addresses >> shift)
+    out: list[int] = []
+    for i in _unique(rng, 0, index, k):
+        block = bisect.bisect_right(starts, i) - 1
+        out.append(bases[block] + i - starts[block])
+    return out
+
+
+def _counts(n: int, mix: Mapping[str, float]) -> dict[int, int]:
+    total = sum(mix.values())
+    counts = {KINDS[name]: int(n * weight / total) for name, weight in mix.items()}
+    # what's left because of rounding
+    first = KINDS[next(iter(mix))]
+    counts[first] += n - sum(counts.values())
+    return counts
+
+
+def generate_decisions(  # noqa: PLR0913
+    n: int,
+    *,
+    mix: Mapping[str, float] = DEFAULT_MIX,
+    durations: Iterable[int] = DEFAULT_DURATIONS,
+    origins: Iterable[str] = DEFAULT_ORIGINS,
+    types: Iterable[str] = ("ban",),
+    seed: int | None = None,
+) -> DecisionSet:
+    """Generate n decisions. Addresses and networks are unique within their kind.
+
+    mix gives the proportion of each kind: ipv4, ipv6, range4 (/24), range6 (/64), country, as.
+    """
+    unknown = set(mix) - set(KINDS)
+    if unknown:
+        msg = f"unknown kinds of decisions: {', '.join(sorted(unknown))}"
+        raise ValueError(msg)
+    rng = random.Random(seed)  # noqa: S311
+    ds = DecisionSet(origins, types)
+
+    for kind, count in _counts(n, mix).items():
+        if count <= 0:
+            continue
+        hi: Iterable[int] = [0] * count
+        prefix: Iterable[int] = [0] * count
+        if kind == IPV4:
+            lo = _unique_public4(rng, count)
+        elif kind == RANGE4:
+            lo = [net << 8 for net in _unique_public4(rng, count, shift=8)]
+            prefix = [24] * count
+        elif kind == IPV6:
+            # spread over the prefix, unique by the interface id
+            hi = [IPV6_PREFIX | rng.getrandbits(32) for _ in range(count)]
+            lo = _unique(rng, 1, 1 << 62, count)
+        elif kind == RANGE6:
+            hi = [IPV6_PREFIX | net for net in _unique(rng, 0, 1 << 32, count)]
+            lo = [0] * count
+            prefix = [64] * count
+        elif kind == COUNTRY:
+            lo = rng.choices(range(len(COUNTRIES)), k=count)
+        else:
+            lo = rng.choices(range(1, 400_000), k=count)
+        ds.kind.extend([kind] * count)
+        ds.hi.extend(hi)
+        ds.lo.extend(lo)
+        ds.prefix.extend(prefix)
+
+    ds.duration.extend(rng.choices(tuple(durations), k=n))
+    ds.origin.extend(rng.choices(range(len(ds.origins)), k=n))
+    ds.type.extend(rng.choices(range(len(ds.types)), k=n))
+    return ds
+
+
+def encode_stream(  # noqa: PLR0913
+    bulk: Iterable[tuple[int, DecisionSet]],
+    *,
+    new: Iterable[dict[str, Any]] = (),  # pyright:ignore[reportExplicitAny]
+    deleted: Iterable[dict[str, Any]] = (),  # pyright:ignore[reportExplicitAny]
+    scopes: set[str] | None = None,
+    origins: set[str] | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Encode a /v1/decisions/stream response, a chunk at a time.
+
+    bulk is a list of (first id, decision set). new and deleted are decisions
+    as dicts, the new ones are put before the bulk decisions.
+    """
+    yield b'{"new":['
+    sep = ""
+    for d in new:
+        yield (sep + json.dumps(d, separators=(",", ":"))).encode()
+        sep = ","
+    for first_id, ds in bulk:
+        for start in range(0, len(ds), chunk_size):
+            chunk = ds.encode(first_id, start, min(start + chunk_size, len(ds)), scopes, origins)
+            if chunk:
+                yield (sep + chunk).encode()
+                sep = ","
+    yield b'],"deleted":['
+    sep = ""
+    for d in deleted:
+        yield (sep + json.dumps(d, separators=(",", ":"))).encode()
+        sep = ","
+    yield b"]}"
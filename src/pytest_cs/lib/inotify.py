@@ -0,0 +1,62 @@
+import contextlib
+import ctypes
+import ctypes.util
+import os
+import pathlib
+import select
+import sys
+from typing import Final
+
+# Minimal inotify binding, to sleep until a file is written to instead of
+# polling it. Only what the bouncer output waiters need.
+
+IN_MODIFY: Final = 0x00000002
+IN_CLOSE_WRITE: Final = 0x00000008
+IN_NONBLOCK: Final = os.O_NONBLOCK
+IN_CLOEXEC: Final = os.O_CLOEXEC
+
+
+def _libc() -> ctypes.CDLL | None:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+class FileWatcher:
+    def __init__(self, fd: int) -> None:
+        self.fd: Final = fd
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep until the file is modified. Return False on timeout."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # drain the queued events, we only care that there was at least one
+        with contextlib.suppress(BlockingIOError):
+            while os.read(self.fd, 4096):
+                pass
+        return True
+
+    def close(self) -> None:
+        with contextlib.suppress(OSError):
+            os.close(self.fd)
+
+
+# Return a watcher for the file, or None if inotify is not available.
+def watch_file(path: pathlib.Path) -> FileWatcher | None:
+    libc = _libc()
+    if libc is None:
+        return None
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(path), IN_MODIFY | IN_CLOSE_WRITE) < 0:
+        os.close(fd)
+        return None
+    return FileWatcher(fd)
@@ -0,0 +1,170 @@
+import bisect
+import datetime as dt
+import itertools
+import json
+import re
+from collections.abc import Callable, Iterable, Iterator
+from typing import NamedTuple
+
+from .text import nocolor
+
+# Parse crowdsec (logrus) log lines into structured records, in any of
+# the formats it can produce:
+#
+#   time="2024-01-02T15:04:05Z" level=info msg="Starting processing data" type=file
+#   INFO[2024-01-02T15:04:05Z] Starting processing data                    type=file
+#   {"level":"info","msg":"Starting processing data","time":"2024-01-02T15:04:05Z","type":"file"}
+#
+# Anything else becomes a record with only the message.
+
+
+class LogRecord(NamedTuple):
+    time: dt.datetime | None
+    level: str | None
+    msg: str
+    fields: dict[str, str]
+    line: str
+
+
+# key=value or key="quoted \" value"
+_field = r'[\w.\-]+=(?:"(?:[^"\\]|\\.)*"|\S*)'
+field_regex = re.compile(r'([\w.\-]+)=("(?:[^"\\]|\\.)*"|\S*)')
+text_regex = re.compile(rf"^(?:{_field})(?:\s+{_field})*\s*$")
+tty_regex = re.compile(rf"^(?P<level>[A-Z]{{4}})\[(?P<time>[^\]]*)\] (?P<msg>.*?)(?P<fields>(?:\s+{_field})*)\s*$")
+
+tty_levels = {
+    "TRAC": "trace",
+    "DEBU": "debug",
+    "INFO": "info",
+    "WARN": "warning",
+    "ERRO": "error",
+    "FATA": "fatal",
+    "PANI": "panic",
+}
+
+
+def _unquote(value: str) -> str:
+    if value.startswith('"'):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value[1:-1]
+    return value
+
+
+def _parse_time(value: str | None) -> dt.datetime | None:
+    if not value:
+        return None
+    try:
+        t = dt.datetime.fromisoformat(value)
+    except ValueError:
+        # relative time ("0000") or unknown format
+        return None
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=dt.UTC)
+    return t
+
+
+def _normalize_level(level: str | None) -> str | None:
+    if level == "warn":
+        return "warning"
+    return level
+
+
+def parse_line(line: str) -> LogRecord:
+    text = nocolor(line).strip()
+
+    if text.startswith("{"):
+        try:
+            doc = json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        else:
+            if isinstance(doc, dict):
+                fields = {k: v if isinstance(v, str) else json.dumps(v) for k, v in doc.items()}
+                t = fields.pop("time", None)
+                level = fields.pop("level", None)
+                msg = fields.pop("msg", "")
+                return LogRecord(_parse_time(t), _normalize_level(level), msg, fields, line)
+
+    if (m := tty_regex.match(text)) is not None:
+        fields = {k: _unquote(v) for k, v in field_regex.findall(m["fields"])}
+        return LogRecord(_parse_time(m["time"]), tty_levels.get(m["level"]), m["msg"].rstrip(), fields, line)
+
+    if "=" in text and text_regex.match(text):
+        fields = {k: _unquote(v) for k, v in field_regex.findall(text)}
+        t = fields.pop("time", None)
+        level = fields.pop("level", None)
+        msg = fields.pop("msg", "")
+        return LogRecord(_parse_time(t), _normalize_level(level), msg, fields, line)
+
+    return LogRecord(None, None, text, {}, line)
+
+
+# Append-only store of log records, indexed by level and by field value,
+# so that queries don't have to scan the whole log.
+class LogIndex:
+    def __init__(self) -> None:
+        self.records: list[LogRecord] = []
+        self.by_level: dict[str, list[int]] = {}
+        self.by_field: dict[str, dict[str, list[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def append(self, record: LogRecord) -> None:
+        pos = len(self.records)
+        self.records.append(record)
+        if record.level is not None:
+            self.by_level.setdefault(record.level, []).append(pos)
+        for key, value in record.fields.items():
+            self.by_field.setdefault(key, {}).setdefault(value, []).append(pos)
+
+    def extend(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.append(parse_line(line))
+
+    # Return the records matching all the conditions, in order.
+    # 'start' is a position in the store, to skip what was already looked at.
+    def find(
+        self,
+        *,
+        level: str | None = None,
+        since: dt.datetime | None = None,
+        predicate: Callable[[LogRecord], bool] | None = None,
+        start: int = 0,
+        **fields: str,
+    ) -> Iterator[LogRecord]:
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=dt.UTC)
+        # start from the shortest list of candidates, then check the rest on each record
+        candidates: list[list[int]] = []
+        if level is not None:
+            candidates.append(self.by_level.get(level, []))
+        candidates.extend(self.by_field.get(key, {}).get(value, []) for key, value in fields.items())
+        positions: Iterable[int] = range(start, len(self.records))
+        if candidates:
+            shortest = min(candidates, key=len)
+            positions = itertools.islice(shortest, bisect.bisect_left(shortest, start), None)
+        for pos in positions:
+            record = self.records[pos]
+            if level is not None and record.level != level:
+                continue
+            if any(record.fields.get(key) != value for key, value in fields.items()):
+                continue
+            if since is not None and (record.time is None or record.time < since):
+                continue
+            if predicate is not None and not predicate(record):
+                continue
+            yield record
+
+    def first(
+        self,
+        *,
+        level: str | None = None,
+        since: dt.datetime | None = None,
+        predicate: Callable[[LogRecord], bool] | None = None,
+        start: int = 0,
+        **fields: str,
+    ) -> LogRecord | None:
+        return next(self.find(level=level, since=since, predicate=predicate, start=start, **fields), None)
@@ -0,0 +1,46 @@
+import fnmatch
+import re
+from collections.abc import Iterable
+from typing import Final
+
+import pytest
+
+# Same semantics as LineMatcher.fnmatch_lines(): each pattern must match
+# a line (exactly, or as a glob), after the line matched by the previous one.
+#
+# The patterns are compiled once, and the matcher remembers how far it got,
+# so it can be fed only the lines added since the last call instead of
+# scanning the whole output every time.
+
+
+class OrderedMatcher:
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: Final = list(patterns)
+        self._regexes: Final = [re.compile(fnmatch.translate(p)) for p in self.patterns]
+        self.position: int = 0  # index of the next pattern to match
+
+    @property
+    def done(self) -> bool:
+        return self.position >= len(self.patterns)
+
+    @property
+    def pending(self) -> str | None:
+        """Return the next pattern to match, if any."""
+        return None if self.done else self.patterns[self.position]
+
+    def reset(self) -> None:
+        """Forget what was matched, to start over with new input."""
+        self.position = 0
+
+    def feed(self, lines: Iterable[str]) -> bool:
+        """Look for the pending patterns in the new lines. Return True once all have matched."""
+        for line in lines:
+            if self.done:
+                break
+            if line == self.patterns[self.position] or self._regexes[self.position].match(line):
+                self.position += 1
+        return self.done
+
+    def report(self, lines: list[str]) -> None:
+        """Fail with the detailed output of LineMatcher, given all the lines the matcher was fed."""
+        pytest.LineMatcher(lines).fnmatch_lines(self.patterns)
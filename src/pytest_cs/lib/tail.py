@@ -0,0 +1,51 @@
+import codecs
+import os
+import pathlib
+from typing import Final
+
+# Read a growing file incrementally: each call to read() returns only the
+# lines appended since the previous one. A trailing line without a newline
+# is kept aside until it's complete, and so are UTF-8 sequences split
+# across two reads.
+
+
+class FileTail:
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path: Final = path
+        self.offset: int = 0  # bytes read so far
+        self.lines: Final[list[str]] = []  # complete lines read so far
+        self.partial: str = ""  # start of the next line
+        self.resets: int = 0  # times the file was truncated or replaced
+        self._decoder: codecs.IncrementalDecoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def _reset(self) -> None:
+        self.resets += 1
+        self.offset = 0
+        self.lines.clear()
+        self.partial = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def read(self) -> list[str]:
+        """Return the complete lines appended to the file since the last call."""
+        try:
+            with self.path.open("rb") as f:
+                if os.fstat(f.fileno()).st_size < self.offset:
+                    # truncated or replaced, start over
+                    self._reset()
+                _ = f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        if not data:
+            return []
+        self.offset += len(data)
+        *new, self.partial = (self.partial + self._decoder.decode(data)).split("\n")
+        new = [line.removesuffix("\r") for line in new]
+        self.lines.extend(new)
+        return new
+
+    def all_lines(self) -> list[str]:
+        """Return all the lines read so far, including an incomplete last line."""
+        if self.partial:
+            return [*self.lines, self.partial]
+        return self.lines[:]
@@ -0,0 +1,83 @@
+import array
+import math
+import statistics
+from collections.abc import Iterable
+from typing import Final
+
+# A time series with a fixed set of numeric fields, stored in flat arrays
+# of doubles (8 bytes per value) instead of a list of dicts, so that long
+# runs with frequent samples stay small.
+
+
+class TimeSeries:
+    def __init__(self, fields: Iterable[str]) -> None:
+        self.fields: Final = tuple(fields)
+        self.times: Final = array.array("d")
+        self._columns: Final = {name: array.array("d") for name in self.fields}
+        # kept apart from the columns, so that they're exact after downsampling
+        self._peaks: Final[dict[str, float]] = {}
+        self._first: Final[dict[str, float]] = {}
+        self._last: Final[dict[str, float]] = {}
+        self._end: float = 0  # time of the last sample
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def append(self, t: float, **values: float) -> None:
+        """Add a sample. Missing fields are recorded as 0."""
+        self.times.append(t)
+        self._end = t
+        for name, column in self._columns.items():
+            v = values.get(name, 0)
+            column.append(v)
+            _ = self._first.setdefault(name, v)
+            self._last[name] = v
+            self._peaks[name] = max(self._peaks.get(name, v), v)
+
+    def column(self, name: str) -> array.array[float]:
+        return self._columns[name]
+
+    def first(self, name: str) -> float:
+        return self._first.get(name, 0)
+
+    def last(self, name: str) -> float:
+        return self._last.get(name, 0)
+
+    def peak(self, name: str) -> float:
+        return self._peaks.get(name, 0)
+
+    def mean(self, name: str) -> float:
+        column = self._columns[name]
+        return statistics.fmean(column) if column else 0
+
+    # Nearest-rank percentile, p in [0, 100]
+    def percentile(self, name: str, p: float) -> float:
+        column = sorted(self._columns[name])
+        if not column:
+            return 0
+        rank = max(math.ceil(p / 100 * len(column)), 1)
+        return column[min(rank, len(column)) - 1]
+
+    def growth(self, name: str) -> float:
+        return self.last(name) - self.first(name)
+
+    # Average rate of change of a cumulative counter (i.e. CPU seconds), per second.
+    def rate(self, name: str) -> float:
+        if len(self.times) < 2:  # noqa: PLR2004
+            return 0
+        elapsed = self._end - self.times[0]
+        return self.growth(name) / elapsed if elapsed > 0 else 0
+
+    # Merge consecutive samples by groups of 'factor', to bound the memory used
+    # by long recordings. Each group keeps the time of its first sample and the
+    # mean of each field, so that means and percentiles are not skewed. Peaks,
+    # first and last values are tracked on the side and stay exact.
+    def downsample(self, factor: int = 2) -> None:
+        self.times[:] = self.times[::factor]
+        for column in self._columns.values():
+            column[:] = array.array(
+                "d", (statistics.fmean(column[i : i + factor]) for i in range(0, len(column), factor))
+            )
+
+    def to_dict(self) -> dict[str, list[float]]:
+        return {"time": self.times.tolist(), **{name: column.tolist() for name, column in self._columns.items()}}
@@ -0,0 +1,221 @@
+import codecs
+import contextlib
+import datetime as dt
+import threading
+from typing import TYPE_CHECKING, Final
+
+import docker.errors
+import docker.models.containers
+import pytest
+import requests
+
+from .helpers import container_id
+from .lib.logparse import LogIndex
+
+if TYPE_CHECKING:
+    from docker.types.daemon import CancellableStream
+
+# how long to wait for the log stream of a stopped container to be drained
+DRAIN_TIMEOUT = 5
+
+
+# Where a source (the log stream, or a sync() request) is in the buffer.
+class _Replay:
+    def __init__(self, since: dt.datetime | None) -> None:
+        # docker truncates `since` to the second, and returns everything after that
+        self.bound: Final = since.astimezone(dt.UTC).strftime("%Y-%m-%dT%H:%M:%S") if since else ""
+        # index of the next line in the buffer, once the first one is received
+        self.pos: int | None = None
+
+
+# Follow the output of a container from a background thread, so that waiters
+# don't need to fetch, decode and split the whole log on every iteration.
+#
+# New lines are appended to an in-memory buffer. Callers keep a cursor
+# (the number of lines they have already seen) and ask only for what
+# was added after it.
+class LogFollower:
+    def __init__(self, cont: docker.models.containers.Container) -> None:
+        self.cont: Final = cont
+        self.lines: Final[list[str]] = []
+        # docker timestamp of each line, to resume after a container restart
+        self._stamps: Final[list[str]] = []
+        # notified every time lines are appended or the stream ends
+        self.changed: Final = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stream: CancellableStream[bytes] | None = None
+        self._closed: bool = False
+        self._matcher: pytest.LineMatcher | None = None
+        self._index: Final = LogIndex()
+        # set along with the notification, for waiters that watch several sources
+        self._listeners: Final[set[threading.Event]] = set()
+
+    def add_listener(self, event: threading.Event) -> None:
+        with self.changed:
+            self._listeners.add(event)
+
+    def remove_listener(self, event: threading.Event) -> None:
+        with self.changed:
+            self._listeners.discard(event)
+
+    # with self.changed held
+    def _notify(self) -> None:
+        self.changed.notify_all()
+        for event in self._listeners:
+            event.set()
+
+    @property
+    def following(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        with self.changed:
+            if self._closed or self.following:
+                return
+            self._thread = threading.Thread(target=self._run, name=f"logs-{self.cont.short_id}", daemon=True)
+            self._thread.start()
+
+    def _since(self) -> dt.datetime | None:
+        with self.changed:
+            if not self._stamps:
+                return None
+            last = self._stamps[-1]
+        # with a margin, the lines we already have are skipped in _append()
+        return dt.datetime.fromisoformat(last) - dt.timedelta(seconds=1)
+
+    def _run(self) -> None:
+        try:
+            since = self._since()
+            replay = _Replay(since)
+            self._stream = self.cont.logs(stream=True, follow=True, timestamps=True, since=since)
+            if self._closed:
+                self._stream.close()
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            pending = ""
+            for chunk in self._stream:
+                pending += decoder.decode(chunk)
+                *complete, pending = pending.split("\n")
+                self._append(complete, replay)
+            pending += decoder.decode(b"", final=True)
+            if pending:
+                self._append([pending], replay)
+        except (docker.errors.DockerException, requests.exceptions.RequestException):
+            # the container is gone, or the daemon went away.
+            # Whatever we have is all we'll get.
+            pass
+        finally:
+            with self.changed:
+                self._notify()
+
+    # Called by the stream thread and by sync(), the lines are appended
+    # only once whoever sees them first. Both read the log in the same
+    # order, so a source skips the lines up to its position in the buffer
+    # and appends the rest, even if they share a timestamp.
+    def _append(self, raw_lines: list[str], replay: _Replay) -> None:
+        if not raw_lines:
+            return
+        with self.changed:
+            for raw in raw_lines:
+                timestamp, _, line = raw.partition(" ")
+                line = line.removesuffix("\r")
+                if replay.pos is None:
+                    replay.pos = self._replay_start(replay.bound)
+                pos = replay.pos
+                if pos < len(self.lines) and self._stamps[pos] == timestamp and self.lines[pos] == line:
+                    replay.pos = pos + 1
+                    continue
+                self._stamps.append(timestamp)
+                self.lines.append(line)
+                replay.pos = len(self.lines)
+            self._notify()
+
+    # with self.changed held.
+    # The first line of a replay is the first one written after its bound:
+    # the start of the tail of the buffer that is not older than that.
+    def _replay_start(self, bound: str) -> int:
+        start = len(self._stamps)
+        # fixed-width RFC3339, so we can compare the strings
+        while start and self._stamps[start - 1] >= bound:
+            start -= 1
+        return start
+
+    # Called by the waiters on each iteration, with the container status
+    # they just refreshed. A stream ends when the container stops, we
+    # need a new one if it's been restarted.
+    def poll(self, status: str) -> None:
+        if self._thread is None or status == "running":
+            self.start()
+
+    # Make sure the buffer contains everything the container has written so far.
+    # When the container is stopped, the stream ends after the last line.
+    # Otherwise some lines may still be in flight in the stream: they are
+    # fetched with a plain request, and the stream skips them when they arrive.
+    def sync(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        self.cont.reload()
+        # a new stream also picks up what we missed if the container
+        # was restarted and stopped while nobody was looking
+        self.start()
+        if self.cont.status != "running" and self._thread is not None:
+            self._thread.join(timeout)
+            return
+        since = self._since()
+        try:
+            out: bytes = self.cont.logs(timestamps=True, since=since)
+        except (docker.errors.DockerException, requests.exceptions.RequestException):
+            return
+        self._append(out.decode(errors="replace").removesuffix("\n").split("\n"), _Replay(since))
+
+    def lines_since(self, cursor: int) -> tuple[list[str], int]:
+        """Return the lines added after the cursor, and the new cursor."""
+        with self.changed:
+            return self.lines[cursor:], len(self.lines)
+
+    def wait_for_lines(self, cursor: int, timeout: float) -> bool:
+        """Block until there are lines after the cursor, the stream ends or the timeout expires."""
+        with self.changed:
+            return self.changed.wait_for(lambda: len(self.lines) > cursor or not self.following, timeout)
+
+    def matcher(self) -> pytest.LineMatcher:
+        """Return a LineMatcher for the whole buffer. It's only rebuilt if there are new lines."""
+        with self.changed:
+            if self._matcher is None or len(self._matcher.lines) != len(self.lines):
+                self._matcher = pytest.LineMatcher(self.lines[:])
+            return self._matcher
+
+    def index(self) -> LogIndex:
+        """Return the structured records of the buffer. Only the new lines are parsed."""
+        with self.changed:
+            self._index.extend(self.lines[len(self._index) :])
+            return self._index
+
+    def close(self) -> None:
+        with self.changed:
+            self._closed = True
+            stream = self._stream
+        if stream is not None:
+            with contextlib.suppress(docker.errors.DockerException, OSError):
+                stream.close()
+        if self._thread is not None:
+            self._thread.join(DRAIN_TIMEOUT)
+
+
+_followers: dict[str, LogFollower] = {}
+_followers_lock = threading.Lock()
+
+
+# Return the follower for a container, creating it if needed.
+# There is a single follower (and a single log stream) per container.
+def log_follower(cont: docker.models.containers.Container) -> LogFollower:
+    cont_id = container_id(cont)
+    with _followers_lock:
+        follower = _followers.get(cont_id)
+        if follower is None:
+            follower = _followers[cont_id] = LogFollower(cont)
+    return follower
+
+
+def close_log_follower(cont: docker.models.containers.Container) -> None:
+    with _followers_lock:
+        follower = _followers.pop(container_id(cont), None)
+    if follower is not None:
+        follower.close()
@@ -0,0 +1,477 @@
+import asyncio
+import contextlib
+import http
+import ipaddress
+import json
+import pathlib
+import ssl
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any, Final, NamedTuple
+
+import pytest
+
+from .helpers import ApiKeyFactoryType
+from .lib.decisions import DecisionSet, encode_stream, go_duration
+
+# A fake crowdsec LAPI for bouncer tests: an asyncio HTTP server on
+# localhost, in a background thread, that implements the endpoints used by
+# the bouncers. The test decides which decisions it serves:
+#
+#   with mock_lapi() as lapi:
+#       lapi.add_decision("1.2.3.4")
+#       with bouncer(config, lapi=lapi) as bp:
+#           bp.wait_for_lines_fnmatch(["*1 new decisions*"])
+#           lapi.delete_decisions(value="1.2.3.4")
+#           ...
+#       assert lapi.requests["/v1/decisions/stream"] > 1
+#
+# Only what the bouncers need is implemented:
+#
+#   GET  /v1/decisions/stream   startup, then the new and deleted decisions since the last call
+#   GET  /v1/decisions          the active decisions for an ip, range, scope/value...
+#   POST /v1/usage-metrics      kept in lapi.usage_metrics
+#   GET  /health
+#
+# For scale tests, large sets of decisions from lib.decisions can be added
+# with add_decision_set(). They are encoded on the fly in the stream
+# responses, but can't be deleted, don't expire and are not returned by
+# /v1/decisions.
+#
+# Bouncers authenticate with an API key (X-Api-Key) or, with tls=True, with a
+# client certificate from certs_dir, with the organizational unit bouncer_ou.
+
+DEFAULT_DURATION = 4 * 3600
+
+DEFAULT_BOUNCER_OU = "bouncer-ou"
+
+# maximum size of a request body, larger ones get a 413
+MAX_BODY = 16 * 2**20
+
+
+class HTTPRequest(NamedTuple):
+    method: str
+    path: str
+    query: dict[str, list[str]]
+    headers: dict[str, str]
+    body: bytes
+    identity: str | None  # api key or certificate CN
+    cert_authenticated: bool = False  # the identity comes from a client certificate
+
+
+# a response body encoded a chunk at a time
+class _Chunked(NamedTuple):
+    chunks: Iterator[bytes]
+
+
+class _BodyTooLargeError(Exception):
+    pass
+
+
+class _Decision:
+    def __init__(self, id_: int, fields: dict[str, Any], until: float, seq: int) -> None:  # pyright:ignore[reportExplicitAny]
+        self.id: Final = id_
+        self.fields: Final = fields
+        self.until: Final = until
+        self.added: Final = seq  # sequence number when added
+        self.deleted: int | None = None  # sequence number when deleted or expired
+
+    def to_json(self, now: float) -> dict[str, Any]:  # pyright:ignore[reportExplicitAny]
+        return {"id": self.id, "duration": go_duration(self.until - now), **self.fields}
+
+    def matches_ip(self, ip: ipaddress.IPv4Address | ipaddress.IPv6Address) -> bool:
+        scope = self.fields["scope"].lower()
+        value = self.fields["value"]
+        with contextlib.suppress(ValueError):
+            if scope == "ip":
+                return ipaddress.ip_address(value) == ip
+            if scope == "range":
+                return ip in ipaddress.ip_network(value, strict=False)
+        return False
+
+
+class MockLapi:
+    def __init__(
+        self, api_keys: Iterable[str] = (), certs: pathlib.Path | None = None, bouncer_ou: str = DEFAULT_BOUNCER_OU
+    ) -> None:
+        self.api_keys: Final = set(api_keys)
+        self.certs: Final = certs
+        self.bouncer_ou: Final = bouncer_ou  # of the accepted client certificates
+        # seconds to wait before answering, per path ("" for all paths)
+        self.latency: Final[dict[str, float]] = {}
+        # status code to return instead of the normal answer, per path
+        self.fail: Final[dict[str, int]] = {}
+        self.requests: Final = Counter[str]()
+        self.request_log: Final[list[HTTPRequest]] = []
+        self.usage_metrics: Final[list[Any]] = []  # pyright:ignore[reportExplicitAny]
+        self.url: str = ""
+        self._lock: Final = threading.Lock()
+        self._decisions: dict[int, _Decision] = {}
+        self._next_id: int = 1
+        self._seq: int = 0  # increased on every change
+        self._cursors: dict[str | None, int] = {}  # per bouncer, sequence at the last stream call
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.Server | None = None
+        self._thread: threading.Thread | None = None
+        self._writers: Final[set[asyncio.StreamWriter]] = set()  # open connections
+        # (sequence when added, first id, decisions)
+        self._bulk: Final[list[tuple[int, int, DecisionSet]]] = []
+
+    # --- scripting the decisions
+
+    def add_decision(  # noqa: PLR0913
+        self,
+        value: str,
+        *,
+        type: str = "ban",  # noqa: A002
+        scope: str = "Ip",
+        duration: float = DEFAULT_DURATION,
+        origin: str = "cscli",
+        scenario: str | None = None,
+    ) -> int:
+        """Add an active decision, return its id."""
+        if scenario is None:
+            scenario = f"manual '{type}' from 'localhost'"
+        return self.add_decisions(
+            [{"value": value, "type": type, "scope": scope, "origin": origin, "scenario": scenario}],
+            duration=duration,
+        )[0]
+
+    def add_decisions(self, decisions: Iterable[dict[str, Any]], duration: float = DEFAULT_DURATION) -> list[int]:  # pyright:ignore[reportExplicitAny]
+        """Add decisions given as LAPI json objects (value, type, scope, origin, scenario)."""
+        now = time.monotonic()
+        ids: list[int] = []
+        with self._lock:
+            self._seq += 1
+            for fields in decisions:
+                d = _Decision(self._next_id, {"uuid": str(uuid.uuid4()), **fields}, now + duration, self._seq)
+                self._decisions[d.id] = d
+                ids.append(d.id)
+                self._next_id += 1
+        return ids
+
+    def add_decision_set(self, decisions: DecisionSet) -> None:
+        with self._lock:
+            self._seq += 1
+            self._bulk.append((self._seq, self._next_id, decisions))
+            self._next_id += len(decisions)
+
+    def delete_decisions(self, ids: Iterable[int] | None = None, **fields: str) -> int:
+        """Delete decisions by id, or all those matching the fields (value="1.2.3.4"). Return how many."""
+        wanted = set(ids) if ids is not None else None
+        count = 0
+        with self._lock:
+            self._seq += 1
+            for d in self._decisions.values():
+                if d.deleted is not None:
+                    continue
+                if wanted is not None and d.id not in wanted:
+                    continue
+                if any(d.fields.get(k) != v for k, v in fields.items()):
+                    continue
+                d.deleted = self._seq
+                count += 1
+        return count
+
+    def active_decisions(self) -> list[dict[str, Any]]:  # pyright:ignore[reportExplicitAny]
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            return [d.to_json(now) for d in self._decisions.values() if d.deleted is None]
+
+    # Expired decisions are reported as deleted, like in the real LAPI.
+    # Called with the lock held.
+    def _expire(self, now: float) -> None:
+        expired = [d for d in self._decisions.values() if d.deleted is None and d.until <= now]
+        if expired:
+            self._seq += 1
+            for d in expired:
+                d.deleted = self._seq
+
+    # --- bouncer configuration
+
+    def bouncer_config(self, api_key: str | None = None) -> dict[str, str]:
+        """Return the settings to connect a bouncer to this server, to merge in its configuration."""
+        config = {"api_url": self.url + "/"}
+        if self.certs is not None and api_key is None:
+            config |= {
+                "cert_path": (self.certs / "bouncer.crt").as_posix(),
+                "key_path": (self.certs / "bouncer.key").as_posix(),
+                "ca_cert_path": (self.certs / "ca.crt").as_posix(),
+            }
+        else:
+            if api_key is None:
+                api_key = next(iter(sorted(self.api_keys)))
+            config["api_key"] = api_key
+            if self.certs is not None:
+                config["ca_cert_path"] = (self.certs / "ca.crt").as_posix()
+        return config
+
+    # --- server
+
+    def _ssl_context(self) -> ssl.SSLContext | None:
+        if self.certs is None:
+            return None
+        ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH, cafile=self.certs / "ca.crt")
+        ctx.load_cert_chain(self.certs / "lapi.crt", self.certs / "lapi.key")
+        # API keys are accepted over TLS too
+        ctx.verify_mode = ssl.CERT_OPTIONAL
+        return ctx
+
+    def start(self) -> None:
+        started = threading.Event()
+        errors: list[BaseException] = []
+
+        async def serve() -> None:
+            try:
+                self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self._ssl_context())
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                raise
+            port = self._server.sockets[0].getsockname()[1]
+            self.url = f"{'https' if self.certs else 'http'}://localhost:{port}"
+            started.set()
+            async with self._server:
+                await self._server.serve_forever()
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                self._loop.run_until_complete(serve())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="mock-lapi", daemon=True)
+        self._thread.start()
+        _ = started.wait()
+        if errors:
+            raise errors[0]
+
+    def _shutdown(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        # or wait_closed() would wait for the clients to hang up
+        for writer in list(self._writers):
+            writer.transport.abort()
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            _ = self._loop.call_soon_threadsafe(self._shutdown)
+        if self._thread is not None:
+            self._thread.join(5)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        identity = self._cert_identity(writer.get_extra_info("peercert"))
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    req = await self._read_request(reader, identity)
+                except _BodyTooLargeError:
+                    # the body is not read, what follows on the connection can't be parsed
+                    await self._respond(writer, 413, {"message": "request body too large"}, keep_alive=False)
+                    break
+                if req is None:
+                    break
+                status, payload = await self._dispatch(req)
+                keep_alive = req.headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+            with contextlib.suppress(ConnectionError, ssl.SSLError):
+                await writer.wait_closed()
+
+    @staticmethod
+    async def _respond(
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload: Any,  # pyright:ignore[reportExplicitAny]
+        *,
+        keep_alive: bool,
+    ) -> None:
+        head = (
+            f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        )
+        if isinstance(payload, _Chunked):
+            writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode())
+            # large decision sets take a while to encode, in a thread the
+            # loop keeps serving the other connections
+            while (chunk := await asyncio.to_thread(next, payload.chunks, None)) is not None:
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        else:
+            body = json.dumps(payload).encode()
+            writer.write(f"{head}Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    def _cert_identity(self, peercert: dict[str, Any] | None) -> str | None:  # pyright:ignore[reportExplicitAny]
+        if not peercert:
+            return None
+        subject = {k: v for rdn in peercert.get("subject", ()) for k, v in rdn}
+        if subject.get("organizationalUnitName") != self.bouncer_ou:
+            return None
+        # trustme puts the name in the SAN, not the CN
+        names = [v for _, v in peercert.get("subjectAltName", ())]
+        return f"cert:{subject.get('commonName') or next(iter(names), '')}"
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader, identity: str | None) -> HTTPRequest | None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = request_line.split(" ", 2)
+        headers: dict[str, str] = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY:
+            raise _BodyTooLargeError
+        body = await reader.readexactly(length) if length else b""
+        url = urllib.parse.urlsplit(target)
+        cert_authenticated = identity is not None
+        if identity is None:
+            identity = headers.get("x-api-key")
+        query = urllib.parse.parse_qs(url.query)
+        return HTTPRequest(method, url.path, query, headers, body, identity, cert_authenticated=cert_authenticated)
+
+    async def _dispatch(self, req: HTTPRequest) -> tuple[int, Any]:  # pyright:ignore[reportExplicitAny]
+        with self._lock:
+            self.requests[req.path] += 1
+            self.request_log.append(req)
+            delay = self.latency.get(req.path, self.latency.get("", 0))
+            fail = self.fail.get(req.path)
+        if delay:
+            await asyncio.sleep(delay)
+        if fail is not None:
+            return fail, {"message": "injected failure"}
+
+        if req.path == "/health":
+            return 200, {"status": "up"}
+
+        if not self._authenticated(req):
+            return 403, {"message": "access forbidden"}
+
+        handlers: dict[tuple[str, str], Callable[[HTTPRequest], tuple[int, Any]]] = {  # pyright:ignore[reportExplicitAny]
+            ("GET", "/v1/decisions/stream"): self._stream,
+            ("GET", "/v1/decisions"): self._decisions_query,
+            ("POST", "/v1/usage-metrics"): self._usage_metrics,
+        }
+        handler = handlers.get((req.method, req.path))
+        if handler is None:
+            return 404, {"message": "not found"}
+        return handler(req)
+
+    def _authenticated(self, req: HTTPRequest) -> bool:
+        return req.cert_authenticated or req.identity in self.api_keys
+
+    def _stream(self, req: HTTPRequest) -> tuple[int, Any]:  # pyright:ignore[reportExplicitAny]
+        startup = req.query.get("startup", ["false"])[0].lower() == "true"
+        scopes = {s.lower() for s in req.query.get("scopes", ["ip,range"])[0].split(",") if s}
+        origins = {o for o in req.query.get("origins", [""])[0].split(",") if o}
+
+        def wanted(d: _Decision) -> bool:
+            if d.fields["scope"].lower() not in scopes:
+                return False
+            return not origins or d.fields.get("origin") in origins
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            cursor = -1 if startup else self._cursors.get(req.identity, -1)
+            self._cursors[req.identity] = self._seq
+            new = [
+                d.to_json(now) for d in self._decisions.values() if d.deleted is None and d.added > cursor and wanted(d)
+            ]
+            deleted = (
+                []
+                if startup
+                else [
+                    d.to_json(d.until)
+                    for d in self._decisions.values()
+                    if d.deleted is not None and d.deleted > cursor and d.added <= cursor and wanted(d)
+                ]
+            )
+            bulk = [(first_id, ds) for seq, first_id, ds in self._bulk if seq > cursor]
+        if bulk:
+            return 200, _Chunked(encode_stream(bulk, new=new, deleted=deleted, scopes=scopes, origins=origins or None))
+        return 200, {"new": new, "deleted": deleted}
+
+    def _decisions_query(self, req: HTTPRequest) -> tuple[int, Any]:  # pyright:ignore[reportExplicitAny]
+        def arg(name: str) -> str | None:
+            return req.query.get(name, [None])[0]
+
+        ip = None
+        if (value := arg("ip")) is not None:
+            try:
+                ip = ipaddress.ip_address(value)
+            except ValueError:
+                return 400, {"message": f"unable to convert '{value}' to int"}
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            found = []
+            for d in self._decisions.values():
+                if d.deleted is not None:
+                    continue
+                if ip is not None and not d.matches_ip(ip):
+                    continue
+                if (rng := arg("range")) is not None and not (
+                    d.fields["scope"].lower() == "range" and d.fields["value"] == rng
+                ):
+                    continue
+                if any(
+                    (v := arg(k)) is not None and str(d.fields.get(k, "")).lower() != v.lower()
+                    for k in ("scope", "value", "type")
+                ):
+                    continue
+                found.append(d.to_json(now))
+        # like the real one
+        return 200, found or None
+
+    def _usage_metrics(self, req: HTTPRequest) -> tuple[int, Any]:  # pyright:ignore[reportExplicitAny]
+        try:
+            payload = json.loads(req.body)
+        except json.JSONDecodeError as e:
+            return 400, {"message": str(e)}
+        with self._lock:
+            self.usage_metrics.append(payload)
+        return 201, {}
+
+
+MockLapiFactory = Callable[..., contextlib.AbstractContextManager[MockLapi]]
+
+
+@pytest.fixture(scope="session")
+def mock_lapi(certs_dir: Callable[..., pathlib.Path], api_key_factory: ApiKeyFactoryType) -> MockLapiFactory:
+    @contextlib.contextmanager
+    def closure(
+        api_keys: Iterable[str] | None = None, *, tls: bool = False, bouncer_ou: str = DEFAULT_BOUNCER_OU
+    ) -> Iterator[MockLapi]:
+        if api_keys is None:
+            api_keys = [api_key_factory()]
+        certs = certs_dir("localhost", bouncer_ou=bouncer_ou) if tls else None
+        lapi = MockLapi(api_keys, certs, bouncer_ou)
+        lapi.start()
+        try:
+            yield lapi
+        finally:
+            lapi.stop()
+
+    return closure
@@ -0,0 +1,69 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+from collections.abc import Callable, Iterator
+
+import pytest
+
+# Helpers to run under pytest-xdist: work that must be done once per session
+# (package builds, image pulls) is serialized with file locks, and the
+# outcome is shared with the other workers through a marker file.
+
+
+def worker_id() -> str:
+    return os.environ.get("PYTEST_XDIST_WORKER", "master")
+
+
+def is_xdist_worker() -> bool:
+    return "PYTEST_XDIST_WORKER" in os.environ
+
+
+# A directory shared by all the workers of the current session, and only them.
+def shared_tmp_dir(tmp_path_factory: pytest.TempPathFactory) -> pathlib.Path:
+    base = tmp_path_factory.getbasetemp()
+    if is_xdist_worker():
+        # each worker has its own basetemp under the session's
+        return base.parent
+    return base
+
+
+# A lock file for a resource shared by all the sessions of the current user
+# (for example, the docker daemon's image store).
+def user_lock_path(name: str) -> pathlib.Path:
+    digest = hashlib.sha256(name.encode()).hexdigest()[:16]
+    return pathlib.Path(tempfile.gettempdir()) / f"pytest-cs-{os.getuid()}" / "locks" / f"{digest}.lock"
+
+
+@contextlib.contextmanager
+def file_lock(path: pathlib.Path) -> Iterator[None]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Call func only once per session, even with multiple workers. The others wait
+# for it to complete, and fail if it did.
+def run_once(tmp_path_factory: pytest.TempPathFactory, name: str, func: Callable[[], None]) -> None:
+    shared = shared_tmp_dir(tmp_path_factory)
+    marker = shared / f"{name}.done"
+    with file_lock(shared / f"{name}.lock"):
+        if marker.exists():
+            result = json.loads(marker.read_text())
+            if result["error"] is not None:
+                msg = f"{name} failed (worker {result['worker']}): {result['error']}"
+                raise RuntimeError(msg)
+            return
+        try:
+            func()
+        except Exception as e:
+            _ = marker.write_text(json.dumps({"worker": worker_id(), "error": repr(e)}))
+            raise
+        _ = marker.write_text(json.dumps({"worker": worker_id(), "error": None}))
@@ -3,14 +3,30 @@ import pathlib
 import secrets
 import string
 import subprocess
-from collections.abc import Callable
+from collections.abc import Callable, Generator
 from typing import Any
 
+import docker
+import docker.errors
 import pytest
-import trustme
 from _pytest.nodes import Node
 from _pytest.reports import BaseReport
 
+from .certs import CertCache, copy_bundle
+from .docker import prepull_images, required_images
+from .helpers import ApiKeyFactoryType, env_bool
+from .parallel import is_xdist_worker, worker_id
+from .reaper import record_failure
+from .reports import pop_attachments
+from .telemetry import DEFAULT_THRESHOLD, telemetry
+from .telemetry import enable as enable_telemetry
+from .telemetry import enabled as telemetry_enabled
+from .timings import enable as enable_timings
+from .timings import enabled as timings_enabled
+from .timings import phase
+from .timings import summary_lines as timings_summary_lines
+from .timings import write_json as write_timings_json
+
 keep_kind_cluster = True
 
 
@@ -48,33 +64,137 @@ def pytest_exception_interact(node: Node, _call: pytest.CallInfo[Any], report: B
                 systemd_debug(*m.args, **m.kwargs)
 
 
-@pytest.fixture(scope="session")
-def certs_dir(tmp_path_factory: pytest.TempPathFactory) -> Callable[[str, str, str], pathlib.Path]:
-    def closure(lapi_hostname: str, agent_ou: str = "agent-ou", bouncer_ou: str = "bouncer-ou") -> pathlib.Path:
-        path = tmp_path_factory.mktemp("certs")
+# The containers of the failed tests are kept by the reaper
+def pytest_runtest_logreport(report: pytest.TestReport) -> None:
+    if report.failed:
+        record_failure(report.nodeid)
+
+
+# Attach what was collected during the test (i.e. resource usage),
+# before the report is built from the item's properties.
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_makereport(item: pytest.Item) -> None:
+    item.user_properties.extend(pop_attachments(item.nodeid))
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("cs", "crowdsec")
+    group.addoption(
+        "--cs-timings",
+        action="store_true",
+        default=False,
+        help="time the phases of the tests (pulls, containers, waits, builds, fixtures) and show a summary",
+    )
+    group.addoption(
+        "--cs-timings-json",
+        metavar="PATH",
+        default=None,
+        help="write the timings to a json file (implies --cs-timings)",
+    )
+    group.addoption(
+        "--cs-waiters",
+        action="store_true",
+        default=False,
+        help="report the waiters that use most of their timeout, or never need to wait",
+    )
+    group.addoption(
+        "--cs-waiters-threshold",
+        metavar="PERCENT",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="report the waiters that use this much of their timeout (default: %(default)s)",
+    )
+    group.addoption(
+        "--cs-waiters-json",
+        metavar="PATH",
+        default=None,
+        help="write the waiter records to a json file (implies --cs-waiters)",
+    )
 
-        ca = trustme.CA()
-        ca.cert_pem.write_to_path(path / "ca.crt")
 
-        lapi_cert = ca.issue_server_cert("localhost", lapi_hostname)
-        lapi_cert.cert_chain_pems[0].write_to_path(path / "lapi.crt")
-        lapi_cert.private_key_pem.write_to_path(path / "lapi.key")
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line("markers", "docker_image(*images): pull the images before running the tests")
+    if config.getoption("cs_timings") or config.getoption("cs_timings_json"):
+        enable_timings()
+    if config.getoption("cs_waiters") or config.getoption("cs_waiters_json"):
+        enable_telemetry()
 
-        agent_cert = ca.issue_cert("agent", organization_unit_name=agent_ou)
-        agent_cert.cert_chain_pems[0].write_to_path(path / "agent.crt")
-        agent_cert.private_key_pem.write_to_path(path / "agent.key")
 
-        bouncer_cert = ca.issue_cert("bouncer", organization_unit_name=bouncer_ou)
-        bouncer_cert.cert_chain_pems[0].write_to_path(path / "bouncer.crt")
-        bouncer_cert.private_key_pem.write_to_path(path / "bouncer.key")
+@pytest.hookimpl(wrapper=True)
+def pytest_fixture_setup(fixturedef: pytest.FixtureDef[object]) -> Generator[None, object, object]:
+    if not timings_enabled():
+        return (yield)
+    with phase(f"fixture:{fixturedef.argname}"):
+        return (yield)
 
-        return path
 
-    return closure
+def _waiters_threshold(config: pytest.Config) -> float:
+    value = config.getoption("cs_waiters_threshold")
+    return DEFAULT_THRESHOLD if value is None else float(value)
+
+
+def pytest_terminal_summary(terminalreporter: pytest.TerminalReporter, config: pytest.Config) -> None:
+    if timings_enabled():
+        terminalreporter.write_sep("=", "crowdsec timings")
+        for line in timings_summary_lines():
+            terminalreporter.write_line(line)
+    if telemetry_enabled():
+        terminalreporter.write_sep("=", "crowdsec waiters")
+        for line in telemetry.summary_lines(_waiters_threshold(config)):
+            terminalreporter.write_line(line)
 
 
-# ApiKeyFactoryType = Callable[[], str] | Callable[[str], str]
-ApiKeyFactoryType = Callable[..., str]
+def _json_path(option: str | None) -> pathlib.Path | None:
+    if option is None:
+        return None
+    path = pathlib.Path(option)
+    if is_xdist_worker():
+        # one file per worker
+        path = path.with_stem(f"{path.stem}-{worker_id()}")
+    return path
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    config = session.config
+    if (path := _json_path(config.getoption("cs_timings_json"))) is not None:
+        write_timings_json(path)
+    if (path := _json_path(config.getoption("cs_waiters_json"))) is not None:
+        telemetry.write_json(path, _waiters_threshold(config))
+
+
+# Pull the images needed by the tests before running them, concurrently.
+# Set CROWDSEC_TEST_PREPULL=false to disable.
+def pytest_collection_finish(session: pytest.Session) -> None:
+    if session.config.option.collectonly or not env_bool("CROWDSEC_TEST_PREPULL", default=True):
+        return
+    images = required_images(session.items)
+    if not images:
+        return
+    try:
+        client = docker.from_env()
+    except docker.errors.DockerException:
+        # the tests will tell
+        return
+    reporter = session.config.pluginmanager.get_plugin("terminalreporter")
+    try:
+        prepull_images(client, images, reporter.write_line if reporter else print)
+    finally:
+        client.close()
+
+
+@pytest.fixture(scope="session")
+def certs_dir(tmp_path_factory: pytest.TempPathFactory) -> Callable[..., pathlib.Path]:
+    cache = CertCache(tmp_path_factory.mktemp("certs-bundles"))
+
+    def closure(
+        lapi_hostname: str, agent_ou: str = "agent-ou", bouncer_ou: str = "bouncer-ou", key_type: str = "ecdsa"
+    ) -> pathlib.Path:
+        """Return a new directory with a CA, and lapi, agent and bouncer certificates (see certs.py)."""
+        path = tmp_path_factory.mktemp("certs")
+        copy_bundle(cache.bundle(lapi_hostname, agent_ou, bouncer_ou, key_type), path)
+        return path
+
+    return closure
 
 
 @pytest.fixture(scope="session")
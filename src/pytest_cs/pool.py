@@ -0,0 +1,101 @@
+import collections
+import contextlib
+import json
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Final
+
+import docker.errors
+import docker.models.containers
+import pytest
+
+from .helpers import pool_size
+
+ContainerFactory = Callable[[], docker.models.containers.Container]
+
+# how many configurations keep containers ready at the same time
+MAX_CONFIGS = 4
+
+
+# Keep containers created and started in advance, so that tests don't have
+# to wait for crowdsec to initialize.
+#
+# Containers are grouped by the arguments used to create them. A set of
+# arguments seen only once is likely unique to a test (a temporary volume,
+# for example), so the pool starts filling only at the second request.
+# Every container is handed out only once. When too many configurations
+# are in use, the containers of the least recently requested one are removed.
+class ContainerPool:
+    def __init__(self, size: int, max_configs: int = MAX_CONFIGS) -> None:
+        self.size: Final = size
+        self.max_configs: Final = max_configs
+        self._executor: Final = ThreadPoolExecutor(max_workers=size, thread_name_prefix="container-pool")
+        # least recently requested first
+        self._ready: Final[
+            collections.OrderedDict[str, collections.deque[Future[docker.models.containers.Container]]]
+        ] = collections.OrderedDict()
+        self._requests: Final[collections.Counter[str]] = collections.Counter()
+        self._lock: Final = threading.Lock()
+
+    @staticmethod
+    def key(args: tuple[Any, ...], kwargs: dict[str, Any]) -> str:  # pyright:ignore[reportExplicitAny]
+        return json.dumps([args, kwargs], sort_keys=True, default=repr)
+
+    def acquire(self, key: str, factory: ContainerFactory) -> docker.models.containers.Container:
+        evicted: list[Future[docker.models.containers.Container]] = []
+        with self._lock:
+            self._requests[key] += 1
+            queue = self._ready.get(key)
+            future = queue.popleft() if queue else None
+            if self._requests[key] > 1:
+                queue = self._ready.setdefault(key, collections.deque())
+                self._ready.move_to_end(key)
+                while len(queue) < self.size:
+                    queue.append(self._executor.submit(factory))
+                while len(self._ready) > self.max_configs:
+                    _, old = self._ready.popitem(last=False)
+                    evicted.extend(old)
+        _discard(evicted)
+        if future is None:
+            return factory()
+        return future.result()
+
+    # remove the containers that nobody asked for
+    def close(self) -> None:
+        with self._lock:
+            futures = [f for queue in self._ready.values() for f in queue]
+            self._ready.clear()
+        _discard(futures)
+        # the containers still being created are removed when they're ready
+        self._executor.shutdown(wait=True)
+
+
+# Stop and remove idle containers, without waiting for the ones
+# that are still being created.
+def _discard(futures: list[Future[docker.models.containers.Container]]) -> None:
+    for future in futures:
+        _ = future.cancel()
+        future.add_done_callback(_remove)
+
+
+def _remove(future: Future[docker.models.containers.Container]) -> None:
+    if future.cancelled() or future.exception() is not None:
+        return
+    with contextlib.suppress(docker.errors.NotFound):
+        future.result().remove(force=True)
+
+
+# Set CROWDSEC_TEST_POOL_SIZE to the number of containers to keep ready
+# for each configuration requested from the crowdsec fixture.
+@pytest.fixture(scope="session")
+def crowdsec_pool() -> Iterator[ContainerPool | None]:
+    size = pool_size()
+    if size <= 0:
+        yield None
+        return
+    pool = ContainerPool(size)
+    try:
+        yield pool
+    finally:
+        pool.close()
@@ -0,0 +1,102 @@
+import contextlib
+import os
+import secrets
+import threading
+import time
+from collections.abc import Iterator
+from typing import Final
+
+import docker
+import docker.errors
+import docker.models.containers
+import pytest
+
+from .helpers import container_id, current_nodeid, env_bool, env_int
+
+# Every container we create is labelled with the session and the test that
+# created it. At the end of the session, the containers of the tests that
+# passed are removed. The others are kept for inspection, until they are
+# older than CROWDSEC_TEST_KEEP_SESSIONS sessions.
+#
+# Set CROWDSEC_TEST_REAP=false to keep everything, as before.
+
+LABEL_SESSION: Final = "pytest-cs.session"
+LABEL_STARTED: Final = "pytest-cs.started"
+LABEL_NODEID: Final = "pytest-cs.nodeid"
+
+# xdist workers share the same session
+SESSION_ID: Final = os.environ.get("PYTEST_XDIST_TESTRUNUID") or secrets.token_hex(8)
+SESSION_STARTED: Final = str(int(time.time()))
+
+_containers: dict[str, tuple[docker.models.containers.Container, str]] = {}
+_failed_nodeids: set[str] = set()
+_lock = threading.Lock()
+
+
+def session_labels() -> dict[str, str]:
+    return {
+        LABEL_SESSION: SESSION_ID,
+        LABEL_STARTED: SESSION_STARTED,
+        LABEL_NODEID: current_nodeid(),
+    }
+
+
+# Labels can't be changed after the container is created: if it's used by
+# a different test (i.e. it comes from a pool), we track it by the new one.
+def track_container(cont: docker.models.containers.Container, nodeid: str | None = None) -> None:
+    cont_id = container_id(cont)
+    with _lock:
+        _containers[cont_id] = (cont, current_nodeid() if nodeid is None else nodeid)
+
+
+def record_failure(nodeid: str) -> None:
+    with _lock:
+        _failed_nodeids.add(nodeid)
+
+
+def _remove(cont: docker.models.containers.Container) -> None:
+    with contextlib.suppress(docker.errors.NotFound):
+        cont.remove(v=True, force=True)
+
+
+# Remove the containers left over by older sessions, except the last 'keep'.
+# Running containers are left alone, they may belong to a concurrent session.
+def prune_sessions(docker_client: docker.DockerClient, keep: int) -> None:
+    sessions: dict[str, list[docker.models.containers.Container]] = {}
+    started: dict[str, int] = {}
+    for cont in docker_client.containers.list(
+        all=True, filters={"label": LABEL_SESSION, "status": ["created", "exited", "dead"]}
+    ):
+        session = cont.labels[LABEL_SESSION]
+        if session == SESSION_ID:
+            continue
+        sessions.setdefault(session, []).append(cont)
+        with contextlib.suppress(KeyError, ValueError):
+            started[session] = int(cont.labels[LABEL_STARTED])
+    by_age = sorted(sessions, key=lambda s: started.get(s, 0), reverse=True)
+    for session in by_age[max(keep, 0) :]:
+        for cont in sessions[session]:
+            _remove(cont)
+
+
+# Remove the containers of the tests that passed
+def reap_session() -> None:
+    with _lock:
+        containers = list(_containers.values())
+        _containers.clear()
+        failed = set(_failed_nodeids)
+    for cont, nodeid in containers:
+        if nodeid not in failed:
+            _remove(cont)
+
+
+@pytest.fixture(scope="session")
+def container_reaper(docker_client: docker.DockerClient) -> Iterator[None]:
+    if not env_bool("CROWDSEC_TEST_REAP", default=True):
+        yield
+        return
+    prune_sessions(docker_client, env_int("CROWDSEC_TEST_KEEP_SESSIONS", 3))
+    try:
+        yield
+    finally:
+        reap_session()
@@ -0,0 +1,24 @@
+import json
+import threading
+from typing import Any
+
+from .helpers import current_nodeid
+
+# Data collected during a test (resource usage, timings...) to attach to its
+# report as user properties, so they end up in the junit xml or can be read
+# by other plugins.
+
+_pending: dict[str, list[tuple[str, str]]] = {}
+_lock = threading.Lock()
+
+
+def attach_to_report(name: str, data: Any, nodeid: str | None = None) -> None:  # pyright:ignore[reportExplicitAny]
+    if nodeid is None:
+        nodeid = current_nodeid()
+    with _lock:
+        _pending.setdefault(nodeid, []).append((name, json.dumps(data)))
+
+
+def pop_attachments(nodeid: str) -> list[tuple[str, str]]:
+    with _lock:
+        return _pending.pop(nodeid, [])
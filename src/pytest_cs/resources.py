@@ -0,0 +1,103 @@
+import contextlib
+import threading
+import time
+from typing import Final
+
+import psutil
+
+from .lib.timeseries import TimeSeries
+
+# Record what a process and all its descendants use, from a background
+# thread: CPU time, memory, file descriptors, threads and context switches.
+
+DEFAULT_SAMPLE_INTERVAL = 0.5
+
+RESOURCE_FIELDS: Final = ("cpu", "rss", "fds", "threads", "ctx_switches")
+
+
+class ResourceSampler:
+    def __init__(self, proc: psutil.Process, interval: float = DEFAULT_SAMPLE_INTERVAL) -> None:
+        self.proc: Final = proc
+        self.interval: Final = interval
+        self.series: Final = TimeSeries(RESOURCE_FIELDS)
+        self._stop: Final = threading.Event()
+        self._thread: threading.Thread | None = None
+        # cumulative counters of the processes that are gone, so that the
+        # totals don't go down when a child exits
+        self._exited: dict[int, tuple[float, float]] = {}
+        self._seen: dict[int, tuple[float, float]] = {}
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name=f"sampler-{self.proc.pid}", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                break
+
+    def sample(self) -> None:
+        try:
+            procs = [self.proc, *self.proc.children(recursive=True)]
+        except psutil.Error:
+            procs = []
+        rss = fds = threads = 0
+        counters: dict[int, tuple[float, float]] = {}
+        for p in procs:
+            with contextlib.suppress(psutil.Error):
+                with p.oneshot():
+                    cpu = p.cpu_times()
+                    ctx = p.num_ctx_switches()
+                    rss += p.memory_info().rss
+                    fds += p.num_fds()
+                    threads += p.num_threads()
+                counters[p.pid] = (cpu.user + cpu.system, ctx.voluntary + ctx.involuntary)
+        for pid, last in self._seen.items():
+            if pid not in counters:
+                self._exited[pid] = last
+        self._seen = counters
+        totals = [*counters.values(), *self._exited.values()]
+        self.series.append(
+            time.monotonic(),
+            cpu=sum(c for c, _ in totals),
+            rss=rss,
+            fds=fds,
+            threads=threads,
+            ctx_switches=sum(s for _, s in totals),
+        )
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def summary(self) -> dict[str, float]:
+        s = self.series
+        return {
+            "samples": len(s),
+            "peak_rss": s.peak("rss"),
+            # percent of one core
+            "mean_cpu": s.rate("cpu") * 100,
+            "cpu_time": s.growth("cpu"),
+            "fd_growth": s.growth("fds"),
+            "peak_fds": s.peak("fds"),
+            "peak_threads": s.peak("threads"),
+            "ctx_switches": s.growth("ctx_switches"),
+        }
+
+    def to_dict(self) -> dict[str, object]:
+        return {"interval": self.interval, "summary": self.summary(), "series": self.series.to_dict()}
+
+    def assert_peak_rss_below(self, limit: int) -> None:
+        peak = self.series.peak("rss")
+        assert peak < limit, f"peak RSS {peak / 2**20:.1f} MiB, limit {limit / 2**20:.1f} MiB"
+
+    def assert_mean_cpu_below(self, percent: float) -> None:
+        mean = self.series.rate("cpu") * 100
+        assert mean < percent, f"mean CPU {mean:.1f}%, limit {percent:.1f}%"
+
+    def assert_fd_growth_below(self, limit: int) -> None:
+        growth = self.series.growth("fds")
+        assert growth < limit, f"open file descriptors grew by {growth:.0f}, limit {limit}"
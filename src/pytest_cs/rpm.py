@@ -1,12 +1,16 @@
-import contextlib
+import functools
+import gzip
 import os
 import pathlib
 import shutil
 import subprocess
+import time
 
 import pytest
 
-rpm_build_done = False
+from .buildcache import BuildCache, newer_files, source_key
+from .parallel import run_once
+from .timings import phase
 
 
 @pytest.fixture
@@ -15,27 +19,77 @@ def skip_unless_rpm() -> None:
         pytest.skip("This test is only for RPM-based systems")
 
 
-def rpmbuild(repodir: pathlib.Path, bouncer_under_test: str, version: str, package_number: str) -> None:
-    directory_name = f"{bouncer_under_test}-{version}"
+RPM_BUILD_TOOLS = (
+    ("rpmbuild", "--version"),
+    ("go", "version"),
+    ("gcc", "--version"),
+)
+
+
+# The source tarball, from the current commit like a clone would be, without
+# the clone: the output of git archive is compressed on the fly.
+def source_tarball(repodir: pathlib.Path, prefix: str, path: pathlib.Path) -> None:
+    with subprocess.Popen(
+        ["git", "archive", "--format=tar", f"--prefix={prefix}/", "HEAD"], cwd=repodir, stdout=subprocess.PIPE
+    ) as proc:
+        assert proc.stdout is not None
+        with gzip.GzipFile(path, "wb", compresslevel=6, mtime=0) as gz:
+            shutil.copyfileobj(proc.stdout, gz, 1024 * 1024)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
 
-    # git clone repo from PROJECT_ROOT to rpm/SOURCES
+# The archive has no .git: what the Makefile would ask git is passed in the
+# environment (unless it's already set).
+def build_metadata(repodir: pathlib.Path) -> dict[str, str]:
+    def git(*args: str) -> str:
+        return subprocess.check_output(["git", *args], cwd=repodir, encoding="utf-8").strip()
 
+    return {
+        "BUILD_VERSION": os.environ.get("BUILD_VERSION") or git("describe", "--tags", "--always"),
+        "BUILD_TAG": os.environ.get("BUILD_TAG") or git("rev-parse", "HEAD"),
+    }
+
+
+def rpmbuild(
+    repodir: pathlib.Path, bouncer_under_test: str, version: str, package_number: str, *, clean: bool = True
+) -> None:
+    directory_name = f"{bouncer_under_test}-{version}"
     sources = repodir / "rpm/SOURCES"
-    clone_dir = sources / directory_name
-    with contextlib.suppress(FileNotFoundError):
-        shutil.rmtree(clone_dir)
-    _ = subprocess.check_call(["make", "clean-rpm"], cwd=repodir)
-    _ = subprocess.check_call(["git", "clone", repodir, clone_dir])
-    _ = subprocess.check_call(["tar", "cfz", sources / f"v{version}.tar.gz", directory_name], cwd=sources)
-    shutil.rmtree(clone_dir)
-    env = os.environ.copy()
+    if clean:
+        _ = subprocess.check_call(["make", "clean-rpm"], cwd=repodir)
+    with phase("rpm sources"):
+        sources.mkdir(parents=True, exist_ok=True)
+        source_tarball(repodir, directory_name, sources / f"v{version}.tar.gz")
+    env = os.environ | build_metadata(repodir)
     env["VERSION"] = version
     env["PACKAGE_NUMBER"] = package_number
-    _ = subprocess.check_call(
-        ["rpmbuild", "--define", f"_topdir {repodir}/rpm", "-bb", f"rpm/SPECS/{bouncer_under_test}.spec"],
-        cwd=repodir,
-        env=env,
-    )
+    with phase("rpmbuild"):
+        _ = subprocess.check_call(
+            ["rpmbuild", "--define", f"_topdir {repodir}/rpm", "-bb", f"rpm/SPECS/{bouncer_under_test}.spec"],
+            cwd=repodir,
+            env=env,
+        )
+
+
+# Build the packages, or restore them under rpm/RPMS from the build cache (see buildcache.py).
+def cached_rpmbuild(repodir: pathlib.Path, bouncer_under_test: str, version: str, package_number: str) -> None:
+    cache = BuildCache("rpm")
+    if not cache.enabled:
+        rpmbuild(repodir, bouncer_under_test, version, package_number)
+        return
+    # after cleaning, so that the leftovers of a previous build don't change the key
+    _ = subprocess.check_call(["make", "clean-rpm"], cwd=repodir)
+    # the sources come from HEAD (see source_tarball), the spec from the working tree
+    extra = [bouncer_under_test, version, package_number, *build_metadata(repodir).values()]
+    key = source_key(repodir, ["rpm/SPECS"], RPM_BUILD_TOOLS, extra, dirty=False)
+
+    def build() -> list[pathlib.Path]:
+        start = time.time() - 1
+        rpmbuild(repodir, bouncer_under_test, version, package_number, clean=False)
+        return newer_files(repodir / "rpm/RPMS", "*/*.rpm", start)
+
+    _ = cache.get(key, repodir, build, base=repodir)
 
 
 @pytest.fixture(scope="session")
@@ -53,6 +107,12 @@ def rpm_package_number() -> str:
     return "1"
 
 
+# e.g. 5.14.0-427.13.1.el9_4.x86_64
+@functools.cache
+def kernel_release() -> str:
+    return os.uname().release
+
+
 @pytest.fixture(scope="session")
 def rpm_package_path(
     project_repo: pathlib.Path,
@@ -61,31 +121,30 @@ def rpm_package_path(
     rpm_package_name: str,
     bouncer_under_test: str,  # pyright:ignore[reportUnusedParameter]  # noqa: ARG001
 ) -> pathlib.Path:
-    distversion, arch = subprocess.check_output(["uname", "-r"]).rstrip().decode().split(".")[-2:]
+    distversion, arch = kernel_release().split(".")[-2:]
     filename = f"{rpm_package_name}-{rpm_package_version}-{rpm_package_number}.{distversion}.{arch}.rpm"
     return project_repo / "rpm/RPMS" / arch / filename
 
 
+# The packages are built once per session, by a single xdist worker
 @pytest.fixture(scope="session")
-def rpm_package(
+def rpm_package(  # noqa: PLR0913, PLR0917
     rpm_package_path: pathlib.Path,
     project_repo: pathlib.Path,
     rpm_package_version: str,
     rpm_package_number: str,
     bouncer_under_test: str,
+    tmp_path_factory: pytest.TempPathFactory,
 ) -> pathlib.Path:
     # Assume that the rpm package names are the same as the deb ones
-    global rpm_build_done
-    if not rpm_build_done:
-        if rpm_package_path.exists():
-            # no need to tell the user to remove the file, as rpmbuild will do it
-            pass
-        rpmbuild(
+    # If rpm_package_path exists, no need to remove it, as rpmbuild will do it
+    def build() -> None:
+        cached_rpmbuild(
             repodir=project_repo,
             bouncer_under_test=bouncer_under_test,
             version=rpm_package_version,
             package_number=rpm_package_number,
         )
-        rpm_build_done = True
 
+    run_once(tmp_path_factory, "rpm-build", build)
     return rpm_package_path
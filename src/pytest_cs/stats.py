@@ -0,0 +1,162 @@
+import contextlib
+import json
+import threading
+import time
+from typing import Any, Final
+
+import docker.errors
+import docker.models.containers
+import requests
+
+from .helpers import container_client, container_id
+from .lib.timeseries import TimeSeries
+
+# Record the resource usage of a container from the docker stats stream
+# (about one sample per second), in a background thread.
+#
+# To bound the memory of long tests, when the series reaches max_points it's
+# downsampled by half, averaging the samples (the peaks are kept apart).
+
+DEFAULT_MAX_POINTS = 3600
+
+STATS_FIELDS: Final = ("cpu", "memory", "block_read", "block_write", "net_rx", "net_tx")
+
+
+# Convert a docker stats sample to: CPU percent (of one core), memory used
+# without the page cache, and the cumulative bytes of block and network I/O.
+# Return None if the sample has nothing to compare with yet.
+def parse_stats(sample: dict[str, Any]) -> dict[str, float] | None:  # pyright:ignore[reportExplicitAny]
+    cpu_stats = sample.get("cpu_stats") or {}
+    precpu_stats = sample.get("precpu_stats") or {}
+    if "system_cpu_usage" not in cpu_stats or "system_cpu_usage" not in precpu_stats:
+        return None
+
+    cpu_delta = cpu_stats["cpu_usage"]["total_usage"] - precpu_stats["cpu_usage"]["total_usage"]
+    system_delta = cpu_stats["system_cpu_usage"] - precpu_stats["system_cpu_usage"]
+    online_cpus = cpu_stats.get("online_cpus") or len(cpu_stats["cpu_usage"].get("percpu_usage") or [1])
+    cpu = cpu_delta / system_delta * online_cpus * 100 if system_delta > 0 else 0
+
+    memory_stats = sample.get("memory_stats") or {}
+    detail = memory_stats.get("stats") or {}
+    # cgroup v2, then v1
+    cache = detail.get("inactive_file", detail.get("total_inactive_file", 0))
+    memory = max(memory_stats.get("usage", 0) - cache, 0)
+
+    block_read = block_write = 0
+    for entry in (sample.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        op = entry.get("op", "").lower()
+        if op == "read":
+            block_read += entry["value"]
+        elif op == "write":
+            block_write += entry["value"]
+
+    networks = (sample.get("networks") or {}).values()
+
+    return {
+        "cpu": cpu,
+        "memory": memory,
+        "block_read": block_read,
+        "block_write": block_write,
+        "net_rx": sum(n.get("rx_bytes", 0) for n in networks),
+        "net_tx": sum(n.get("tx_bytes", 0) for n in networks),
+    }
+
+
+class ContainerStatsRecorder:
+    def __init__(self, cont: docker.models.containers.Container, max_points: int = DEFAULT_MAX_POINTS) -> None:
+        self.cont: Final = cont
+        self.max_points: Final = max_points
+        self.series: Final = TimeSeries(STATS_FIELDS)
+        self._lock: Final = threading.Lock()
+        self._stopped: bool = False
+        self._thread: threading.Thread | None = None
+        self._response: requests.Response | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name=f"stats-{self.cont.short_id}", daemon=True)
+        self._thread.start()
+
+    # The stream of docker-py can't be closed from another thread, so the
+    # endpoint is read directly, to close the response in stop().
+    def _open(self) -> requests.Response | None:
+        api = container_client(self.cont).api
+        url = f"{api.base_url}/v{api.api_version}/containers/{container_id(self.cont)}/stats"
+        response = api.get(url, params={"stream": True}, stream=True)
+        response.raise_for_status()
+        with self._lock:
+            if self._stopped:
+                response.close()
+                return None
+            self._response = response
+        return response
+
+    def _run(self) -> None:
+        # the stream ends when the container stops, or when the response is closed.
+        # Reading a closed response can fail in many ways
+        with contextlib.suppress(
+            docker.errors.DockerException, requests.exceptions.RequestException, OSError, ValueError, AttributeError
+        ):
+            response = self._open()
+            if response is None:
+                return
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                values = parse_stats(json.loads(line))
+                with self._lock:
+                    if self._stopped:
+                        return
+                    if values is None:
+                        continue
+                    self.series.append(time.monotonic(), **values)
+                    if len(self.series) >= self.max_points:
+                        self.series.downsample()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped = True
+            response = self._response
+        if response is not None:
+            # wake up the thread if it's blocked on a read (urllib3 >= 2.3)
+            with contextlib.suppress(AttributeError, ValueError, RuntimeError, OSError):
+                _ = response.raw.shutdown()
+            response.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def peak(self, name: str) -> float:
+        with self._lock:
+            return self.series.peak(name)
+
+    def percentile(self, name: str, p: float) -> float:
+        with self._lock:
+            return self.series.percentile(name, p)
+
+    def summary(self) -> dict[str, float]:
+        with self._lock:
+            s = self.series
+            return {
+                "samples": len(s),
+                "peak_cpu": s.peak("cpu"),
+                "p95_cpu": s.percentile("cpu", 95),
+                "mean_cpu": s.mean("cpu"),
+                "peak_memory": s.peak("memory"),
+                "p95_memory": s.percentile("memory", 95),
+                "block_read": s.growth("block_read"),
+                "block_write": s.growth("block_write"),
+                "net_rx": s.growth("net_rx"),
+                "net_tx": s.growth("net_tx"),
+            }
+
+    def to_dict(self) -> dict[str, object]:
+        summary = self.summary()
+        with self._lock:
+            return {"container": self.cont.name, "summary": summary, "series": self.series.to_dict()}
+
+    def assert_peak_memory_below(self, limit: int) -> None:
+        peak = self.peak("memory")
+        assert peak < limit, f"{self.cont.name}: peak memory {peak / 2**20:.1f} MiB, limit {limit / 2**20:.1f} MiB"
+
+    def assert_cpu_below(self, percent: float, percentile: float = 95) -> None:
+        cpu = self.percentile("cpu", percentile)
+        assert cpu < percent, f"{self.cont.name}: p{percentile:g} CPU {cpu:.1f}%, limit {percent:.1f}%"
@@ -0,0 +1,51 @@
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Final
+
+import pytest
+
+from .helpers import env_bool
+
+
+# Run the container teardowns in worker threads, so that tests don't
+# wait for crowdsec to shut down gracefully. Errors are collected and
+# raised when the queue is drained, at the end of the session.
+class TeardownQueue:
+    def __init__(self, max_workers: int = 4) -> None:
+        self._executor: Final = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="teardown")
+        self._futures: Final[list[Future[None]]] = []
+        self._lock: Final = threading.Lock()
+
+    def submit(self, func: Callable[[], None]) -> None:
+        with self._lock:
+            self._futures.append(self._executor.submit(func))
+
+    def drain(self) -> None:
+        self._executor.shutdown(wait=True)
+        errors: list[Exception] = []
+        for f in self._futures:
+            e = f.exception()
+            if e is None:
+                continue
+            # KeyboardInterrupt, SystemExit...
+            if not isinstance(e, Exception):
+                raise e
+            errors.append(e)
+        if errors:
+            msg = "container teardown failed"
+            raise ExceptionGroup(msg, errors)
+
+
+# Set CROWDSEC_TEST_ASYNC_TEARDOWN=true to stop the containers in the background.
+# The queue is drained before the reaper removes the containers.
+@pytest.fixture(scope="session")
+def container_teardown(container_reaper: None) -> Iterator[TeardownQueue | None]:  # pyright:ignore[reportUnusedParameter]  # noqa: ARG001
+    if not env_bool("CROWDSEC_TEST_ASYNC_TEARDOWN", default=False):
+        yield None
+        return
+    queue = TeardownQueue()
+    try:
+        yield queue
+    finally:
+        queue.drain()
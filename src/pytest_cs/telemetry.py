@@ -0,0 +1,160 @@
+import inspect
+import json
+import os
+import pathlib
+import threading
+from typing import Final, NamedTuple
+
+from .helpers import current_nodeid
+
+# With --cs-waiters, every waiter reports how it went: where it was created,
+# how many times it checked its condition, how long it took and how much
+# of its timeout it used. At the end of the session, the report shows
+#
+#   - the waiters that use most of their budget: they are likely to become
+#     flaky on a slower machine;
+#   - the waiters that always succeed on the first check: the condition was
+#     already true, the wait (or a sleep before it) may be useless.
+#
+# The threshold is set with --cs-waiters-threshold (percent, default 80).
+
+DEFAULT_THRESHOLD = 80
+
+_enabled: bool = False
+
+# where the waiters are created, to find the caller outside of this package
+_package_dir: Final = str(pathlib.Path(__file__).parent) + os.sep
+
+
+class WaiterRecord(NamedTuple):
+    site: str  # file:line of the code that created the waiter
+    kind: str  # waiter class
+    nodeid: str
+    iterations: int  # checks of the condition
+    elapsed: float
+    timeout: float
+    success: bool
+
+    @property
+    def budget_used(self) -> float:
+        """Percent of the timeout used."""
+        return self.elapsed / self.timeout * 100 if self.timeout > 0 else 100
+
+
+class WaiterGroup(NamedTuple):
+    site: str
+    kind: str
+    records: list[WaiterRecord]
+
+    @property
+    def n_waits(self) -> int:
+        return len(self.records)
+
+    @property
+    def failures(self) -> int:
+        return sum(not r.success for r in self.records)
+
+    @property
+    def mean_budget_used(self) -> float:
+        return sum(r.budget_used for r in self.records) / len(self.records)
+
+    @property
+    def max_budget_used(self) -> float:
+        return max(r.budget_used for r in self.records)
+
+    @property
+    def mean_iterations(self) -> float:
+        return sum(r.iterations for r in self.records) / len(self.records)
+
+    @property
+    def first_try(self) -> bool:
+        """True if the condition was always met on the first check."""
+        return all(r.success and r.iterations == 1 for r in self.records)
+
+
+def _budget_row(g: WaiterGroup) -> str:
+    budget = f"{g.mean_budget_used:5.1f}% (max {g.max_budget_used:5.1f}%)"
+    return (
+        f"  {budget} {g.n_waits:4d} runs {g.failures:3d} timeouts {g.mean_iterations:6.1f} checks  {g.kind} at {g.site}"
+    )
+
+
+class WaiterTelemetry:
+    def __init__(self) -> None:
+        self.records: Final[list[WaiterRecord]] = []
+        self._lock: Final = threading.Lock()
+
+    def add(self, record: WaiterRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def groups(self) -> list[WaiterGroup]:
+        with self._lock:
+            records = list(self.records)
+        by_site: dict[tuple[str, str], list[WaiterRecord]] = {}
+        for r in records:
+            by_site.setdefault((r.site, r.kind), []).append(r)
+        return [WaiterGroup(site, kind, rs) for (site, kind), rs in by_site.items()]
+
+    def over_budget(self, threshold: float) -> list[WaiterGroup]:
+        groups = [g for g in self.groups() if g.failures or g.mean_budget_used >= threshold]
+        return sorted(groups, key=lambda g: g.mean_budget_used, reverse=True)
+
+    def first_try(self) -> list[WaiterGroup]:
+        return sorted((g for g in self.groups() if g.first_try), key=lambda g: g.n_waits, reverse=True)
+
+    def summary_lines(self, threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+        lines = [f"{len(self.records)} waiters", "", f"using {threshold:g}% or more of their budget, or timing out:"]
+        lines += [_budget_row(g) for g in self.over_budget(threshold)] or ["  none"]
+        lines += ["", "always successful on the first check:"]
+        lines += [f"  {g.n_waits:4d} runs  {g.kind} at {g.site}" for g in self.first_try()] or ["  none"]
+        return lines
+
+    def to_dict(self, threshold: float = DEFAULT_THRESHOLD) -> dict[str, object]:
+        with self._lock:
+            records = [{**r._asdict(), "budget_used": r.budget_used} for r in self.records]
+        return {
+            "threshold": threshold,
+            "waiters": records,
+            "over_budget": [f"{g.kind} at {g.site}" for g in self.over_budget(threshold)],
+            "first_try": [f"{g.kind} at {g.site}" for g in self.first_try()],
+        }
+
+    def write_json(self, path: pathlib.Path, threshold: float = DEFAULT_THRESHOLD) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _ = path.write_text(json.dumps(self.to_dict(threshold), indent=2))
+
+
+telemetry: Final = WaiterTelemetry()
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+# The first frame outside of this package: the test (or fixture) that is waiting
+def creation_site() -> str:
+    current = inspect.currentframe()
+    first = frame = current.f_back if current is not None else None
+    while frame is not None and frame.f_code.co_filename.startswith(_package_dir):
+        frame = frame.f_back
+    if frame is None:
+        frame = first
+    if frame is None:
+        # no frame support in this interpreter
+        return "<unknown>"
+    filename = pathlib.Path(frame.f_code.co_filename)
+    if filename.is_relative_to(pathlib.Path.cwd()):
+        filename = filename.relative_to(pathlib.Path.cwd())
+    return f"{filename}:{frame.f_lineno}"
+
+
+def record_waiter(  # noqa: PLR0913
+    site: str, kind: str, iterations: int, elapsed: float, timeout: float, *, success: bool
+) -> None:
+    telemetry.add(WaiterRecord(site, kind, current_nodeid(), iterations, elapsed, timeout, success))
@@ -0,0 +1,150 @@
+import contextlib
+import json
+import math
+import pathlib
+import threading
+import time
+from collections.abc import Callable
+from typing import Final
+
+from .helpers import current_nodeid
+
+# Where does the time go? With --cs-timings, the phases of each test (image
+# pulls, container creation, waits, package builds, fixtures...) are timed,
+# aggregated in histograms and summarized at the end of the session.
+# --cs-timings-json=FILE writes everything to a json file.
+#
+# Instrumenting some code:
+#
+#   with phase("helm install"):
+#       ...
+#
+# When timings are disabled, phase() returns a shared no-op context manager.
+
+# histogram buckets: up to 1ms, 2ms, 4ms... up to 2**MAX_BUCKET ms and above
+MAX_BUCKET = 20
+
+_enabled: bool = False
+_null: Final = contextlib.nullcontext()
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.total: float = 0
+        self.min: float = math.inf
+        self.max: float = 0
+        self.buckets: Final = [0] * (MAX_BUCKET + 1)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        ms = seconds * 1000
+        bucket = 0 if ms <= 1 else min(math.ceil(math.log2(ms)), MAX_BUCKET)
+        self.buckets[bucket] += 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self) -> dict[str, object]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.min if self.count else 0,
+            "max": self.max,
+            # upper bound of the bucket in milliseconds -> count
+            "buckets": {str(2**i): n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class Timings:
+    def __init__(self) -> None:
+        self.phases: Final[dict[str, Histogram]] = {}
+        self.tests: Final[dict[str, dict[str, float]]] = {}  # nodeid -> phase -> total
+        self._lock: Final = threading.Lock()
+
+    def record(self, name: str, seconds: float, nodeid: str | None = None) -> None:
+        if nodeid is None:
+            nodeid = current_nodeid() or "session"
+        with self._lock:
+            hist = self.phases.get(name)
+            if hist is None:
+                hist = self.phases[name] = Histogram()
+            hist.add(seconds)
+            per_test = self.tests.setdefault(nodeid, {})
+            per_test[name] = per_test.get(name, 0) + seconds
+
+    def slowest(self, n: int, predicate: Callable[[str], bool]) -> list[tuple[str, Histogram]]:
+        with self._lock:
+            phases = [(name, h) for name, h in self.phases.items() if predicate(name)]
+        return sorted(phases, key=lambda p: p[1].total, reverse=True)[:n]
+
+    def to_dict(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "phases": {name: h.to_dict() for name, h in sorted(self.phases.items())},
+                "tests": {nodeid: dict(phases) for nodeid, phases in self.tests.items()},
+            }
+
+
+timings: Final = Timings()
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+class _Phase:
+    __slots__: Final = ("name", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name: Final = name
+        self.start: float = 0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_: object) -> None:
+        timings.record(self.name, time.perf_counter() - self.start)
+
+
+def phase(name: str) -> contextlib.AbstractContextManager[None]:
+    if not _enabled:
+        return _null
+    return _Phase(name)
+
+
+# For durations measured by the caller
+def record(name: str, seconds: float) -> None:
+    if _enabled:
+        timings.record(name, seconds)
+
+
+def _row(name: str, h: Histogram) -> str:
+    return f"{h.total:9.2f}s {h.count:6d} {h.mean:9.3f}s {h.max:9.3f}s  {name}"
+
+
+def summary_lines(n: int = 15) -> list[str]:
+    header = f"{'total':>10} {'count':>6} {'mean':>10} {'max':>10}  phase"
+    lines = ["slowest phases:", header]
+    lines += [_row(name, h) for name, h in timings.slowest(n, lambda name: not name.startswith("fixture:"))]
+    lines += ["", "slowest fixtures (setup):", header]
+    lines += [
+        _row(name.removeprefix("fixture:"), h)
+        for name, h in timings.slowest(n, lambda name: name.startswith("fixture:"))
+    ]
+    return lines
+
+
+def write_json(path: pathlib.Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _ = path.write_text(json.dumps(timings.to_dict(), indent=2))
@@ -1,14 +1,37 @@
+import random
+import threading
 import time
-from collections.abc import Iterator
+from collections.abc import Callable, Iterator
 from types import TracebackType
 from typing import Final, Generic, TypeVar
 
 from _pytest.outcomes import Failed
 
 from .helpers import default_timeout
+from .telemetry import creation_site, record_waiter
+from .telemetry import enabled as telemetry_enabled
+from .timings import record as record_timing
 
 T = TypeVar("T")
 
+# A retry schedule returns how long to wait after a given iteration (starting from 0).
+Schedule = Callable[[int], float]
+
+
+def fixed(step: float = 0.1) -> Schedule:
+    return lambda _: step
+
+
+# Start fast, then back off to avoid hammering the daemon or the service
+def exponential(initial: float = 0.05, factor: float = 2, cap: float = 1) -> Schedule:
+    return lambda iteration: min(cap, initial * factor**iteration)
+
+
+# Randomize the delays of another schedule by up to 'jitter' (a fraction of
+# the delay), so that many waiters don't retry at the same time.
+def jittered(schedule: Schedule, jitter: float = 0.5) -> Schedule:
+    return lambda iteration: schedule(iteration) * (1 - jitter * random.random())  # noqa: S311
+
 
 # Implement a constuct to wait for any condition to be true without a busy loop.
 # It must be subclassed to return the context.
@@ -20,16 +43,30 @@ T = TypeVar("T")
 #       assert ctx.some_condition()
 #       assert ctx.some_other_condition()
 #       assert ctx.yet_another_condition()
+#
+# The delay between iterations is given by a schedule (fixed by default).
+# A waiter can be woken up before the delay expires by setting the
+# 'wakeup' event, or by overriding sleep() in a subclass.
 class WaiterGenerator(Generic[T]):
-    def __init__(self, timeout: float | None = None, step: float = 0.1) -> None:
+    def __init__(
+        self,
+        timeout: float | None = None,
+        step: float = 0.1,
+        schedule: Schedule | None = None,
+        wakeup: threading.Event | None = None,
+    ) -> None:
         if timeout is None:
             timeout = default_timeout()
         self.start: Final = time.monotonic()
-        self.timeout: float = timeout
-        self.step: Final = step  # wait between iterations
+        self.timeout: Final = timeout
+        self.deadline: Final = self.start + timeout
+        self.step: Final = step  # wait between iterations, unless there is a schedule
+        self.schedule: Final = schedule or fixed(step)
+        self.wakeup: Final = wakeup
         self.done: bool = False  # set to True to stop the iteration
         self.failure: BaseException | None = None  # capture an exception to raise on the last iteration
-        self.iteration: int = 0  # for debugging
+        self.iteration: int = 0  # number of sleeps so far
+        self.site: Final = creation_site() if telemetry_enabled() else ""
 
     # Yield a context manager until the timeout is reached.
     #
@@ -43,17 +80,35 @@ class WaiterGenerator(Generic[T]):
     # On its last iteration before the timeout, any exception
     # is allowed to propagate and will cause the test to fail.
     def __iter__(self) -> Iterator["WaiterGenerator[T]"]:
-        while not self.done and (self.start + self.timeout > time.monotonic()):
+        try:
+            yield from self._iterate()
+        finally:
+            elapsed = time.monotonic() - self.start
+            record_timing(f"wait:{type(self).__name__}", elapsed)
+            if telemetry_enabled():
+                record_waiter(
+                    self.site, type(self).__name__, self.iteration + 1, elapsed, self.timeout, success=self.done
+                )
+
+    def _iterate(self) -> Iterator["WaiterGenerator[T]"]:
+        while not self.done:
             self.refresh()
             yield self
-            time.sleep(self.step)
-            self.timeout -= self.step
-            self.iteration += 1
+
+            if self.done:
+                break
 
             # until the last iteration, we ignore test failures
             if self.failure and not isinstance(self.failure, AssertionError) and not isinstance(self.failure, Failed):
                 raise self.failure
 
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # the last iteration happens right at the deadline
+            self.sleep(min(self.schedule(self.iteration), remaining))
+            self.iteration += 1
+
         if self.done:
             return True
 
@@ -67,6 +122,14 @@ class WaiterGenerator(Generic[T]):
         """
         raise NotImplementedError
 
+    # Wait between iterations. Subclasses that know when there is
+    # something new to look at can override this to return early.
+    def sleep(self, delay: float) -> None:
+        if self.wakeup is None:
+            time.sleep(delay)
+        elif self.wakeup.wait(delay):
+            self.wakeup.clear()
+
     # this is called before each iteration to refresh the state
     # of the object: reload a container, etc.
     def refresh(self) -> None:
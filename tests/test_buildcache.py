@@ -0,0 +1,104 @@
+import pathlib
+import subprocess
+
+import pytest
+
+from pytest_cs.buildcache import BuildCache, source_key
+
+
+def git(repo: pathlib.Path, *args: str) -> None:
+    _ = subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+
+def test_source_key(tmp_path: pathlib.Path) -> None:
+    repo = tmp_path / "repo"
+    (repo / "debian").mkdir(parents=True)
+    _ = (repo / "main.go").write_text("package main\n")
+    _ = (repo / ".gitignore").write_text("debian/\n")
+    _ = (repo / "debian" / "control").write_text("Package: foo\n")
+    git(repo, "init", "-q")
+    git(repo, "add", ".")
+    git(repo, "-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "-q", "-m", "init")
+
+    key = source_key(repo, ["debian"])
+    assert source_key(repo, ["debian"]) == key
+
+    # dirty file
+    _ = (repo / "main.go").write_text("package main // changed\n")
+    dirty = source_key(repo, ["debian"])
+    assert dirty != key
+    # for a build from HEAD
+    assert source_key(repo, ["debian"], dirty=False) == key
+    _ = (repo / "main.go").write_text("package main\n")
+    assert source_key(repo, ["debian"]) == key
+
+    # untracked file
+    _ = (repo / "new.go").write_text("package main\n")
+    assert source_key(repo, ["debian"]) != key
+    (repo / "new.go").unlink()
+
+    # ignored, but part of the packaging
+    _ = (repo / "debian" / "control").write_text("Package: bar\n")
+    assert source_key(repo, ["debian"]) != key
+    assert source_key(repo) == source_key(repo)
+
+    # tools
+    assert source_key(repo, tools=[["true"]]) != source_key(repo, tools=[["no-such-tool-here"]])
+
+    # a nested repository is listed as a directory
+    (repo / "sub").mkdir()
+    _ = (repo / "sub" / "lib.go").write_text("package lib\n")
+    git(repo / "sub", "init", "-q")
+    nested = source_key(repo, ["debian"])
+    _ = (repo / "sub" / "lib.go").write_text("package lib // changed\n")
+    assert source_key(repo, ["debian"]) != nested
+
+
+def test_build_cache(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CROWDSEC_TEST_CACHE_DIR", str(tmp_path / "cache"))
+    cache = BuildCache("deb", max_size_mb=1)
+    out = tmp_path / "out"
+    out.mkdir()
+    assert cache.restore("k1", out) is None
+
+    artifact = tmp_path / "foo.deb"
+    _ = artifact.write_bytes(b"x" * 600_000)
+    cache.store("k1", [artifact])
+    assert cache.restore("k1", out) == [out / "foo.deb"]
+    assert (out / "foo.deb").read_bytes() == artifact.read_bytes()
+
+    # over 1 MiB, the least recently used entry goes
+    cache.store("k2", [artifact])
+    assert cache.restore("k1", out) is None
+    assert cache.restore("k2", out) is not None
+
+    assert not BuildCache("deb", max_size_mb=0).enabled
+
+
+def test_build_cache_base(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CROWDSEC_TEST_CACHE_DIR", str(tmp_path / "cache"))
+    cache = BuildCache("rpm")
+    artifact = tmp_path / "repo" / "rpm" / "RPMS" / "x86_64" / "foo.rpm"
+    artifact.parent.mkdir(parents=True)
+    _ = artifact.write_bytes(b"rpm")
+    cache.store("k", [artifact], base=tmp_path / "repo")
+    other = tmp_path / "other"
+    assert cache.restore("k", other) == [other / "rpm" / "RPMS" / "x86_64" / "foo.rpm"]
+
+
+def test_build_cache_get(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CROWDSEC_TEST_CACHE_DIR", str(tmp_path / "cache"))
+    cache = BuildCache("deb")
+    builds: list[pathlib.Path] = []
+
+    def build() -> list[pathlib.Path]:
+        artifact = tmp_path / "foo.deb"
+        _ = artifact.write_bytes(b"deb")
+        builds.append(artifact)
+        return [artifact]
+
+    out = tmp_path / "out"
+    assert cache.get("k", out, build) == [tmp_path / "foo.deb"]
+    # the second time, from the cache
+    assert cache.get("k", out, build) == [out / "foo.deb"]
+    assert len(builds) == 1
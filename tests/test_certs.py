@@ -0,0 +1,43 @@
+import pathlib
+
+import pytest
+
+from pytest_cs.certs import CERT_MODE, FILES, KEY_MODE, CertCache, copy_bundle
+
+
+def test_cert_cache(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CROWDSEC_TEST_CACHE_DIR", str(tmp_path / "cache"))
+    cache = CertCache(tmp_path / "session", max_age_days=1)
+    bundle = cache.bundle("lapi", "agent-ou", "bouncer-ou", "ecdsa")
+    assert bundle.parent == tmp_path / "cache" / "certs"
+    assert cache.bundle("lapi", "agent-ou", "bouncer-ou", "ecdsa") == bundle
+    assert cache.bundle("lapi", "agent-ou", "bouncer-ou", "rsa") != bundle
+
+    # another session reuses the bundle on disk
+    ca = (bundle / "ca.crt").read_text()
+    other = CertCache(tmp_path / "session2", max_age_days=1)
+    assert (other.bundle("lapi", "agent-ou", "bouncer-ou", "ecdsa") / "ca.crt").read_text() == ca
+
+    dst = tmp_path / "certs"
+    dst.mkdir()
+    copy_bundle(bundle, dst)
+    assert sorted(p.name for p in dst.iterdir()) == sorted(FILES)
+    assert (dst / "ca.crt").read_text() == ca
+    # the copies can be rewritten, the keys are private
+    assert (dst / "lapi.key").stat().st_mode & 0o777 == KEY_MODE
+    assert (dst / "lapi.crt").stat().st_mode & 0o777 == CERT_MODE
+    _ = (dst / "lapi.crt").write_text("changed")
+    assert (bundle / "lapi.crt").read_text() != "changed"
+    # and the cache is not readable by others
+    assert bundle.stat().st_mode & 0o077 == 0
+
+    with pytest.raises(ValueError, match="unknown key type"):
+        _ = cache.bundle("lapi", "agent-ou", "bouncer-ou", "dsa")
+
+
+def test_cert_cache_session_only(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CROWDSEC_TEST_CACHE_DIR", str(tmp_path / "cache"))
+    cache = CertCache(tmp_path / "session", max_age_days=0)
+    bundle = cache.bundle("lapi", "agent-ou", "bouncer-ou", "ecdsa")
+    assert bundle.parent == tmp_path / "session"
+    assert not (tmp_path / "cache").exists()
@@ -0,0 +1,78 @@
+import json
+from collections.abc import Sequence
+
+from pytest_cs.lib.cscli import Cscli
+
+ALERTS = [
+    {
+        "id": 1,
+        "scenario": "crowdsecurity/ssh-bf",
+        "source": {"scope": "Ip", "value": "1.2.3.4"},
+        "decisions": [
+            {"id": 10, "origin": "crowdsec", "scope": "Ip", "value": "1.2.3.4", "type": "ban", "duration": "3h59m"},
+        ],
+    },
+    {
+        "id": 2,
+        "scenario": "manual",
+        "source": {"scope": "Range", "value": "10.0.0.0/8"},
+        "decisions": [
+            {"id": 11, "origin": "cscli", "scope": "Range", "value": "10.0.0.0/8", "type": "ban", "duration": "1h"},
+            {"id": 12, "origin": "cscli", "scope": "Ip", "value": "5.6.7.8", "type": "captcha", "duration": "1h"},
+        ],
+    },
+]
+
+
+class FakeCscli:
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, ...]] = []
+
+    def __call__(self, args: Sequence[str]) -> str:
+        self.calls.append(tuple(args))
+        if args[:2] == ("decisions", "list"):
+            return json.dumps(ALERTS)
+        if args[:2] == ("bouncers", "list"):
+            return json.dumps(
+                [
+                    {"name": "b1", "ip_address": "", "type": "", "created_at": "x", "tags": ["a", "b"]},
+                    {"name": "b2", "tags": None, "meta": {"os": "linux"}},
+                ]
+            )
+        return ""
+
+
+def test_decisions_filters() -> None:
+    cscli = Cscli(FakeCscli())
+    decisions = cscli.decisions()
+    assert [d.id for d in decisions] == [10, 11, 12]
+    assert [d.id for d in decisions.where(origin="cscli", scope="Ip")] == [12]
+    assert [d.id for d in decisions.where_any(value="1.2.3.4", type="captcha")] == [10, 12]
+    assert decisions.where(origin="cscli", type="nope") == []
+    first = decisions.first(value="10.0.0.0/8")
+    assert first is not None
+    assert first.alert_id == 2  # noqa: PLR2004
+    # fields that are only in the json
+    assert [b.name for b in cscli.bouncers().where(created_at="x")] == ["b1"]
+    # json arrays and objects
+    assert [b.name for b in cscli.bouncers().where(tags=["a", "b"])] == ["b1"]
+    assert [b.name for b in cscli.bouncers().where_any(tags=["a"], meta={"os": "linux"})] == ["b2"]
+
+
+def test_cache() -> None:
+    runner = FakeCscli()
+    cscli = Cscli(runner, ttl=60)
+    assert cscli.decisions() is cscli.decisions()
+    _ = cscli.run("decisions", "list", "--ip", "1.2.3.4")
+    assert len(runner.calls) == 2  # noqa: PLR2004
+    # still cached after a read-only command
+    _ = cscli.decisions()
+    assert len(runner.calls) == 2  # noqa: PLR2004
+    _ = cscli.run("decisions", "add", "-i", "1.2.3.4")
+    _ = cscli.decisions()
+    _ = cscli.decisions(refresh=True)
+    assert runner.calls[2:] == [
+        ("decisions", "add", "-i", "1.2.3.4"),
+        ("decisions", "list", "-o", "json"),
+        ("decisions", "list", "-o", "json"),
+    ]
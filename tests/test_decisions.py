@@ -0,0 +1,54 @@
+import ipaddress
+import json
+
+import pytest
+
+from pytest_cs.lib.decisions import encode_stream, generate_decisions
+
+N = 2000
+
+
+def test_generate() -> None:
+    ds = generate_decisions(N, seed=1)
+    assert len(ds) == N
+    decisions = list(ds)
+    scopes = {d["scope"] for d in decisions}
+    assert scopes == {"Ip", "Range", "Country", "AS"}
+    ips = [d["value"] for d in decisions if d["scope"] == "Ip"]
+    assert len(set(ips)) == len(ips)
+    for d in decisions:
+        if d["scope"] == "Ip":
+            ip = ipaddress.ip_address(d["value"])
+            if isinstance(ip, ipaddress.IPv4Address):
+                assert not ip.is_private
+                assert ip.is_global
+        elif d["scope"] == "Range":
+            net = ipaddress.ip_network(d["value"])
+            if isinstance(net, ipaddress.IPv4Network):
+                assert not net.is_private
+                assert net.is_global
+    # same seed, same decisions
+    assert list(generate_decisions(N, seed=1)) == decisions
+
+
+def test_mix() -> None:
+    ds = generate_decisions(10, mix={"ipv6": 1, "country": 1})
+    assert sorted(ds.scope(i) for i in range(len(ds))) == ["Country"] * 5 + ["Ip"] * 5
+    with pytest.raises(ValueError, match="unknown kinds of decisions: ipv5"):
+        _ = generate_decisions(10, mix={"ipv5": 1})
+
+
+def test_encode_stream() -> None:
+    ds = generate_decisions(N, seed=2)
+    extra = {"id": 1, "value": "1.2.3.4", "scope": "Ip"}
+    deleted = {"id": 2, "value": "5.6.7.8", "scope": "Ip"}
+    chunks = list(encode_stream([(10, ds)], new=[extra], deleted=[deleted], chunk_size=300))
+    doc = json.loads(b"".join(chunks))
+    assert doc["new"][0] == extra
+    assert doc["new"][1:] == [ds.decision(i, 10 + i) for i in range(N)]
+    assert doc["deleted"] == [deleted]
+
+    doc = json.loads(b"".join(encode_stream([(1, ds)], scopes={"country"})))
+    assert {d["scope"] for d in doc["new"]} == {"Country"}
+
+    assert json.loads(b"".join(encode_stream([]))) == {"new": [], "deleted": []}
@@ -0,0 +1,107 @@
+import contextlib
+import os
+import socket
+import struct
+import subprocess
+import threading
+from typing import IO, Any, Final
+
+from pytest_cs.execsession import STDERR, STDOUT, ExecResult, ExecSession, batch_script, parse_batch_output
+
+COMMANDS = [
+    "echo one; echo err >&2",
+    "printf 'no newline'",
+    "exit 3",
+    "cd /; pwd",
+    "cat",  # doesn't read the next commands
+]
+
+
+def run_batch(commands: list[str], *, stop_on_error: bool = False) -> list[ExecResult]:
+    marker = "pytest-cs-test"
+    script = batch_script(commands, marker, stop_on_error=stop_on_error)
+    p = subprocess.run(["sh", "-c", script], capture_output=True, text=True, check=False)
+    return parse_batch_output(commands, marker, p.stdout, p.stderr)
+
+
+def test_batch() -> None:
+    assert run_batch(COMMANDS) == [
+        ExecResult(COMMANDS[0], 0, "one\n", "err\n"),
+        ExecResult(COMMANDS[1], 0, "no newline", ""),
+        ExecResult(COMMANDS[2], 3, "", ""),
+        ExecResult(COMMANDS[3], 0, "/\n", ""),
+        ExecResult(COMMANDS[4], 0, "", ""),
+    ]
+
+
+def test_batch_stop_on_error() -> None:
+    results = run_batch(COMMANDS, stop_on_error=True)
+    assert [r.exit_code for r in results] == [0, 0, 3]
+
+
+# A local shell behind a socket, with the output framed like the docker
+# exec stream (8 bytes header: stream, 0, 0, 0, size).
+class FakeApi:
+    def __init__(self) -> None:
+        self.procs: Final[list[subprocess.Popen[bytes]]] = []
+
+    def exec_create(self, container: str, cmd: list[str], **_: Any) -> dict[str, str]:  # pyright:ignore[reportExplicitAny]
+        return {"Id": f"{container}:{' '.join(cmd)}"}
+
+    def exec_start(self, exec_id: str, **_: Any) -> socket.socket:  # pyright:ignore[reportExplicitAny]
+        ours, theirs = socket.socketpair()
+        proc = subprocess.Popen(
+            exec_id.split(":", 1)[1].split(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.procs.append(proc)
+        send_lock = threading.Lock()
+
+        def pump_in(dst: IO[bytes]) -> None:
+            with contextlib.suppress(OSError):
+                while data := theirs.recv(4096):
+                    _ = dst.write(data)
+                    dst.flush()
+            dst.close()
+
+        def pump_out(src: IO[bytes], stream: int) -> None:
+            with contextlib.suppress(OSError):
+                while data := os.read(src.fileno(), 4096):
+                    with send_lock:
+                        theirs.sendall(struct.pack(">BxxxL", stream, len(data)) + data)
+
+        assert proc.stdin is not None
+        assert proc.stdout is not None
+        assert proc.stderr is not None
+        for target, args in (
+            (pump_in, (proc.stdin,)),
+            (pump_out, (proc.stdout, STDOUT)),
+            (pump_out, (proc.stderr, STDERR)),
+        ):
+            threading.Thread(target=target, args=args, daemon=True).start()
+        return ours
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.api: Final = FakeApi()
+
+
+class FakeContainer:
+    id: str = "fake"
+
+    def __init__(self) -> None:
+        self.client: Final = FakeClient()
+
+
+def test_session() -> None:
+    cont = FakeContainer()
+    with ExecSession(cont, timeout=5) as sh:  # pyright:ignore[reportArgumentType]
+        assert sh.run(COMMANDS[0]) == ExecResult(COMMANDS[0], 0, "one\n", "err\n")
+        # 'exit' ends the command, not the shell
+        assert [r.exit_code for r in sh.run_all(["exit 3", "true", "false"])] == [3, 0, 1]
+        assert sh.run("printf 'no newline'").stdout == "no newline"
+        assert sh.run("cat; echo done >&2") == ExecResult("cat; echo done >&2", 0, "", "done\n")
+    assert cont.client.api.procs[0].wait(5) == 0
@@ -0,0 +1,84 @@
+import http.server
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any, override
+
+import docker.errors
+import pytest
+
+from pytest_cs.docker import HttpCondition, StatusCondition, wait_for_group
+
+DELAY = 0.5
+
+
+class SlowHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        time.sleep(DELAY)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    @override
+    def log_message(self, format: str, *args: Any) -> None:  # pyright:ignore[reportExplicitAny]
+        pass
+
+
+@pytest.fixture
+def http_port() -> Iterator[int]:
+    server = http.server.ThreadingHTTPServer(("localhost", 0), SlowHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+class FakeClient:
+    def events(self, **_: Any) -> None:  # pyright:ignore[reportExplicitAny]
+        # no event stream, the waiters poll
+        raise docker.errors.DockerException
+
+
+class FakeContainer:
+    def __init__(self, name: str, port: int, statuses: list[str]) -> None:
+        self.id: str = name
+        self.short_id: str = name
+        self.name: str = name
+        self.client: FakeClient = FakeClient()
+        self.ports: dict[str, list[dict[str, str]]] = {"8080/tcp": [{"HostPort": str(port)}]}
+        self.attrs: dict[str, Any] = {}  # pyright:ignore[reportExplicitAny]
+        self.statuses: list[str] = statuses
+        self.status: str = statuses[0]
+
+    def reload(self) -> None:
+        if len(self.statuses) > 1:
+            self.status = self.statuses.pop(0)
+        else:
+            self.status = self.statuses[0]
+
+
+def test_wait_for_group(http_port: int) -> None:
+    conts = [FakeContainer(f"c{i}", http_port, ["created", "running"]) for i in range(3)]
+    conditions = [StatusCondition(c, "running") for c in conts] + [HttpCondition(c, 8080, "/") for c in conts]  # pyright:ignore[reportArgumentType]
+    start = time.monotonic()
+    wait_for_group(conditions, timeout=5)
+    # the probes run concurrently
+    assert time.monotonic() - start < 2 * DELAY
+
+
+def test_wait_for_group_fail_fast(http_port: int) -> None:
+    ok = FakeContainer("ok", http_port, ["running"])
+    bad = FakeContainer("bad", http_port, ["created", "restarting"])
+    conditions = [StatusCondition(ok, "running"), StatusCondition(bad, "running")]  # pyright:ignore[reportArgumentType]
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="Container bad: container is restarting, while waiting for status running"):
+        wait_for_group(conditions, timeout=5)
+    assert time.monotonic() - start < 1
+
+
+def test_wait_for_group_timeout(http_port: int) -> None:
+    cont = FakeContainer("c", http_port, ["running"])
+    conditions = [HttpCondition(cont, 8080, "/", http.HTTPStatus.NO_CONTENT)]  # pyright:ignore[reportArgumentType]
+    with pytest.raises(TimeoutError, match=r"still waiting for c: http 8080/ \(204, last: 200\)"):
+        wait_for_group(conditions, timeout=1.5)
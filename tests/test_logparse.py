@@ -0,0 +1,55 @@
+import datetime as dt
+
+from pytest_cs.lib.logparse import LogIndex, parse_line
+
+
+def test_parse_text() -> None:
+    r = parse_line('time="2024-01-02T15:04:05Z" level=info msg="Starting \\"processing\\" data" type=file')
+    assert r.time == dt.datetime(2024, 1, 2, 15, 4, 5, tzinfo=dt.UTC)
+    assert r.level == "info"
+    assert r.msg == 'Starting "processing" data'
+    assert r.fields == {"type": "file"}
+
+
+def test_parse_tty() -> None:
+    r = parse_line("\x1b[31mWARN\x1b[0m[2024-01-02T15:04:05Z] Machine is not validated          name=foo ip=1.2.3.4")
+    assert r.level == "warning"
+    assert r.msg == "Machine is not validated"
+    assert r.fields == {"name": "foo", "ip": "1.2.3.4"}
+    r = parse_line("INFO[0000] Loading prometheus collectors")
+    assert r.time is None
+    assert r.msg == "Loading prometheus collectors"
+
+
+def test_parse_json() -> None:
+    r = parse_line('{"level":"error","msg":"oops","time":"2024-01-02T15:04:05Z","code":42}')
+    assert r.level == "error"
+    assert r.msg == "oops"
+    assert r.fields == {"code": "42"}
+
+
+def test_parse_other() -> None:
+    r = parse_line("Hello from Docker!")
+    assert r.level is None
+    assert r.msg == "Hello from Docker!"
+
+
+def test_index() -> None:
+    index = LogIndex()
+    index.extend(
+        [
+            'time="2024-01-02T15:04:05Z" level=info msg="one" name=a',
+            'time="2024-01-02T15:04:06Z" level=error msg="two" name=a',
+            'time="2024-01-02T15:04:07Z" level=error msg="three" name=b',
+            "not structured",
+        ]
+    )
+    assert [r.msg for r in index.find(level="error")] == ["two", "three"]
+    assert [r.msg for r in index.find(level="error", name="a")] == ["two"]
+    assert [r.msg for r in index.find(name="a", start=1)] == ["two"]
+    since = dt.datetime(2024, 1, 2, 15, 4, 7)  # noqa: DTZ001
+    first = index.first(level="error", since=since)
+    assert first is not None
+    assert first.msg == "three"
+    assert index.first(predicate=lambda r: r.msg.startswith("not")) is not None
+    assert index.first(level="fatal") is None
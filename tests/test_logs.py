@@ -0,0 +1,92 @@
+import datetime as dt
+import threading
+from collections.abc import Iterator
+from typing import Any, Final
+
+from pytest_cs.logs import LogFollower
+
+LINES = [
+    b"2024-01-02T15:04:05.000000001Z one\n",
+    b"2024-01-02T15:04:05.000000002Z two\n",
+    b"2024-01-02T15:04:06.000000000Z three\n",
+]
+
+
+# written in the same nanosecond
+SHARED = [
+    b"2024-01-02T15:04:05.000000001Z one\n",
+    b"2024-01-02T15:04:05.000000001Z one\n",
+    b"2024-01-02T15:04:05.000000001Z two\n",
+]
+
+
+class SlowStream:
+    """A log stream that delivers its lines only when released."""
+
+    def __init__(self, lines: list[bytes]) -> None:
+        self.lines: Final = lines
+        self.release: Final = threading.Event()
+
+    def __iter__(self) -> Iterator[bytes]:
+        _ = self.release.wait(5)
+        yield from self.lines
+
+    def close(self) -> None:
+        self.release.set()
+
+
+class FakeContainer:
+    short_id: str = "fake"
+    status: str = "running"
+
+    def __init__(self, lines: list[bytes] = LINES, written: int = 2) -> None:
+        self.lines: Final = lines
+        # how many lines a plain request returns
+        self.written: int = written
+        self.stream: Final = SlowStream(lines)
+        self.since: list[dt.datetime | None] = []
+
+    def reload(self) -> None:
+        pass
+
+    def logs(self, *, stream: bool = False, since: dt.datetime | None = None, **_: Any) -> Any:  # pyright:ignore[reportExplicitAny]
+        if stream:
+            return self.stream
+        self.since.append(since)
+        return b"".join(self.lines[: self.written])
+
+
+def test_sync_running() -> None:
+    cont = FakeContainer()
+    follower = LogFollower(cont)  # pyright:ignore[reportArgumentType]
+    # the stream has nothing yet, sync() fetches what's been written so far
+    follower.sync()
+    assert follower.lines_since(0) == (["one", "two"], 2)
+
+    # the stream catches up, without duplicates
+    cont.stream.release.set()
+    assert follower.wait_for_lines(2, 5)
+    follower.close()
+    assert follower.lines_since(0) == (["one", "two", "three"], 3)
+
+    # the next sync starts from the last line
+    follower.sync()
+    assert cont.since[-1] == dt.datetime(2024, 1, 2, 15, 4, 5, tzinfo=dt.UTC)
+
+
+def test_sync_shared_timestamp() -> None:
+    cont = FakeContainer(SHARED, written=1)
+    follower = LogFollower(cont)  # pyright:ignore[reportArgumentType]
+    follower.sync()
+    assert follower.lines_since(0) == (["one"], 1)
+
+    # same timestamp as the line we have, but not the same line
+    cont.stream.release.set()
+    assert follower.wait_for_lines(1, 5)
+    follower.close()
+    assert follower.lines_since(0) == (["one", "one", "two"], 3)
+
+    # replayed from the previous second, nothing is added twice
+    cont.written = 3
+    follower.sync()
+    assert follower.lines_since(0) == (["one", "one", "two"], 3)
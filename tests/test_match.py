@@ -0,0 +1,30 @@
+import pytest
+
+from pytest_cs.lib.match import OrderedMatcher
+
+
+def test_ordered_matcher() -> None:
+    matcher = OrderedMatcher(["*one*", "two", "th?ee"])
+    assert matcher.pending == "*one*"
+    assert not matcher.feed(["zero", "two", "the one"])
+    # "two" was seen before "*one*", it doesn't count
+    assert matcher.pending == "two"
+    assert not matcher.feed(["three"])
+    assert matcher.feed(["two", "three", "four"])
+    assert matcher.pending is None
+    matcher.reset()
+    assert matcher.pending == "*one*"
+
+
+def test_ordered_matcher_brackets() -> None:
+    # exact matches are accepted even if the pattern is not a valid glob for them
+    matcher = OrderedMatcher(["[x]"])
+    assert matcher.feed(["[x]"])
+
+
+def test_ordered_matcher_report() -> None:
+    lines = ["one", "three"]
+    matcher = OrderedMatcher(["one", "two"])
+    assert not matcher.feed(lines)
+    with pytest.raises(pytest.fail.Exception, match="remains unmatched: 'two'"):
+        matcher.report(lines)
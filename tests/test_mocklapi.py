@@ -0,0 +1,126 @@
+import socket
+import time
+
+import pytest
+import requests
+
+from pytest_cs.lib.decisions import generate_decisions
+from pytest_cs.mocklapi import MAX_BODY, MockLapi, MockLapiFactory
+
+API_KEY = "secret"
+
+
+def get(lapi: MockLapi, path: str, api_key: str = API_KEY, **params: str) -> requests.Response:
+    return requests.get(f"{lapi.url}{path}", params=params, headers={"X-Api-Key": api_key}, timeout=5)
+
+
+def test_auth(mock_lapi: MockLapiFactory) -> None:
+    with mock_lapi([API_KEY]) as lapi:
+        assert get(lapi, "/v1/decisions/stream", startup="true").ok
+        assert get(lapi, "/v1/decisions/stream", api_key="wrong").status_code == requests.codes.forbidden
+        # only a client certificate can authenticate as a certificate
+        assert get(lapi, "/v1/decisions/stream", api_key="cert:bouncer").status_code == requests.codes.forbidden
+        assert lapi.requests["/v1/decisions/stream"] == len(lapi.request_log)
+
+
+def test_stream(mock_lapi: MockLapiFactory) -> None:
+    with mock_lapi([API_KEY]) as lapi:
+        first = lapi.add_decision("1.2.3.4")
+        _ = lapi.add_decision("FR", scope="Country")
+        stream = get(lapi, "/v1/decisions/stream", startup="true").json()
+        assert [d["value"] for d in stream["new"]] == ["1.2.3.4"]
+        assert stream["deleted"] == []
+
+        # only what changed since the last call
+        _ = lapi.add_decision("10.0.0.0/8", scope="Range")
+        assert lapi.delete_decisions([first]) == 1
+        stream = get(lapi, "/v1/decisions/stream").json()
+        assert [d["value"] for d in stream["new"]] == ["10.0.0.0/8"]
+        assert [d["value"] for d in stream["deleted"]] == ["1.2.3.4"]
+        assert get(lapi, "/v1/decisions/stream").json() == {"new": [], "deleted": []}
+
+        # another scope
+        stream = get(lapi, "/v1/decisions/stream", startup="true", scopes="country").json()
+        assert [d["value"] for d in stream["new"]] == ["FR"]
+
+
+def test_expiry(mock_lapi: MockLapiFactory) -> None:
+    with mock_lapi([API_KEY]) as lapi:
+        _ = lapi.add_decision("1.2.3.4", duration=0.2)
+        assert len(get(lapi, "/v1/decisions/stream", startup="true").json()["new"]) == 1
+        time.sleep(0.3)
+        assert len(get(lapi, "/v1/decisions/stream").json()["deleted"]) == 1
+
+
+def test_decisions(mock_lapi: MockLapiFactory) -> None:
+    with mock_lapi([API_KEY]) as lapi:
+        _ = lapi.add_decision("10.0.0.0/8", scope="Range", type="captcha")
+        assert get(lapi, "/v1/decisions", ip="1.2.3.4").json() is None
+        found = get(lapi, "/v1/decisions", ip="10.1.2.3").json()
+        assert [d["type"] for d in found] == ["captcha"]
+        assert get(lapi, "/v1/decisions", ip="nope").status_code == requests.codes.bad_request
+
+
+def test_scripting(mock_lapi: MockLapiFactory) -> None:
+    with mock_lapi([API_KEY]) as lapi:
+        delay = 0.3
+        lapi.latency["/v1/decisions"] = delay
+        lapi.fail["/v1/decisions/stream"] = requests.codes.internal_server_error
+        start = time.monotonic()
+        assert get(lapi, "/v1/decisions").ok
+        assert time.monotonic() - start >= delay
+        assert get(lapi, "/v1/decisions/stream").status_code == requests.codes.internal_server_error
+
+        metrics = {"remediation_components": [{"type": "test"}]}
+        resp = requests.post(f"{lapi.url}/v1/usage-metrics", json=metrics, headers={"X-Api-Key": API_KEY}, timeout=5)
+        assert resp.status_code == requests.codes.created
+        assert lapi.usage_metrics == [metrics]
+
+
+@pytest.mark.parametrize("use_cert", [True, False])
+def test_tls(mock_lapi: MockLapiFactory, use_cert: bool) -> None:  # noqa: FBT001
+    with mock_lapi([API_KEY], tls=True, bouncer_ou="custom-ou") as lapi:
+        config = lapi.bouncer_config(None if use_cert else API_KEY)
+        cert = (config["cert_path"], config["key_path"]) if use_cert else None
+        headers = {} if use_cert else {"X-Api-Key": API_KEY}
+        resp = requests.get(
+            f"{config['api_url']}v1/decisions/stream",
+            params={"startup": "true"},
+            cert=cert,
+            headers=headers,
+            verify=config["ca_cert_path"],
+            timeout=5,
+        )
+        assert resp.ok
+        assert lapi.request_log[-1].identity == ("cert:bouncer" if use_cert else API_KEY)
+
+
+def test_decision_set(mock_lapi: MockLapiFactory) -> None:
+    size = 5000
+    with mock_lapi([API_KEY]) as lapi:
+        _ = lapi.add_decision("1.2.3.4")
+        lapi.add_decision_set(generate_decisions(size, mix={"ipv4": 1}))
+        stream = get(lapi, "/v1/decisions/stream", startup="true").json()
+        assert len(stream["new"]) == size + 1
+        # already sent
+        assert get(lapi, "/v1/decisions/stream").json() == {"new": [], "deleted": []}
+
+
+def test_body_too_large(mock_lapi: MockLapiFactory) -> None:
+    with mock_lapi([API_KEY]) as lapi:
+        port = int(lapi.url.rsplit(":", 1)[1])
+        with socket.create_connection(("localhost", port), timeout=5) as sock:
+            head = [
+                "POST /v1/usage-metrics HTTP/1.1",
+                "Host: localhost",
+                f"X-Api-Key: {API_KEY}",
+                f"Content-Length: {MAX_BODY + 1}",
+            ]
+            sock.sendall(("\r\n".join(head) + "\r\n\r\n").encode())
+            response = b""
+            while chunk := sock.recv(4096):
+                response += chunk
+        # answered without waiting for the body, and the connection is closed
+        assert response.startswith(b"HTTP/1.1 413 ")
+        assert b"Connection: close" in response
+        assert lapi.usage_metrics == []
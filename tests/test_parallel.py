@@ -0,0 +1,22 @@
+import pytest
+
+from pytest_cs.parallel import run_once
+
+
+def test_run_once(tmp_path_factory: pytest.TempPathFactory) -> None:
+    calls: list[int] = []
+    run_once(tmp_path_factory, "test-once", lambda: calls.append(1))
+    run_once(tmp_path_factory, "test-once", lambda: calls.append(2))
+    assert calls == [1]
+
+
+def test_run_once_failure(tmp_path_factory: pytest.TempPathFactory) -> None:
+    def fail() -> None:
+        msg = "build failed"
+        raise ValueError(msg)
+
+    with pytest.raises(ValueError, match="build failed"):
+        run_once(tmp_path_factory, "test-fail", fail)
+    # the others don't try again
+    with pytest.raises(RuntimeError, match="build failed"):
+        run_once(tmp_path_factory, "test-fail", fail)
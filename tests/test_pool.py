@@ -0,0 +1,55 @@
+import threading
+from typing import Final
+
+from pytest_cs.pool import ContainerPool
+
+
+class FakeContainer:
+    def __init__(self, key: str) -> None:
+        self.key: Final = key
+        self.removed: bool = False
+
+    def remove(self, *, force: bool = False) -> None:
+        assert force
+        self.removed = True
+
+
+class Factory:
+    def __init__(self, key: str) -> None:
+        self.key: Final = key
+        self.created: Final[list[FakeContainer]] = []
+        self.changed: Final = threading.Condition()
+
+    def __call__(self) -> FakeContainer:
+        cont = FakeContainer(self.key)
+        with self.changed:
+            self.created.append(cont)
+            self.changed.notify_all()
+        return cont
+
+    def wait_created(self, n: int) -> None:
+        with self.changed:
+            assert self.changed.wait_for(lambda: len(self.created) >= n, 5)
+
+
+def test_pool() -> None:
+    pool = ContainerPool(1, max_configs=1)
+    a = Factory("a")
+    b = Factory("b")
+
+    # a configuration seen once doesn't fill the pool
+    used: list[object] = []
+    used.append(pool.acquire("a", a))  # pyright:ignore[reportArgumentType]
+    assert len(a.created) == 1
+
+    # the second request does, and the third gets a ready container
+    used.extend([pool.acquire("a", a), pool.acquire("a", a)])  # pyright:ignore[reportArgumentType]
+    assert len({id(c) for c in used}) == len(used)
+    a.wait_created(len(used) + 1)
+
+    # another configuration takes its place, the idle container is removed
+    used.extend([pool.acquire("b", b), pool.acquire("b", b)])  # pyright:ignore[reportArgumentType]
+    pool.close()
+    idle = [c for c in a.created + b.created if all(c is not u for u in used)]
+    assert len([c for c in idle if c.key == "a"]) == 1
+    assert all(c.removed == (c in idle) for c in a.created + b.created)
@@ -0,0 +1,35 @@
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+
+from pytest_cs.docker import required_images
+
+
+class FakeCallSpec:
+    def __init__(self, params: dict[str, Any]) -> None:  # pyright:ignore[reportExplicitAny]
+        self.params: dict[str, Any] = params  # pyright:ignore[reportExplicitAny]
+
+
+class FakeItem:
+    def __init__(self, fixturenames: list[str], params: dict[str, str] | None = None, images: tuple[str, ...] = ()):
+        self.fixturenames: list[str] = fixturenames
+        self.images: tuple[str, ...] = images
+        if params is not None:
+            self.callspec: FakeCallSpec = FakeCallSpec(params)
+
+    def iter_markers(self, name: str) -> Iterator[pytest.Mark]:
+        if name == "docker_image" and self.images:
+            yield pytest.mark.docker_image(*self.images).mark
+
+
+def test_required_images(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CROWDSEC_TEST_VERSION", "dev")
+    monkeypatch.setenv("CROWDSEC_TEST_FLAVORS", "full,slim,debian")
+    items = [
+        FakeItem(["crowdsec", "flavor"], {"flavor": "slim"}),
+        FakeItem(["container"], images=("hello-world",)),
+        FakeItem(["tmp_path"]),
+    ]
+    # debian is not used by any test
+    assert required_images(items) == {"crowdsecurity/crowdsec:dev", "crowdsecurity/crowdsec:dev-slim", "hello-world"}  # pyright:ignore[reportArgumentType]
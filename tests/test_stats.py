@@ -0,0 +1,111 @@
+import http.server
+import json
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any, override
+
+import pytest
+import requests
+
+from pytest_cs.stats import ContainerStatsRecorder, parse_stats
+
+
+def test_parse_stats() -> None:
+    sample = {
+        "cpu_stats": {"cpu_usage": {"total_usage": 300}, "system_cpu_usage": 2000, "online_cpus": 2},
+        "precpu_stats": {"cpu_usage": {"total_usage": 100}, "system_cpu_usage": 1000},
+        "memory_stats": {"usage": 1000, "stats": {"inactive_file": 200}},
+        "blkio_stats": {
+            "io_service_bytes_recursive": [
+                {"major": 8, "minor": 0, "op": "read", "value": 10},
+                {"major": 8, "minor": 0, "op": "write", "value": 20},
+                {"major": 8, "minor": 16, "op": "Read", "value": 1},
+            ]
+        },
+        "networks": {"eth0": {"rx_bytes": 5, "tx_bytes": 6}, "eth1": {"rx_bytes": 1, "tx_bytes": 1}},
+    }
+    assert parse_stats(sample) == {
+        "cpu": 40,
+        "memory": 800,
+        "block_read": 11,
+        "block_write": 20,
+        "net_rx": 6,
+        "net_tx": 7,
+    }
+
+
+def test_parse_stats_first() -> None:
+    # the first sample has no previous one to compute the cpu usage
+    sample = {"cpu_stats": {"cpu_usage": {"total_usage": 300}, "system_cpu_usage": 2000}, "precpu_stats": {}}
+    assert parse_stats(sample) is None
+
+
+SAMPLE = {
+    "cpu_stats": {"cpu_usage": {"total_usage": 300}, "system_cpu_usage": 2000, "online_cpus": 2},
+    "precpu_stats": {"cpu_usage": {"total_usage": 100}, "system_cpu_usage": 1000},
+}
+
+
+class StatsHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version: str = "HTTP/1.1"
+
+    # one sample, then nothing: the recorder is left waiting on the stream
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        data = (json.dumps(SAMPLE) + "\n").encode()
+        _ = self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+        time.sleep(10)
+
+    @override
+    def log_message(self, format: str, *args: Any) -> None:  # pyright:ignore[reportExplicitAny]
+        pass
+
+
+@pytest.fixture
+def stats_url() -> Iterator[str]:
+    server = http.server.ThreadingHTTPServer(("localhost", 0), StatsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class FakeApi(requests.Session):
+    def __init__(self, base_url: str) -> None:
+        super().__init__()
+        self.base_url: str = base_url
+        self.api_version: str = "1.41"
+
+
+class FakeClient:
+    def __init__(self, base_url: str) -> None:
+        self.api: FakeApi = FakeApi(base_url)
+
+
+class FakeContainer:
+    id: str = "fake"
+    short_id: str = "fake"
+    name: str = "fake"
+
+    def __init__(self, base_url: str) -> None:
+        self.client: FakeClient = FakeClient(base_url)
+
+
+def test_recorder_stop(stats_url: str) -> None:
+    recorder = ContainerStatsRecorder(FakeContainer(stats_url))  # pyright:ignore[reportArgumentType]
+    recorder.start()
+    deadline = time.monotonic() + 5
+    while recorder.summary()["samples"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert recorder.summary()["samples"] == 1
+
+    # the stream is closed, not left to the next sample
+    start = time.monotonic()
+    recorder.stop()
+    assert time.monotonic() - start < 1
@@ -0,0 +1,32 @@
+import pathlib
+
+from pytest_cs.lib.tail import FileTail
+
+
+def test_tail(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "out.txt"
+    tail = FileTail(path)
+    assert tail.read() == []
+    _ = path.write_bytes(b"one\ntw")
+    assert tail.read() == ["one"]
+    assert tail.all_lines() == ["one", "tw"]
+    # a multi-byte character split across two writes
+    euro = "€".encode()
+    with path.open("ab") as f:
+        _ = f.write(b"o\r\n" + euro[:1])
+    assert tail.read() == ["two"]
+    with path.open("ab") as f:
+        _ = f.write(euro[1:] + b"\n")
+    assert tail.read() == ["€"]
+    assert tail.lines == ["one", "two", "€"]
+
+
+def test_tail_truncated(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "out.txt"
+    _ = path.write_text("one\ntwo\n")
+    tail = FileTail(path)
+    assert tail.read() == ["one", "two"]
+    _ = path.write_text("new\n")
+    assert tail.read() == ["new"]
+    assert tail.lines == ["new"]
+    assert tail.resets == 1
@@ -0,0 +1,29 @@
+import pytest
+
+from pytest_cs.teardown import TeardownQueue
+
+
+def fail() -> None:
+    msg = "boom"
+    raise RuntimeError(msg)
+
+
+def interrupt() -> None:
+    raise KeyboardInterrupt
+
+
+def test_drain_errors() -> None:
+    queue = TeardownQueue()
+    queue.submit(lambda: None)
+    queue.submit(fail)
+    with pytest.raises(ExceptionGroup) as excinfo:
+        queue.drain()
+    assert [str(e) for e in excinfo.value.exceptions] == ["boom"]
+
+
+def test_drain_interrupt() -> None:
+    queue = TeardownQueue()
+    queue.submit(fail)
+    queue.submit(interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        queue.drain()
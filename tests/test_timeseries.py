@@ -0,0 +1,39 @@
+from pytest_cs.lib.timeseries import TimeSeries
+
+
+def test_timeseries() -> None:
+    s = TimeSeries(["cpu", "rss"])
+    assert s.peak("rss") == 0
+    assert s.rate("cpu") == 0
+    s.append(10, cpu=1, rss=100)
+    s.append(12, cpu=2, rss=300)
+    s.append(14, cpu=5)
+    assert s.to_dict() == {"time": [10, 12, 14], "cpu": [1, 2, 5], "rss": [100, 300, 0]}
+    got = {
+        "len": len(s),
+        "peak": s.peak("rss"),
+        "mean": s.mean("rss"),
+        "growth": s.growth("cpu"),
+        "rate": s.rate("cpu"),
+    }
+    assert got == {"len": 3, "peak": 300, "mean": 400 / 3, "growth": 4, "rate": 1}
+
+
+def test_percentile() -> None:
+    s = TimeSeries(["v"])
+    assert s.percentile("v", 50) == 0
+    for i in range(1, 101):
+        s.append(i, v=i)
+    got = [s.percentile("v", p) for p in (0, 50, 95, 100)]
+    assert got == [1, 50, 95, 100]
+
+
+def test_downsample() -> None:
+    s = TimeSeries(["v"])
+    for i, v in enumerate([1, 5, 2, 2, 7]):
+        s.append(i, v=v)
+    s.downsample()
+    # the samples are averaged, the peak and the ends are exact
+    assert s.to_dict() == {"time": [0, 2, 4], "v": [3, 2, 7]}
+    got = (s.peak("v"), s.first("v"), s.last("v"), s.rate("v"), s.percentile("v", 50))
+    assert got == (7, 1, 7, 1.5, 3)
@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import override
+
+import pytest
+
+from pytest_cs import telemetry
+from pytest_cs.waiters import WaiterGenerator, exponential, fixed, jittered
+
+
+class counter_waiters(WaiterGenerator[int]):
+    @override
+    def context(self) -> int:
+        return self.iteration
+
+
+def count_until(n: int, **kw) -> None:
+    for waiter in counter_waiters(**kw):
+        with waiter as iteration:
+            assert iteration == n
+
+
+def test_schedules() -> None:
+    assert [fixed(0.2)(i) for i in range(3)] == [0.2, 0.2, 0.2]
+    assert [exponential(0.1, 2, 0.5)(i) for i in range(5)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+    step = 0.5
+    for i in range(100):
+        assert step / 2 <= jittered(fixed(step), 0.5)(i) <= step
+
+
+def test_success() -> None:
+    start = time.monotonic()
+    count_until(3, timeout=5, step=0.01)
+    # no sleep after the last iteration
+    assert time.monotonic() - start < 1
+
+
+def test_timeout() -> None:
+    timeout = 0.5
+    start = time.monotonic()
+    with pytest.raises(AssertionError):
+        count_until(-1, timeout=timeout, step=0.1)
+    # the whole budget is used, not half of it
+    assert time.monotonic() - start >= timeout
+
+
+def test_wakeup() -> None:
+    wakeup = threading.Event()
+    threading.Timer(0.1, wakeup.set).start()
+    start = time.monotonic()
+    count_until(1, timeout=5, step=3, wakeup=wakeup)
+    assert time.monotonic() - start < 1
+
+
+def test_telemetry(monkeypatch: pytest.MonkeyPatch) -> None:
+    collector = telemetry.WaiterTelemetry()
+    monkeypatch.setattr(telemetry, "telemetry", collector)
+    monkeypatch.setattr(telemetry, "_enabled", True)
+    for _ in range(2):
+        for waiter in counter_waiters(timeout=5, step=0.01):
+            with waiter as iteration:
+                assert iteration == 0
+    with pytest.raises(AssertionError):
+        count_until(-1, timeout=0.2, step=0.05)
+
+    first, _, timed_out = collector.records
+    assert first.site.startswith("tests/test_waiters.py:")
+    assert first.kind == "counter_waiters"
+    assert first.success
+    assert first.iterations == 1
+    assert not timed_out.success
+    assert timed_out.iterations > 1
+    assert timed_out.budget_used >= 100  # noqa: PLR2004
+
+    # the waiters are grouped by where they are created
+    assert [g.n_waits for g in collector.first_try()] == [2]
+    assert [g.failures for g in collector.over_budget(80)] == [1]